@@ -6,9 +6,13 @@ from datetime import datetime, timedelta
 
 from typing import List, Dict, Union, Optional
 import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
 
 from AgriMindAlpha.Modules.Handlers.DBH import DBHandler
-from AgriMindAlpha.Modules.Handlers.EMH import EmailHandler
 from AgriMindAlpha.Modules.Handlers.LDH import LocalDataHandler
 from Modules.ImageModules.url_generate import get_url
 from Modules.ImageModules.report import construct_structured_data
@@ -16,18 +20,128 @@ import json
 from openai import OpenAI
 from PyQt5.QtCore import QObject, pyqtSignal
 
-client = ZhipuAI(api_key=os.getenv("ZHIPU_API_KEY"))
+from tracing import tracer
+from usage import ledger
+from model_router import router
+from tools import FINISH, FINISH_SPEC, ToolRegistry, tool_executor
+from sql_guard import DDL_TYPES, READ_TYPES, guard_from_env
+from sql_lexer import (created_tables, locking_clause, rename_tables, significant, split_statements, statement_type,
+                       table_refs, tokenize)
+from query_cache import normalize as normalize_sql, query_cache
+from singleflight import fingerprint, flights, normalize_text
+from failover import failover
+from cpu_pool import cpu_pool
+from devices import devices
+import analytics
+from inspection_store import extract_metrics, inspection_store
+from outbox import EmailOutbox, SMTPSender, check_recipients
+from speculation import MISS, Speculator
+from cancellation import CancelToken, Cancelled, registry as cancel_registry
+from checkpoint import CheckpointStore
+from plan_library import DEFAULT_FRUITS, PlanLibrary, extract_slots
+from table_resolver import TableResolver
+from sql_batch import mysql_transaction, plan_batch, run_batch
+from structured_output import (
+    ALARM_SCHEMA, ANALYZE_SCHEMA, EMAIL_SCHEMA, PLAN_SCHEMA, SCHEDULE_SCHEMA,
+    StructuredOutputError, code_blocks, complete_structured, parse_json, validate,
+)
+
+client = ZhipuAI(api_key=os.getenv("ZHIPU_API_KEY"), base_url=os.getenv("ZHIPU_BASE_URL"))
 
 client_Qwen = OpenAI(
     api_key=os.getenv("DASHSCOPE_API_KEY"),
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+    base_url=os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
 )
 
 client_KwooLa = OpenAI(
     api_key=os.getenv("KWOOLA_API_KEY"),
-    base_url="https://api.tgkwai.com/api/v1/qamodel/",
+    base_url=os.getenv("KWOOLA_BASE_URL", "https://api.tgkwai.com/api/v1/qamodel/"),
 )
 
+# 故障转移与对冲：内置三个服务商，额外服务商与各模型的后端列表见 AGENT_FAILOVER_CONFIG
+failover.add_provider("dashscope", client_Qwen)
+failover.add_provider("zhipu", client)
+failover.add_provider("kwoola", client_KwooLa)
+failover.load_config(os.getenv("AGENT_FAILOVER_CONFIG", "failover.json"),
+                     lambda base_url, api_key: OpenAI(api_key=api_key, base_url=base_url))
+
+TOOL_RULES = """【工具类型】
+1. 果蔬分析（需图像识别或质量判断）
+2. 数据库操作（需查询/修改数据库）
+3. 联网搜索（需实时网络信息）
+4. 直接生成（无需上述三类操作）
+5. 信息发送（向用户发送邮件/信息）
+6. 增强检索（需要在本地知识库中检索时）
+7. 深度分析（需要对部分数据进行深度分析）
+8. 设备调用（读取光谱仪等检测设备的实时数据）
+9. 检测统计（历史检测指标的时间趋势与聚合）
+
+【判断规则】
+① 含图像/光谱分析必选1
+② 需数据库交互必选2。
+----凡是涉及到总结等应用数据库数据分析的任务，必须先查询、再分析！
+----涉及到保存数据到表中的操作，必须先使用DESC查询对应表的字段，再进行插入！不允许直接插入！
+③ 需最新网络信息必选3
+④ 仅文本生成时选4
+⑤ 若用户要求发送邮件或信息选5
+————选6时，元任务表述必须包含邮箱地址
+⑥ 有潜在的本地知识库检索需求时，选6
+⑦ 有对果蔬分析结果或用户提供的数据进行深度分析时，选7
+⑧ 元任务为设备调用、需要实时检测数据时选8
+⑨ 询问历史检测结果的变化趋势、一段时间内的统计时优先选9，无需查询数据库
+"""
+
+TASK_RULES = """【元任务类型】
+1. 果蔬分析（需图像识别或质量判断）
+2. 数据库操作（需查询/修改数据库）
+3. 联网搜索（需实时网络信息）
+4. 直接生成（无需上述三类操作）
+5. 定时任务（需要周期性/定时进行的任务）
+6. 信息发送（向用户发送邮件/信息）
+7. 设备调用（调用传感器等质量检测设备）
+8. 增强检索（需要在本地知识库中检索时）
+9. 深度分析（细致分析“果蔬分析”任务检测得到或用户提供的数据）
+
+【判断规则】
+① 含图像/光谱分析必选1
+② 需数据库交互必选2。
+----凡是涉及到总结等应用数据库数据分析的任务，必须先查询、再分析！
+----涉及到保存数据到表中的操作，必须先使用DESC查询对应表的字段，再进行插入！不允许直接插入！
+③ 需最新网络信息必选3
+④ 仅文本生成时选4
+⑤ 涉及到定时或周期性任务选5。注意，此时必须保留间隔时间、总时间等重要信息！无需单独列出每一次！
+⑥ 若用户要求发送邮件或信息选6
+————选6时，元任务表述必须包含邮箱地址
+⑦ 涉及“质量检测”，“使用检测设备”等设备调用指令必选7
+⑧ 有潜在的本地知识库检索需求时，选8
+⑨ 需要对用户提供的数据或“果蔬分析”任务得到的数据进行进一步分析时，选9
+
+【输出格式要求】
+按执行顺序逐行输出，每行格式：
+任务序号-任务名称：简要解释
+注意：
+① 任务序号由任务类型决定，与任务在序列中的顺序无关！
+② 任何任务的最后，都必须有一个总结性的文本生成！
+
+【示例】
+输入：检测苹果并生成市场报告
+输出：
+1-果蔬检测：识别苹果质量
+2-数据库操作：查询苹果价格数据
+3-联网搜索：获取最新市场动态
+4-直接生成：综合数据生成报告
+
+输入：删除过期的苹果数据
+输出：
+2-数据库操作：删除过期苹果记录
+
+输入：每隔50分钟检测一次砂糖橘
+输出：
+5-定时任务：每隔50分钟检测一次砂糖橘
+"""
+
+_BARE_SQL = re.compile(r"\s*(SELECT|INSERT|UPDATE|DELETE|DESC|DESCRIBE|SHOW|CREATE|ALTER|DROP|REPLACE|WITH)\b", re.IGNORECASE)
+
 
 class CoreAgent(QObject):
     output_signal = pyqtSignal(str)
@@ -36,8 +150,17 @@ class CoreAgent(QObject):
         super().__init__()
         self.location = location
         self.dbHandler = DBHandler(db_config)
-        self.emailHandler = EmailHandler(email_config)
+        # 与 EmailHandler 接口一致，但在多次发送间复用 SMTP 连接；邮件经发件箱在后台发送
+        self.emailHandler = SMTPSender(email_config)
+        self.outbox = EmailOutbox(os.getenv("AGENT_OUTBOX_DB", "outbox.db"), self.emailHandler)
+        # 推测执行：规划调用期间为下一个元任务提前做幂等的准备工作；图像分割开销大，单独开启
+        self.speculative = os.getenv("AGENT_SPECULATIVE", "1") != "0"
+        self.speculator = Speculator()
+        # 深度分析前在本地计算表格数据的统计量
+        self.local_analytics = os.getenv("AGENT_LOCAL_ANALYTICS", "1") != "0"
         self.localDataHandler = LocalDataHandler(db_config)
+        self.sqlGuard = guard_from_env()
+        self.tableResolver = TableResolver(os.getenv("AGENT_TABLE_ALIASES", "table_aliases.json"))
         self.history = []
         self.memory = []
         self.scheduler = BlockingScheduler()
@@ -46,45 +169,269 @@ class CoreAgent(QObject):
 
         self.FASTSAM_OUTPUT = "./output/"
         self.FASTSAM_MODEL = "./ImageModules/ImageProcess/model"
+        self.LOCAL_DATA_DIR = "LocalDataBase/Data"
 
         self.debug = True
+        self.fused_planning = True
+        self.native_tools = True
+        self.tools = self._build_tools()
+        self.turn_id = None
+        # 预算与用量按会话归集；GUI 与命令行整个进程为一个会话，HTTP 与批处理按请求传入
+        self.session_id = uuid.uuid4().hex
+        # 协作式取消：轮次开始时替换为新的令牌，步骤之间、大模型调用与数据库执行时检查
+        self.cancel_token = CancelToken()
+        self.turn_timeout_s = float(os.getenv("AGENT_TURN_TIMEOUT", "0")) or None
+        # 检查点：每完成一个元任务持久化一次，可通过 resume(turn_id) 继续
+        self.checkpoints = CheckpointStore(os.getenv("AGENT_CHECKPOINT_DB", "checkpoints.db"))
+        self.checkpoints.prune(float(os.getenv("AGENT_CHECKPOINT_RETENTION_DAYS", "7")) * 86400)
+        # 规划模板库：反复出现的请求形态直接实例化成功执行过的任务链，跳过大模型规划
+        self.plans = PlanLibrary(
+            os.getenv("AGENT_PLAN_LIBRARY_DB", "plans.db"),
+            min_successes=int(os.getenv("AGENT_PLAN_LIBRARY_MIN_SUCCESS", "2")),
+            enabled=os.getenv("AGENT_PLAN_LIBRARY", "1") != "0",
+        )
+        self._plan_source = None
+        self.llm_timeout_s = float(os.getenv("AGENT_LLM_TIMEOUT", "120"))
+        # 同一轮的多个工具调用可能在不同线程中并发执行，用量按各自线程当前的工具记账
+        self._tool_local = threading.local()
+        self._active_tool = None
+
+    @property
+    def _active_tool(self) -> Optional[str]:
+        return getattr(self._tool_local, "name", None)
+
+    @_active_tool.setter
+    def _active_tool(self, name: Optional[str]):
+        self._tool_local.name = name
+
+    @classmethod
+    def from_env(cls):
+        """按 DB_*、EMAIL_*、AGENT_LOCATION 环境变量创建实例，供命令行、HTTP 服务与批处理共用"""
+        db_config = {
+            "host": os.getenv("DB_HOST", "localhost"),
+            "user": os.getenv("DB_USER", "root"),
+            "password": os.getenv("DB_PASSWORD", ""),
+            "database": os.getenv("DB_NAME", "Fruit"),
+            "port": int(os.getenv("DB_PORT", "3306")),
+            "charset": os.getenv("DB_CHARSET", "utf8mb4"),
+            "autocommit": False,
+        }
+        email_config = {
+            "host": os.getenv("EMAIL_HOST", "smtp.163.com"),
+            "port": int(os.getenv("EMAIL_PORT", "465")),
+            "username": os.getenv("EMAIL_USERNAME", "FreshNIR@163.com"),
+            "password": os.getenv("EMAIL_PASSWORD", ""),
+            "use_ssl": bool(int(os.getenv("EMAIL_USE_SSL", "1"))),
+        }
+        return cls(os.getenv("AGENT_LOCATION", "成都市"), db_config, email_config)
+
+    def _llm_create(self, client, **kwargs):
+        # 所有大模型调用的统一出口：预算检查，并记录模型、耗时与 token 用量
+        token = self.cancel_token
+        token.check()
+        requested = kwargs.get("model")
+        model = ledger.admit(requested, turn=self.turn_id, session=self.session_id)
+        kwargs["model"] = model
+        # 单次请求的超时不超过轮次剩余时间；取消时立即返回，被放弃的请求随超时中止
+        remaining = token.remaining()
+        kwargs.setdefault("timeout", self.llm_timeout_s if remaining is None else max(min(self.llm_timeout_s, remaining), 1.0))
+        turn, session, tool = self.turn_id, self.session_id, self._active_tool or "planner"
+
+        def record_abandoned(response, backend):
+            # 落败的对冲请求或取消后才返回的请求同样计费，用量记入发起它的轮次
+            self._record_usage(backend.model, response, turn, session, tool)
+
+        with tracer.span(f"chat {model}", {"gen_ai.request.model": model}) as span:
+            if model != requested:
+                span.set("agent.budget_downgrade_from", requested)
+            if kwargs.get("stream"):
+                (response, backend, hedged), shared = token.run(failover.create, client, cancel=token, **kwargs), False
+            else:
+                # 相同客户端、相同参数的并发请求只发出一次；超时按调用方各自设置，不参与比较
+                key = fingerprint([str(getattr(client, "base_url", id(client))),
+                                   {k: v for k, v in kwargs.items() if k != "timeout"}])
+                (response, backend, hedged), shared = token.run(
+                    flights.do, "llm", key,
+                    lambda: failover.create(client, cancel=token, on_abandoned=record_abandoned, **kwargs))
+            # 故障转移后实际使用的模型可能不同，用量按实际模型记账
+            span.set("agent.llm_backend", backend.key)
+            span.set("agent.hedged", hedged)
+            if shared:
+                # 共享他人的响应，不重复计入 token 用量
+                span.set("agent.singleflight_shared", True)
+            else:
+                self._record_usage(backend.model, response, turn, session, tool, span)
+        return response
+
+    def _record_usage(self, model, response, turn, session, tool, span=None):
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", 0) or 0
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        if span is not None:
+            span.set("gen_ai.usage.input_tokens", prompt_tokens)
+            span.set("gen_ai.usage.output_tokens", completion_tokens)
+            span.set("gen_ai.usage.cached_tokens", cached)
+            span.set("cache.hit", cached > 0)
+        ledger.record(model, prompt_tokens, completion_tokens, cached, turn=turn, session=session, tool=tool)
+
+    def _build_tools(self) -> ToolRegistry:
+        tools = ToolRegistry()
+        tools.register(
+            "analyze", "果蔬分析：需要图像识别或质量判断时调用",
+            {"prompt": {"type": "string", "description": "对于分析需求的概括"}},
+            lambda args: self._fruit_examine(args.get("prompt")),
+            coalesce=lambda args: normalize_text(args.get("prompt")) or None,
+        )
+        tools.register(
+            "query_db", "数据库操作：需要查询或修改数据库时调用",
+            {"sql": {"type": "string", "description": "需求的SQL语句，包裹在 ```sql 代码块中；可有多句（以分号分隔），将在同一事务中依次执行"}},
+            lambda args: self._sql_execute(self._extract_sql(args.get("sql"))),
+            coalesce=self._coalesce_sql,
+        )
+        tools.register(
+            "search", "联网搜索：需要实时网络信息时调用",
+            {"query": {"type": "string", "description": "检索内容"}},
+            # 搜索结果由各自的对话记忆决定（不只取决于 query），不参与合并
+            lambda args: self._apply_online_search(),
+            concurrent=True,
+        )
+        tools.register(
+            "generate", "直接生成：无需其他工具、仅生成文本（如总结报告）时调用",
+            {},
+            lambda args: self._chat(t=4),
+            concurrent=True,
+        )
+        tools.register(
+            "send_message", "信息发送：向用户发送邮件或信息",
+            {
+                "to": {"type": "string", "description": "邮箱或手机号"},
+                "subject": {"type": "string", "description": "邮件主题"},
+                "content": {"type": "string", "description": "消息内容"},
+            },
+            self._tool_send_message,
+            required=["to", "subject"],
+        )
+        tools.register(
+            "enhanced_search", "增强检索：需要在本地知识库中检索时调用",
+            {"query": {"type": "string", "description": "检索内容"}},
+            self._tool_enhanced_search,
+            concurrent=True,
+        )
+        tools.register(
+            "device", "设备调用：读取近红外光谱仪等检测设备最近一段时间的数据（预处理后的均值光谱、噪声与吸收峰）",
+            {
+                "device": {"type": "string", "description": f"设备名，可选：{'、'.join(devices.names()) or '无'}"},
+                "seconds": {"type": "number", "description": "时间窗口（秒），默认 5"},
+                "pipeline": {"type": "string", "enum": ["raw", "sg", "snv", "msc", "sg+snv", "d1", "d2"],
+                             "description": "预处理方式，默认 sg+snv"},
+            },
+            self._tool_device,
+            required=[],
+            concurrent=True,
+        )
+        tools.register(
+            "inspection_stats", "检测统计：查询历史检测指标（如缺陷率）在一段时间内的按时/天/周聚合与趋势，无需查询数据库",
+            {
+                "category": {"type": "string", "description": "果蔬品类，如 砂糖橘；不填为全部品类"},
+                "metric": {"type": "string", "description": "指标名，如 缺陷率；不确定时留空以获取可用指标"},
+                "days": {"type": "number", "description": "最近多少天，默认 30"},
+                "bucket": {"type": "string", "enum": ["hour", "day", "week"], "description": "聚合粒度，默认 day"},
+            },
+            self._tool_inspection_stats,
+            required=[],
+            concurrent=True,
+        )
+        tools.register(
+            "further_analyze", "深度分析：需要对果蔬分析结果或用户提供的数据进行深度分析时调用",
+            {"query": {"type": "string", "description": "需要深度分析的内容"}},
+            lambda args: self._further_analyze(args.get("query")),
+            concurrent=True,
+        )
+        return tools
 
+    @tracer.traced("agent.analyze")
     def analyze(self, pending_str):
+        pending_list = pending_str.split('\n')
+        if not pending_str.strip():
+            return {
+                "response": "任务已结束！",
+                "call": {
+                    "name": "generate",
+                    "arguments": ""
+                },
+                "end": True
+            }
+        if self.native_tools:
+            return self._analyze_native(pending_list[0])
+        return self._analyze_text(pending_list[0])
+
+    def _analyze_native(self, pending: str) -> dict:
+        # 原生函数调用：工具定义通过 tools 参数传入，一次回复可并行给出多个工具调用
         tpl_prompt = f"""
-你是一个智能 Agent，收到用户的最新需求后，请按以下格式输出 JSON，不要多写任何多余内容，也不要写思考过程：
+你是一个智能 Agent，请调用合适的工具完成当前元任务，可在一次回复中同时调用多个互不依赖的工具。
+在回复正文中用一句话告诉用户你将要做什么；当前元任务无需工具时直接回复其内容。
+只有当用户目的已经全部实现、后续任务都不必再执行时，才调用 {FINISH} 结束工作流。
 
-可用工具表：  
-| 工具名           | 应用场景         | 参数规则                                                      |
-| ---------------- | ---------------- | ------------------------------------------------------------- |
-| analyze          | 果蔬分析          | {{"prompt":"<对于分析需求的概括>"}}     |
-| query_db         | 数据库操作        | {{"sql":"<需求的SQL语句（可有多句）>"}} |
-| search           | 联网搜索          | {{"query":"<检索内容>"}}                   |
-| generate         | 直接生成          | <无参数>                                   |
-| send_message     | 信息发送          | {{"to":"<邮箱或手机号>","subject":"<邮件主题>","content":"<消息内容>"}} |
-| enhanced_search  | 增强检索          | {{"query":"<检索内容>"}}             |
-| further_analyze  | 深度分析          | {{"query":"需要深度分析的内容"}}                               |
-
-【工具类型】
-1. 果蔬分析（需图像识别或质量判断）
-2. 数据库操作（需查询/修改数据库）
-3. 联网搜索（需实时网络信息）
-4. 直接生成（无需上述三类操作）
-5. 信息发送（向用户发送邮件/信息）
-6. 增强检索（需要在本地知识库中检索时）
-7. 深度分析（需要对部分数据进行深度分析）
+{TOOL_RULES}
+【用户目的】
+{self.user_target}
 
-【判断规则】
-① 含图像/光谱分析必选1
-② 需数据库交互必选2。
-----凡是涉及到总结等应用数据库数据分析的任务，必须先查询、再分析！
-----涉及到保存数据到表中的操作，必须先使用DESC查询对应表的字段，再进行插入！不允许直接插入！
-③ 需最新网络信息必选3
-④ 仅文本生成时选4
-⑤ 若用户要求发送邮件或信息选5
-————选6时，元任务表述必须包含邮箱地址
-⑥ 有潜在的本地知识库检索需求时，选6
-⑦ 有对果蔬分析结果或用户提供的数据进行深度分析时，选7
+当前元任务是：
+"""
+        decision = router.route("analyze", pending)
+        start = time.perf_counter()
+        tp = self._llm_create(
+            client_Qwen,
+            model=decision.model,
+            messages=[
+                {"role": "system", "content": tpl_prompt},
+                {"role": "user", "content": pending}
+            ],
+            tools=self.tools.specs() + [FINISH_SPEC],
+            tool_choice="auto",
+            parallel_tool_calls=True,
+            stream=False
+        )
+        message = tp.choices[0].message
+        calls, finished = [], False
+        for tool_call in message.tool_calls or []:
+            if tool_call.function.name == FINISH:
+                finished = True
+                continue
+            try:
+                arguments = parse_json(tool_call.function.arguments or "{}")
+            except StructuredOutputError:
+                arguments = {}
+            calls.append({"name": tool_call.function.name, "arguments": arguments})
+        router.record(decision, "ok", (time.perf_counter() - start) * 1000)
 
+        response_text = (message.content or "").strip()
+        self.output_signal.emit(f"## response\n{response_text}")
+        for call in calls:
+            self.output_signal.emit(f"## call\nname: {call['name']}\nargs: {call['arguments']}")
+        # 只回复文本表示当前元任务由回复完成，任务链继续；只有显式的结束信号才提前结束工作流
+        if finished:
+            self.output_signal.emit("## end of workflow")
+
+        return {
+            "response": response_text,
+            "call": calls[0] if calls else {"name": None, "arguments": {}},
+            "calls": calls,
+            "end": finished
+        }
+
+    def _analyze_text(self, pending: str) -> dict:
+        tpl_prompt = f"""
+你是一个智能 Agent，收到用户的最新需求后，请按以下格式输出 JSON，不要多写任何多余内容，也不要写思考过程：
+
+可用工具表：
+{self.tools.prompt_table()}
+
+{TOOL_RULES}
 【用户目的】
 {self.user_target}
 
@@ -105,35 +452,48 @@ class CoreAgent(QObject):
 
 当前用户最新需求是：
 """
-        pending_list = pending_str.split('\n')
-        if not pending_str.strip():
-            return {
-                "response": "任务已结束！",
-                "call": {
-                    "name": "generate",
-                    "arguments": ""
-                },
-                "end": True
-            }
-
-        # 调用 LLM（伪代码）
-        tp = client_Qwen.chat.completions.create(
-            model="qwen-max",
-            messages=[
+        # 调用 LLM：按难度路由模型，输出不合规时升级模型重问一次
+        result = self._structured_completion(
+            router.route("analyze", pending),
+            client_Qwen,
+            [
                 {"role": "system", "content": tpl_prompt},
-                {"role": "user", "content": pending_list[0]}
+                {"role": "user", "content": pending}
             ],
-            stream=False
+            ANALYZE_SCHEMA,
         )
 
-        output = tp.choices[0].message.content.strip()
-        # 解析 JSON
-        try:
-            result = json.loads(output)
-        except json.JSONDecodeError as e:
-            # 如果解析失败，可记录日志并抛出或做默认处理
-            raise ValueError(f"LLM 返回的内容不是合法 JSON：{e}\nRaw output:\n{output}")
+        return self._parse_decision(result)
+
+    def _structured_completion(self, decision, client, messages, schema, max_reasks=1, **kwargs):
+        """
+        结构化输出的统一入口：provider 端 JSON 模式 + 本地修复解析 + Schema 校验，
+        不合规时附上错误原因重问（重问按路由升级模型），最多 max_reasks 次
+        """
+        state = {"decision": decision, "start": 0.0}
+
+        def ask(messages, attempt):
+            if attempt:
+                tracer.set_attribute("agent.structured.reask", attempt)
+                state["decision"] = router.escalate(state["decision"], "invalid_output") or state["decision"]
+            state["start"] = time.perf_counter()
+            tp = self._llm_create(
+                client,
+                model=state["decision"].model,
+                messages=messages,
+                response_format={"type": "json_object"},
+                stream=False,
+                **kwargs
+            )
+            return tp.choices[0].message.content or ""
 
+        def checked(attempt, errors):
+            router.record(state["decision"], "ok" if not errors else "invalid_output",
+                          (time.perf_counter() - state["start"]) * 1000)
+
+        return complete_structured(ask, messages, schema, max_reasks, on_checked=checked)
+
+    def _parse_decision(self, result: dict) -> dict:
         # 提取字段，供上层使用
         response_text = result.get("response", "")
         call_name = result.get("call", {}).get("name")
@@ -146,90 +506,138 @@ class CoreAgent(QObject):
         if is_end:
             self.output_signal.emit("## end of workflow")
 
+        call = {"name": call_name, "arguments": call_args}
         return {
             "response": response_text,
-            "call": {
-                "name": call_name,
-                "arguments": call_args
-            },
+            "call": call,
+            "calls": [call] if call_name else [],
             "end": is_end
         }
 
+    @tracer.traced("agent.query_process")
     def _query_process(self, present_query: str) -> str:
         """
         将用户最新需求拆解为按执行顺序排列的元任务清单
         """
-        tpl_prompt = """
-                请将用户需求拆解为元任务链，按执行顺序输出结构化列表。元任务分类及判断规则：
-
-                【元任务类型】
-                1. 果蔬分析（需图像识别或质量判断）
-                2. 数据库操作（需查询/修改数据库）
-                3. 联网搜索（需实时网络信息）
-                4. 直接生成（无需上述三类操作）
-                5. 定时任务（需要周期性/定时进行的任务）
-                6. 信息发送（向用户发送邮件/信息）
-                7. 设备调用（调用传感器等质量检测设备）
-                8. 增强检索（需要在本地知识库中检索时）
-                9. 深度分析（细致分析“果蔬分析”任务检测得到或用户提供的数据）
-
-                【判断规则】
-                ① 含图像/光谱分析必选1
-                ② 需数据库交互必选2。
-                ----凡是涉及到总结等应用数据库数据分析的任务，必须先查询、再分析！
-                ----涉及到保存数据到表中的操作，必须先使用DESC查询对应表的字段，再进行插入！不允许直接插入！
-                ③ 需最新网络信息必选3
-                ④ 仅文本生成时选4
-                ⑤ 涉及到定时或周期性任务选5。注意，此时必须保留间隔时间、总时间等重要信息！无需单独列出每一次！
-                ⑥ 若用户要求发送邮件或信息选6
-                ————选6时，元任务表述必须包含邮箱地址
-                ⑦ 涉及“质量检测”，“使用检测设备”等设备调用指令必选7
-                ⑧ 有潜在的本地知识库检索需求时，选8
-                ⑨ 需要对用户提供的数据或“果蔬分析”任务得到的数据进行进一步分析时，选9
-
-                【输出格式要求】
-                按执行顺序逐行输出，每行格式：
-                任务序号-任务名称：简要解释
-                注意：
-                ① 任务序号由任务类型决定，与任务在序列中的顺序无关！
-                ② 任何任务的最后，都必须有一个总结性的文本生成！
-
-                【示例】
-                输入：检测苹果并生成市场报告
-                输出：
-                1-果蔬检测：识别苹果质量
-                2-数据库操作：查询苹果价格数据
-                3-联网搜索：获取最新市场动态
-                4-直接生成：综合数据生成报告
-
-                输入：删除过期的苹果数据
-                输出：
-                2-数据库操作：删除过期苹果记录
-
-                输入：每隔50分钟检测一次砂糖橘
-                输出：
-                5-定时任务：每隔50分钟检测一次砂糖橘
-
-
-                避免解释与任何多余的输出，直接回答。当前需解析的用户需求：
-                """
-        tp = client_Qwen.chat.completions.create(
-            model="qwen-max",
+        tpl_prompt = f"""
+请将用户需求拆解为元任务链，按执行顺序输出结构化列表。元任务分类及判断规则：
+
+{TASK_RULES}
+【示例】
+输入：检测苹果并生成市场报告
+输出：
+1-果蔬检测：识别苹果质量
+2-数据库操作：查询苹果价格数据
+3-联网搜索：获取最新市场动态
+4-直接生成：综合数据生成报告
+
+输入：删除过期的苹果数据
+输出：
+2-数据库操作：删除过期苹果记录
+
+输入：每隔50分钟检测一次砂糖橘
+输出：
+5-定时任务：每隔50分钟检测一次砂糖橘
+
+
+避免解释与任何多余的输出，直接回答。当前需解析的用户需求：
+"""
+        decision = router.route("query_process", present_query)
+        while True:
+            start = time.perf_counter()
+            tp = self._llm_create(
+                client_Qwen,
+                model=decision.model,
+                messages=[
+                    {"role": "system", "content": tpl_prompt},
+                    {"role": "user", "content": present_query}
+                ],
+                stream=False
+            )
+
+            # 直接返回模型的原始分解输出；每行须以“任务序号-”开头，否则升级模型重试
+            output = tp.choices[0].message.content.strip()
+            lines = [line for line in output.split('\n') if line.strip()]
+            valid = bool(lines) and all(line.strip()[:1].isdigit() and line.strip()[1:2] == "-" for line in lines)
+            router.record(decision, "ok" if valid else "format_error", (time.perf_counter() - start) * 1000)
+            if valid:
+                break
+            escalated = router.escalate(decision, "format_error")
+            if escalated is None:
+                break
+            decision = escalated
+
+        self.output_signal.emit(f"## TODO\n {output}")
+        return output
+
+    @tracer.traced("agent.plan")
+    def _plan(self, present_query: str) -> Optional[dict]:
+        """
+        融合规划：一次调用同时完成元任务拆解与首个任务的工具选择
+        返回 {"chain": [...], "first": <analyze 格式的调用>}；输出不合规时返回 None，由调用方回退到两次调用的路径
+        """
+        tpl_prompt = f"""
+你是一个智能 Agent 的规划器。请一次性完成两件事，并只输出一个 JSON 对象，不要输出任何解释或思考过程：
+1. 将用户需求拆解为按执行顺序排列的元任务链（chain），每项格式为“任务序号-任务名称：简要解释”
+2. 为元任务链的第一项选择要调用的工具及完整参数（first）
+
+{TASK_RULES}
+可用工具表：
+{self.tools.prompt_table()}
+
+{TOOL_RULES}
+【输出格式】
+{{
+  "chain": ["<任务序号-任务名称：简要解释>", ...],
+  "first": {{
+    "response": "<LLM 要回复给用户的文本>",
+    "call": {{
+      "name": "<chain 第一项要调用的工具名>",
+      "arguments": {{ /* 调用该工具所需的 JSON 参数 */ }}
+    }},
+    "end": <true 或 false>  /* true 表示第一项即为整个 workflow 的最后一步 */
+  }}
+}}
+
+当前需解析的用户需求：
+"""
+        decision = router.route("plan", present_query)
+        start = time.perf_counter()
+        tp = self._llm_create(
+            client_Qwen,
+            model=decision.model,
             messages=[
                 {"role": "system", "content": tpl_prompt},
                 {"role": "user", "content": present_query}
             ],
+            response_format={"type": "json_object"},
             stream=False
         )
+        output = tp.choices[0].message.content or ""
+        try:
+            plan = parse_json(output)
+            errors = validate(plan, PLAN_SCHEMA)
+        except StructuredOutputError as e:
+            errors = [str(e)]
+        if not errors:
+            first_name = plan["first"]["call"].get("name")
+            if first_name and first_name not in self.tools:
+                errors = [f"未知工具：{first_name}"]
+        router.record(decision, "ok" if not errors else "schema_error", (time.perf_counter() - start) * 1000)
+        if errors:
+            if self.debug:
+                print(f"融合规划输出不合规，回退到两步规划：{errors}")
+            tracer.set_attribute("agent.plan.fallback", True)
+            return None
 
-        # 直接返回模型的原始分解输出
-        output = tp.choices[0].message.content.strip()
-        self.output_signal.emit(f"## TODO\n {output}")
-        return output
+        chain = [item.strip() for item in plan["chain"] if item.strip()]
+        self.output_signal.emit(f"## TODO\n {chr(10).join(chain)}")
+        return {"chain": chain, "first": self._parse_decision(plan["first"])}
 
     def _chat(self, t=4, rag_text=None):
         if rag_text is not None:
-            response = client_Qwen.chat.completions.create(
+            response = self._llm_create(
+                client_Qwen,
                 model=self._get_chat_model(t),
                 messages=[
                     {"role": "system", "content": self._get_chat_prompt(t)},
@@ -242,7 +650,8 @@ class CoreAgent(QObject):
                 stream=False
             )
         else:
-            response = client_Qwen.chat.completions.create(
+            response = self._llm_create(
+                client_Qwen,
                 model=self._get_chat_model(t),
                 messages=[
                     {"role": "system", "content": self._get_chat_prompt(t)},
@@ -259,14 +668,35 @@ class CoreAgent(QObject):
         return output
 
     def _further_analyze(self, content, t=5):
-        resp = client_KwooLa.chat.completions.create(
+        # 记忆与需求中的表格数据先在本地完成统计，模型只拿到统计结果与不含表格的上下文
+        context, prompt = self.memory, content
+        if self.local_analytics:
+            texts = [h["content"] for h in self.memory if isinstance(h["content"], str)] + [content or ""]
+            with tracer.span("analytics.local") as span:
+                summaries = analytics.analyze(texts)
+                span.set("analytics.tables", len(summaries))
+            if summaries:
+                self.output_signal.emit(f"## 本地统计：识别到 {len(summaries)} 张数据表")
+                # 只去掉已生成摘要的表格，条目中的说明文字与纯分类表格仍保留在上下文中
+                context = []
+                for h in self.memory:
+                    if isinstance(h["content"], str):
+                        stripped = analytics.strip_tables(h["content"])
+                        if not stripped.strip():
+                            continue
+                        h = dict(h, content=stripped)
+                    context.append(h)
+                prompt = (f"{content}\n\n以下统计结果由程序根据原始数据精确计算，请直接据此分析与解读，不要重新计算：\n"
+                          f"{json.dumps(summaries, ensure_ascii=False)}")
+        resp = self._llm_create(
+            client_KwooLa,
             model=self._get_chat_model(t),
             messages=[
                 *(
                     {"role": h["role"], "content": h["content"]}
-                    for h in self.memory
+                    for h in context
                 ),
-                {"role": "user", "content": content}
+                {"role": "user", "content": prompt}
             ],
             max_tokens=4096,
         )
@@ -280,33 +710,59 @@ class CoreAgent(QObject):
         name          = call.get("name")
         arguments     = call.get("arguments", {})
 
-        if name.startswith("analyze"):
-            report = self._fruit_examine(arguments.get("prompt"))
-        elif name.startswith("query_db"):
-            sql = self._extract_sql(arguments.get("sql"))
-            report = self._sql_execute(sql)
-        elif name.startswith("search"):
-            report = self._apply_online_search()
-        elif name.startswith("generate"):
-            report = self._chat(t=4)
-        elif name.startswith("send_message"):
-            to      = arguments.get("to")
-            subject = arguments.get("subject")
-            self.memory.append({"role": "user", "content": "总结检测结果，汇总为可邮件发送的报告内容。落款为：智农助手 AgriMind"})
-            content = self._chat()
-            self._send_email(to, subject, content)
-            report = f"已成功发送邮件 <{subject}> 至 <{to}>"
-        elif name.startswith("enhanced_search"):
-            report = self._chat(t=4, rag_text=arguments.get("query"))
-        elif name.startswith("further_analyze"):
-            report = self._further_analyze(arguments.get("query"))
-        else:
-            report = "Tool calling 错误"
+        self.cancel_token.check()
+        self._active_tool = name
+        # 结果只取决于参数的只读工具：相同的并发调用合并为一次执行
+        key = self.tools.coalesce_key(name, arguments)
+        with tracer.span(f"tool.{name}", {"tool.name": name}) as span:
+            if key is None:
+                report = self.tools.dispatch(name, arguments)
+            else:
+                report, shared = flights.do("tool", key, lambda: self.tools.dispatch(name, arguments),
+                                            cancel=self.cancel_token)
+                if shared:
+                    span.set("agent.singleflight_shared", True)
+                    self.output_signal.emit(f"## 与进行中的相同请求合并执行：{name}")
+        self._active_tool = None
 
         return report
 
+    def _tool_send_message(self, arguments: dict) -> str:
+        to      = arguments.get("to")
+        subject = arguments.get("subject")
+        # 收件人无效时直接告知模型，不必先生成邮件内容
+        try:
+            check_recipients(self._recipients(to))
+        except ValueError as e:
+            return f"邮件未发送：{e}（需要有效的邮箱地址）"
+        self.memory.append({"role": "user", "content": "总结检测结果，汇总为可邮件发送的报告内容。落款为：智农助手 AgriMind"})
+        content = self._chat()
+        handle = self._send_email(to, subject, content)
+        return f"邮件 <{subject}> 已加入发送队列（投递编号 #{handle}），收件人 <{to}>"
+
+    def _tool_enhanced_search(self, arguments: dict) -> str:
+        query = arguments.get("query") or ""
+        retrieval = self._enhanced_retrieval(query)
+        return self._chat(t=4, rag_text=f"{query}\n\n本地知识库检索结果：\n{retrieval}")
+
+    def _speculate(self, item: Optional[str]):
+        # 按元任务类型（任务链编号前缀）提交推测任务。只推测与调用参数无关的准备工作，
+        # 真实调用的参数由大模型生成，与元任务文本不同，以文本为键的推测永远不会命中
+        if not self.speculative or not item:
+            return
+        kind = item.strip()[:1]
+        if kind == "2":
+            self.speculator.start(("table_names",), self.dbHandler.get_table_names)
+        elif kind == "8" and os.path.exists(self.LOCAL_DATA_DIR):
+            self.speculator.start(("kb_files",), self._local_file_list)
+
+    def _speculated(self, key, compute):
+        result = self.speculator.take(key) if self.speculative else MISS
+        return compute() if result is MISS else result
+
     def _update_query(self):
-        response = client_Qwen.chat.completions.create(
+        response = self._llm_create(
+            client_Qwen,
             model="qwen-max",
             messages=[
                 {"role": "system",
@@ -366,6 +822,7 @@ class CoreAgent(QObject):
 
         return new_chain
 
+    @tracer.traced("agent.dynamic_task_schedule")
     def _dynamic_task_schedule(self, finish, chain):
         tpl_prompt = f"""
 请根据下面的“元任务分类与判断规则”，对“当前任务链”进行动态调整，满足非必要不增加、非必要不保留的高效原则
@@ -394,126 +851,228 @@ class CoreAgent(QObject):
 【当前任务链】  
 {chain}
 
-【元任务类型】
-1. 果蔬分析（需图像识别或质量判断）
-2. 数据库操作（需查询/修改数据库）
-3. 联网搜索（需实时网络信息）
-4. 直接生成（无需上述三类操作）
-5. 定时任务（需要周期性/定时进行的任务）
-6. 信息发送（向用户发送邮件/信息）
-7. 设备调用（调用传感器等质量检测设备）
-8. 增强检索（需要在本地知识库中检索时）
-9. 深度分析（细致分析“果蔬分析”任务检测得到或用户提供的数据）
-
-【判断规则】
-① 含图像/光谱分析必选1
-② 需数据库交互必选2。
-----凡是涉及到总结等应用数据库数据分析的任务，必须先查询、再分析！
-----涉及到保存数据到表中的操作，必须先使用DESC查询对应表的字段，再进行插入！不允许直接插入！
-③ 需最新网络信息必选3
-④ 仅文本生成时选4
-⑤ 涉及到定时或周期性任务选5。注意，此时必须保留间隔时间、总时间等重要信息！无需单独列出每一次！
-⑥ 若用户要求发送邮件或信息选6
-————选6时，元任务表述必须包含邮箱地址
-⑦ 涉及“质量检测”，“使用检测设备”等设备调用指令必选7
-⑧ 有潜在的本地知识库检索需求时，选8
-⑨ 需要对用户提供的数据或“果蔬分析”任务得到的数据进行进一步分析时，选9
-
-【输出格式要求】
-按执行顺序逐行输出，每行格式：
-任务序号-任务名称：简要解释
-注意：
-① 任务序号由任务类型决定，与任务在序列中的顺序无关！
-② 任何任务的最后，都必须有一个总结性的文本生成！
-
-【示例】
-输入：检测苹果并生成市场报告
-输出：
-1-果蔬检测：识别苹果质量
-2-数据库操作：查询苹果价格数据
-3-联网搜索：获取最新市场动态
-4-直接生成：综合数据生成报告
-
-输入：删除过期的苹果数据
-输出：
-2-数据库操作：删除过期苹果记录
-
-输入：每隔50分钟检测一次砂糖橘
-输出：
-5-定时任务：每隔50分钟检测一次砂糖橘
-
-
+{TASK_RULES}
 避免解释与任何多余的输出，直接回答。当前需解析的用户需求：
                         """
-        tp = client_Qwen.chat.completions.create(
-            model="qwen-max",
-            messages=[
+        decision = router.route(
+            "schedule",
+            "\n".join(chain) + "\n" + "\n".join(str(h["content"]) for h in self.memory[-3:]),
+            input_chars=len(tpl_prompt) + sum(len(str(h["content"])) for h in self.memory)
+        )
+        output_json = self._structured_completion(
+            decision,
+            client_Qwen,
+            [
                 {"role": "system", "content": tpl_prompt},
                 *(
                     {"role": h["role"], "content": h["content"]}
                     for h in self.memory
                 ),
             ],
-            stream=False
+            SCHEDULE_SCHEMA,
         )
 
-        # 直接返回模型的原始分解输出
-        output = tp.choices[0].message.content.strip()
-        output_json = json.loads(output)
-
         new_chain = self._apply_adjustments(chain, output_json)
 
         if self.debug:
-            print(output)
+            print(output_json)
             print(new_chain)
 
         self.output_signal.emit(f"## TODO\n {new_chain}")
 
         return new_chain
 
-    def turn(self, user_input, enhanced_retrieval=False):
+    def _begin_turn(self, turn_id=None, deadline_s=None, session_id=None):
+        self.turn_id = turn_id or uuid.uuid4().hex
+        if session_id:
+            self.session_id = session_id
+        self.cancel_token = CancelToken(deadline_s or self.turn_timeout_s)
+        # 上一轮次丢弃的推测任务若仍在执行，等它结束再访问数据库等共享资源
+        self.speculator.drain()
+        cancel_registry.register(self.turn_id, self.cancel_token)
+        tracer.set_attribute("agent.turn_id", self.turn_id)
+
+    def cancel(self, reason="用户取消"):
+        """取消当前轮次：进行中的大模型调用立即返回，剩余步骤不再执行"""
+        self.cancel_token.cancel(reason)
+
+    @tracer.traced("agent.turn")
+    def turn(self, user_input, enhanced_retrieval=False, turn_id=None, deadline_s=None, session_id=None):
+        """
+        返回 {"turn_id", "finished", "reports", "cancelled"}；取消或超时时 finished / reports 为已完成的部分
+        """
         # 1. 记录用户目的
+        self._begin_turn(turn_id, deadline_s, session_id)
+        self._active_tool = None
         self.user_target = user_input
-        todo = self._query_process(self.user_target)
+        self._plan_source = None
+        finish, reports = [], []
+
+        def plan_and_run():
+            chain, first_call = self._plan_from_library(self.user_target), None
+            if chain is None:
+                plan = self._plan(self.user_target) if self.fused_planning else None
+                if plan is not None:
+                    chain = plan["chain"]
+                    first_call = plan["first"]
+                else:
+                    todo = self._query_process(self.user_target)
+                    chain = todo.split('\n')
+                # 轮次成功后按请求骨架学习规划器给出的任务链（不含自动追加的总结任务）
+                self._plan_source["chain"] = [item for item in chain if item.strip()]
+
+            if self.debug: print(chain)
+            self._add_summary_task(chain)
+
+            # 2. 进行用户目的的预拆解
+            self.memory = []
+            self.history.append(
+                {"role": "user", "content": user_input + "\n<请同时启用增强检索>\n" if enhanced_retrieval else user_input})
+            query = chain[0]
+            # 规划结果先落盘，恢复时无需重新规划
+            self._save_checkpoint(chain, query, finish, reports, first_call)
+            self._run_chain(chain, query, finish, first_call, reports)
+
+        return self._run_turn(plan_and_run, finish, reports)
+
+    @tracer.traced("agent.resume")
+    def resume(self, turn_id, deadline_s=None):
+        """从最后一个检查点继续未完成的轮次；已完成的轮次直接返回保存的结果"""
+        record = self.checkpoints.load(turn_id)
+        if record is None:
+            raise KeyError(f"未找到轮次 {turn_id} 的检查点")
+        if record["status"] == "done":
+            return record["result"]
+
+        state = record["state"]
+        # 续跑的用量计入原轮次所属的会话
+        self._begin_turn(turn_id, deadline_s, record["session_id"])
+        self._active_tool = None
+        self.user_target = state["user_target"]
+        self.memory = state["memory"]
+        self.history = state["history"]
+        finish, reports = state["finish"], state["reports"]
+        self.output_signal.emit(f"## 从检查点恢复：已完成 {len(finish)} 项，剩余 {state['chain']}")
+        return self._run_turn(
+            lambda: self._run_chain(state["chain"], state["query"], finish, state["first_call"], reports),
+            finish, reports,
+        )
 
-        if self.debug: print(todo)
-        chain = todo.split('\n')
-        self._add_summary_task(chain)
+    def _run_turn(self, body, finish, reports):
+        status, cancelled = "failed", None
+        try:
+            body()
+            status = "done"
+        except Cancelled as e:
+            status, cancelled = "cancelled", e.reason
+            self.output_signal.emit(f"## ⏹ 任务已中止（{e.reason}），已完成 {len(finish)} 项：{finish}")
+        finally:
+            # 未被取用的推测结果随轮次丢弃；异常退出时检查点标记为 failed，仍可恢复
+            self.speculator.discard()
+            self._active_tool = None
+            cancel_registry.unregister(self.turn_id)
+            self._settle_plan(status)
+            if status != "done":
+                self.checkpoints.mark(self.turn_id, status)
 
-        # 2. 进行用户目的的预拆解
-        self.memory = []
-        self.history.append(
-            {"role": "user", "content": user_input + "\n<请同时启用增强检索>\n" if enhanced_retrieval else user_input})
-        query = chain[0]
-        finish = []
+        if self.debug:
+            print(ledger.totals("turn").get(self.turn_id))
+        self.output_signal.emit("## 任务结束！")
+        result = {"turn_id": self.turn_id, "finished": finish, "reports": reports, "cancelled": cancelled}
+        if status == "done":
+            self.checkpoints.mark(self.turn_id, "done", result)
+        return result
+
+    def _slot_vocabulary(self):
+        # 品类词表补充检测记录中出现过的品类；数据目录名也作为槽位
+        fruits = DEFAULT_FRUITS + tuple(inspection_store.categories())
+        directories = tuple(d for d in os.listdir("data") if len(d) >= 2) if os.path.isdir("data") else ()
+        return fruits, directories
+
+    def _plan_from_library(self, present_query) -> Optional[List[str]]:
+        """在本地匹配规划模板，命中时返回实例化的任务链；未命中返回 None，由规划器规划"""
+        fruits, directories = self._slot_vocabulary()
+        skeleton, slots = extract_slots(present_query, fruits, directories)
+        with tracer.span("agent.plan.library") as span:
+            matched = self.plans.match(skeleton, slots)
+            span.set("plan.library.hit", matched is not None)
+        if matched is None:
+            self._plan_source = {"kind": "planner", "skeleton": skeleton, "slots": slots}
+            return None
+        self._plan_source = {"kind": "template", "skeleton": matched["skeleton"]}
+        tracer.set_attribute("agent.plan.template", matched["skeleton"])
+        if self.debug:
+            print(f"命中规划模板：{matched['skeleton']}")
+        self.output_signal.emit(f"## TODO\n {chr(10).join(matched['chain'])}")
+        return matched["chain"]
+
+    def _settle_plan(self, status):
+        # 规划器给出的链在轮次成功后学习为模板；模板给出的链按轮次结果计分；取消的轮次不计
+        source, self._plan_source = self._plan_source, None
+        if source is None or status == "cancelled":
+            return
+        try:
+            if source["kind"] == "template":
+                self.plans.settle(source["skeleton"], status == "done")
+            elif status == "done" and source.get("chain"):
+                self.plans.learn(source["skeleton"], source["slots"], source["chain"], *self._slot_vocabulary())
+        except sqlite3.Error as e:
+            print(f"规划模板库更新失败：{e}")
+
+    def _save_checkpoint(self, chain, query, finish, reports, first_call=None):
+        state = {
+            "user_target": self.user_target,
+            "chain": chain,
+            "query": query,
+            "finish": finish,
+            "reports": reports,
+            "first_call": first_call,
+            "memory": self.memory,
+            "history": self.history,
+        }
+        self.checkpoints.save(self.turn_id, self.session_id, state, step=len(finish))
 
+    def _run_chain(self, chain, query, finish, first_call=None, reports=None):
+        reports = [] if reports is None else reports
         # 3. 结束参数置为否，进入循环
         is_end = False
         while not is_end:
+            self.cancel_token.check()
             # 3.1 获取本轮的 pending_str，取第一项处理
             pending_str  = query
-            calling_dict = self.analyze(pending_str)
+            if first_call is not None:
+                # 首个任务的工具调用已由融合规划给出，省去一次 analyze 往返
+                calling_dict, first_call = first_call, None
+            else:
+                # analyze 思考期间先行准备当前元任务可能用到的数据
+                self._speculate(pending_str)
+                calling_dict = self.analyze(pending_str)
 
             if self.debug:
                 print(calling_dict)
 
             response = calling_dict.get("response")
             call     = calling_dict.get("call")
+            calls    = calling_dict.get("calls", [call])
             is_end   = calling_dict.get("end")
 
             if self.debug:
                 print(response)
             self.output_signal.emit(response)
 
-            # 3.2 工具效果
-            report = self._use_tools(call)
+            # 3.2 工具效果：同一轮给出的多个互不依赖的工具调用中，可并发的工具同时执行，结果按调用顺序合并；
+            #     未调用工具时以回复本身作为结果
+            tool_reports = self.tools.run_all(calls, tracer.wrap(self._use_tools), tool_executor)
+            report = "\n\n".join(tool_reports) if tool_reports else response
+            reports.append(report)
+            call_record = calls if len(calls) > 1 else call
 
             # 3.3 记忆管理
             self.memory.append({"role": "user", "content": query})
             self.history.append({"role": "assistant", "content": response})
-            self.history.append({"role": "assistant", "content": json.dumps(call)})
+            self.history.append({"role": "assistant", "content": json.dumps(call_record)})
             self.memory.append({"role": "assistant", "content": response})
-            self.memory.append({"role": "assistant", "content": json.dumps(call)})
+            self.memory.append({"role": "assistant", "content": json.dumps(call_record)})
             self._history_check()
             self.history.append({"role": "assistant", "content": report})
             self.memory.append({"role": "assistant", "content": report})
@@ -531,38 +1090,39 @@ class CoreAgent(QObject):
                 query = chain[0]
             else:
                 break
+            # 本步完成后立即落盘：随后的调度是一次大模型调用，期间取消或崩溃不应导致本步在恢复时重跑
+            self._save_checkpoint(chain, query, finish, reports)
 
             if is_end:
                 break
 
-            # 3.5 任务链更新
+            # 3.5 任务链更新：调度期间按当前的下一项先行准备
+            self._speculate(chain[0])
             chain = self._dynamic_task_schedule(finish, chain)
+            self._save_checkpoint(chain, query, finish, reports)
 
-
-        self.output_signal.emit("## 任务结束！")
+    def _local_file_list(self) -> str:
+        # 本地知识库文件清单与检索词无关，可以推测执行
+        self.localDataHandler._check_dir(self.LOCAL_DATA_DIR)
+        try:
+            existed_files = self.localDataHandler._get_existed_files()
+            if existed_files:
+                file_list = ", ".join([item['file_name'] for item in existed_files])
+                return "本地已存在文件：" + file_list + "\n"
+            return "本地数据为空。\n"
+        except Exception as e:
+            return f"检索出错: {e}\n"
 
     def _enhanced_retrieval(self, user_input):
-        data_dir = "LocalDataBase/Data"
-        retrieval_info = ""
-        if os.path.exists(data_dir):
-            self.localDataHandler._check_dir(data_dir)
-            try:
-                existed_files = self.localDataHandler._get_existed_files()
-                if existed_files:
-                    file_list = ", ".join([item['file_name'] for item in existed_files])
-                    retrieval_info += "本地已存在文件：" + file_list + "\n"
-                else:
-                    retrieval_info += "本地数据为空。\n"
-            except Exception as e:
-                retrieval_info += f"检索出错: {e}\n"
-            match_info = self.localDataHandler.search_file_by_keyword(user_input)
-            retrieval_info += f"关键词匹配结果：\n{match_info}"
-        else:
-            retrieval_info = "本地数据目录不存在。"
-        return retrieval_info
+        if not os.path.exists(self.LOCAL_DATA_DIR):
+            return "本地数据目录不存在。"
+        retrieval_info = self._speculated(("kb_files",), self._local_file_list)
+        match_info = self.localDataHandler.search_file_by_keyword(user_input)
+        return retrieval_info + f"关键词匹配结果：\n{match_info}"
 
     def _apply_online_search(self):
-        response = client_Qwen.chat.completions.create(
+        response = self._llm_create(
+            client_Qwen,
             model="qwen-max",
             messages=[
                 {"role": "system",
@@ -579,9 +1139,10 @@ class CoreAgent(QObject):
         return response.choices[0].message.content
 
     def _apply_alarm_task(self, cmd):
-        response = client.chat.completions.create(
-            model="glm-4-plus",
-            messages=[
+        paras = self._structured_completion(
+            router.fixed("alarm", "glm-4-plus"),
+            client,
+            [
                 {
                     "role": "system",
                     "content": """严格按以下规则处理：
@@ -592,10 +1153,8 @@ class CoreAgent(QObject):
                 },
                 {"role": "user", "content": cmd}
             ],
-            response_format={"type": "json_object"}
+            ALARM_SCHEMA,
         )
-
-        paras = json.loads(response.choices[0].message.content)
         self.history.append({"role": "user", "content": paras["cmd"]})
         paras["cmd"] = self.analyze()
         self.history.pop()
@@ -607,7 +1166,7 @@ class CoreAgent(QObject):
             FROM INFORMATION_SCHEMA.TABLES 
             WHERE TABLE_SCHEMA = DATABASE()
         """
-        table_result = self._sql_execute(table_sql, auto=True, form_json=False)
+        table_result = self._sql_execute(table_sql, auto=True, form_json=False, guard=False)
         column_sql = """
             SELECT 
                 TABLE_NAME, 
@@ -617,7 +1176,7 @@ class CoreAgent(QObject):
             FROM INFORMATION_SCHEMA.COLUMNS 
             WHERE TABLE_SCHEMA = DATABASE()
         """
-        column_result = self._sql_execute(column_sql, auto=True, form_json=False)
+        column_result = self._sql_execute(column_sql, auto=True, form_json=False, guard=False)
         schema = {}
         if isinstance(column_result, str):
             return json.loads("{}")
@@ -730,17 +1289,30 @@ class CoreAgent(QObject):
 
 
     def _capture_bluetooth(self, gap=1):
-        data = self.bluetoothHandler.get_bt_response('COM3', 9600, 269)
-        self.bluetoothHandler.disconnect()
-        return data
+        # 设备由后台线程持续采集，这里只取缓冲区中最近 gap 秒的数据
+        return devices.window(seconds=gap, pipeline="raw")
+
+    def _tool_device(self, arguments: dict) -> str:
+        try:
+            result = devices.window(
+                arguments.get("device") or None,
+                seconds=float(arguments.get("seconds") or 5),
+                pipeline=arguments.get("pipeline") or "sg+snv",
+            )
+        except (KeyError, ValueError) as e:
+            return f"设备调用失败：{e}；可用设备：{devices.names()}"
+        if not result.get("frames"):
+            return f"设备 <{result['device']}> 暂无数据（已连接：{result['connected']}，最近错误：{result['last_error']}），请确认设备已开启后重试"
+        return json.dumps(result, ensure_ascii=False)
 
     def _history_check(self):
         if len(self.history) > 10:
             self.history = self.history[:10]
 
-    def _fruit_examine(self, user_input):
-        curr_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        response = client_Qwen.chat.completions.create(
+    def _resolve_fruit_target(self, user_input) -> Dict:
+        # 选择数据目录与提取品类，不产生输出与记忆
+        response = self._llm_create(
+            client_Qwen,
             model="qwen-turbo",
             messages=[
                 {"role": "system",
@@ -749,11 +1321,15 @@ class CoreAgent(QObject):
             ],
             max_tokens=128
         )
-
-        if response.choices[0].message.content.startswith("None"):
-            return "未找到有效目录，请确认目录已创建"
-
-        category = client_Qwen.chat.completions.create(
+        dir_name = response.choices[0].message.content
+        if dir_name.startswith("None"):
+            return {"dir_name": None, "category": None}
+        return {"dir_name": dir_name, "category": self._extract_fruit_category(user_input)}
+
+    def _extract_fruit_category(self, user_input) -> str:
+        # 目录检测与图像检测共用，同一品类写入检测结果存储的同一分区
+        return self._llm_create(
+            client_Qwen,
             model="qwen-plus",
             messages=[
                 {"role": "system",
@@ -761,9 +1337,20 @@ class CoreAgent(QObject):
                 {"role": "user", "content": user_input}
             ],
             max_tokens=128
-        ).choices[0].message.content
+        ).choices[0].message.content.strip()
 
-        dir_name = response.choices[0].message.content
+    def _segment(self, dir_path, category):
+        # FastSAM 分割与报告生成是 CPU 密集任务，配置了 AGENT_CPU_WORKERS 时在独立进程中执行
+        return cpu_pool.run(construct_structured_data, dir_path, category, self.FASTSAM_OUTPUT, self.FASTSAM_MODEL,
+                            cancel=self.cancel_token)
+
+    @tracer.traced("image.pipeline")
+    def _fruit_examine(self, user_input):
+        target = self._resolve_fruit_target(user_input)
+        if target["dir_name"] is None:
+            return "未找到有效目录，请确认目录已创建"
+
+        dir_name, category = target["dir_name"], target["category"]
         self.output_signal.emit(f"## 识别到目录名：{dir_name}")
         self.memory.append({"role": "assistant", "content": f"识别到目录名：{dir_name}"})
         if not os.path.exists("data"):
@@ -771,12 +1358,43 @@ class CoreAgent(QObject):
 
         dir_path = os.path.join("data", dir_name)
         self.output_signal.emit(f"## 检测到{dir_path}文件夹。读取数据进行分析...")
-        response = construct_structured_data(dir_path, category, self.FASTSAM_OUTPUT, self.FASTSAM_MODEL)
+        with tracer.span("image.segmentation", {"image.dir": dir_path, "image.category": category}):
+            response, shared = flights.do(
+                "image", (dir_path, category),
+                lambda: self._segment(dir_path, category),
+                cancel=self.cancel_token,
+            )
+        if not shared:
+            # 合并执行的同一次检测只记录一次
+            self._record_inspection(category, str(response))
         content = f"检测完成，报告如下：\n{response}"
         return content
 
+    def _record_inspection(self, category, report: str):
+        # 检测报告中的数值指标写入本地列式存储，供 inspection_stats 直接做时间范围聚合
+        metrics = extract_metrics(report)
+        if not metrics:
+            return
+        try:
+            inspection_store.append(category or "未分类", metrics)
+        except OSError as e:
+            print(f"检测结果写入本地存储失败：{e}")
+
+    def _tool_inspection_stats(self, arguments: dict) -> str:
+        category = arguments.get("category") or None
+        metric = arguments.get("metric")
+        available = inspection_store.metrics(category)
+        if metric not in available:
+            return json.dumps({"error": f"未记录指标 {metric}" if metric else "请指定指标",
+                               "categories": inspection_store.categories(), "metrics": available},
+                              ensure_ascii=False)
+        bucket = arguments.get("bucket") or "day"
+        result = inspection_store.aggregate(metric, category, days=float(arguments.get("days") or 30),
+                                            bucket=bucket if bucket in ("hour", "day", "week") else "day")
+        return json.dumps(result, ensure_ascii=False)
+
     def _sql_clarity_check(self, sql: str) -> str:
-        valid_tables = self.dbHandler.get_table_names()
+        valid_tables = self._speculated(("table_names",), self.dbHandler.get_table_names)
         self.output_signal.emit("## 检索数据库表名...")
         self.output_signal.emit(f"## 数据库检索到：{valid_tables}")
         if not valid_tables:
@@ -785,39 +1403,43 @@ class CoreAgent(QObject):
 
         used_tables = self._extract_sql_tables(sql)
         self.output_signal.emit(f"## SQL语句检索到：{used_tables}")
-        missing_tables = [t for t in used_tables if t not in valid_tables]
+        # 同一批次中新建的表不参与纠错
+        created = set(created_tables(sql))
+        missing_tables = [t for t in used_tables if t not in valid_tables and t not in created]
 
         if not missing_tables:
             self.output_signal.emit("## SQL通过验证")
             return sql
 
-        corrected_sql = self._glm_correct_sql(sql, valid_tables, missing_tables)
+        # 先在本地按编辑距离/分词/拼音/别名表纠错，只有置信度不足的表名才交给大模型
+        mapping, unresolved = {}, []
+        for name in missing_tables:
+            table, score, method = self.tableResolver.resolve(name, valid_tables)
+            if table is None:
+                unresolved.append(name)
+            else:
+                mapping[name] = table
+                self.output_signal.emit(f"## 表名 {name} → {table}（{method}，{score:.2f}）")
+        if mapping:
+            sql = rename_tables(sql, mapping)
+        if not unresolved:
+            self.output_signal.emit("## SQL语句已修正")
+            return sql
+
+        corrected_sql = self._glm_correct_sql(sql, valid_tables, unresolved)
         final_tables = self._extract_sql_tables(corrected_sql)
         if all(t in valid_tables for t in final_tables):
+            # 只有一个表名被改动时可确定对应关系，记入别名表供下次本地命中
+            introduced = [t for t in final_tables if t not in used_tables and t not in mapping.values()]
+            if len(unresolved) == 1 and len(introduced) == 1:
+                self.tableResolver.learn(unresolved[0], introduced[0])
             self.output_signal.emit("## SQL语句已修正")
             return corrected_sql
         return sql
 
     def _extract_sql_tables(self, sql: str) -> List[str]:
-        import re
-        clean_sql = re.sub(r'--.*?\n|/\*.*?\*/', ' ', sql, flags=re.DOTALL)
-        clean_sql = ' '.join(clean_sql.split()).upper()
-        patterns = [
-            r"(?:DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?|TRUNCATE\s+TABLE\s+|ALTER\s+TABLE\s+)(?:`?(\w+)`?\.)?`?(\w+)`?",
-            r"(?:FROM|JOIN)\s+(?!\(SELECT\b)(?:`?(\w+)`?\.)?`?(\w+)`?",
-        ]
-        tables = []
-        for pattern in patterns:
-            matches = re.findall(pattern, clean_sql, re.IGNORECASE | re.VERBOSE)
-            for match in matches:
-                if len(match) == 2:
-                    schema, table = match[0], match[1]
-                    tables.append(table or schema)
-                else:
-                    for group in match:
-                        if group:
-                            tables.append(group)
-        return list(set(filter(None, tables)))
+        tokens = tokenize(sql)
+        return list(dict.fromkeys(tokens[i].name for i in table_refs(tokens)))
 
     def _glm_correct_sql(self, original_sql: str, valid_tables: List[str], wrong_tables: List[str]) -> str:
         prompt = f"""
@@ -841,28 +1463,81 @@ class CoreAgent(QObject):
         可用表：employees
         输出：SELECT * FROM employees
         """
-        response = client_Qwen.chat.completions.create(
+        response = self._llm_create(
+            client_Qwen,
             model="qwen-coder-plus",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3,
             max_tokens=500
         )
         corrected = response.choices[0].message.content.strip()
-        if corrected.startswith("```sql"):
-            corrected = corrected[6:-3].strip()
-        return corrected
+        blocks = code_blocks(corrected, "sql")
+        return blocks[0] if blocks else corrected
+
+    def _coalesce_sql(self, arguments: dict):
+        # 仅合并全部为只读语句的查询；键为规范化后的语句，与查询缓存的规则一致
+        text = arguments.get("sql") or ""
+        blocks = code_blocks(text, "sql") or ([text] if _BARE_SQL.match(text) else [])
+        statements = [s for b in blocks for s in split_statements(b)]
+        # 加锁读取（FOR UPDATE 等）与 WITH ... DELETE 等写语句不合并
+        if not statements or any(statement_type(s) not in READ_TYPES
+                                 or locking_clause(significant(tokenize(s))) is not None for s in statements):
+            return None
+        normalized = tuple(normalize_sql(s)[0] for s in statements)
+        if not all(normalized):
+            return None
+        return self.dbHandler.db_config.get("database"), normalized
 
     def _extract_sql(self, response_text: str) -> str:
-        import re
-        code_blocks = re.findall(r'```sql(.*?)```', response_text, re.DOTALL)
-        if code_blocks:
-            sql = code_blocks[0].strip()
+        # 优先取 sql / 未标注语言的代码块；模型直接给出裸 SQL 时也接受
+        blocks = code_blocks(response_text or "", "sql")
+        if not blocks and _BARE_SQL.match(response_text or ""):
+            blocks = [response_text.strip()]
+        if blocks:
+            # 多个代码块按顺序拼接为一个批次；保留换行，避免行尾注释吞掉后续语句
+            sql = ";\n".join(b.strip().rstrip(";") for b in blocks)
             sql = self._sql_clarity_check(sql)
-            sql = sql.replace("\n", "")
-            return sql
+            return sql.strip()
         raise ValueError("未找到有效SQL语句")
 
-    def _sql_execute(self, sql: str, params: Optional[Union[List, Dict]] = None, auto=True, form_json=True) -> str:
+    def _sql_execute(self, sql: str, params: Optional[Union[List, Dict]] = None, auto=True, form_json=True,
+                     guard=True) -> str:
+        self.cancel_token.check()
+        statements = split_statements(sql) if params is None else [sql]
+        if len(statements) > 1:
+            return self._sql_execute_batch(statements, auto=auto, form_json=form_json, guard=guard)
+
+        # 执行前检查：拦截危险语句、注入 LIMIT 与超时，超出扫描成本阈值时拒绝或转人工确认
+        estimated_rows = None
+        verdict = None
+        cache_entry = None
+        cache_generation = None
+        if guard:
+            # 先做不含 EXPLAIN 的静态检查，只读语句命中结果缓存时无需访问数据库
+            static = self.sqlGuard.check(sql)
+            if static.allowed and static.read_only and query_cache.enabled:
+                cache_entry = query_cache.key(static.sql, params, self.dbHandler.db_config.get("database"))
+                cached = None
+                if cache_entry is not None:
+                    cache_generation = query_cache.generation(cache_entry[1])
+                    cached = query_cache.get(cache_entry[0])
+                if cached is not None:
+                    with tracer.span("db.execute", {"db.statement": static.sql[:500], "db.cache_hit": True}) as span:
+                        span.set("db.rows", len(cached))
+                    self.output_signal.emit(f"## 命中查询缓存：{cached}")
+                    return self._format_result_as_json(cached) if form_json else cached
+            verdict = self._check_sql(sql)
+            if not verdict.allowed:
+                self.output_signal.emit(f"## ⚠️ 安全校验失败：{verdict.reason}")
+                return f"## ⚠️ 安全校验失败：{verdict.reason}"
+            if verdict.sql != sql:
+                self.output_signal.emit(f"## SQL已改写：{verdict.sql}")
+            sql = verdict.sql
+            estimated_rows = verdict.estimated_rows
+            if verdict.needs_confirm:
+                self.output_signal.emit(f"## ⚠️ {verdict.reason}")
+                auto = False
+
         if not auto:
             check = input("## 请确认操作[y/n]：")
             if check.lower().startswith('y'):
@@ -870,10 +1545,17 @@ class CoreAgent(QObject):
             else:
                 return f"已取消执行！"
 
-        if not self._is_sql_safe(sql):
-            return "## ⚠️ 安全校验失败：禁止执行危险操作"
-
-        result = self.dbHandler.execute(sql, params=params, fetch_all=True)
+        with tracer.span("db.execute", {"db.statement": sql[:500]}) as span:
+            if estimated_rows is not None:
+                span.set("db.estimated_rows", estimated_rows)
+            if cache_entry is not None:
+                span.set("db.cache_hit", False)
+            result = self.dbHandler.execute(sql, params=params, fetch_all=True)
+            span.set("db.rows", len(result) if isinstance(result, list) else result)
+        if cache_entry is not None and isinstance(result, list):
+            query_cache.put(cache_entry[0], result, cache_entry[1], generation=cache_generation)
+        elif verdict is not None and not verdict.read_only and isinstance(result, int):
+            query_cache.invalidate(self._extract_sql_tables(sql))
         self.output_signal.emit(f"## 执行结果：{result}")
         self.output_signal.emit("## 执行完毕！")
 
@@ -885,12 +1567,80 @@ class CoreAgent(QObject):
         else:
             return f"## 操作成功，受影响行数：{result}"
 
+    def _sql_execute_batch(self, statements: List[str], auto=True, form_json=True, guard=True) -> str:
+        # 逐条校验，全部通过后在同一连接、同一事务内执行；连续的同表 INSERT 合并为一次 executemany
+        if guard:
+            checked = []
+            # 批次中前面的 DDL 新建或修改的表在执行前尚不存在或结构不同，引用它们的语句只做静态检查，不 EXPLAIN
+            ddl_tables = set()
+            for i, stmt in enumerate(statements, 1):
+                tables = {t.lower() for t in self._extract_sql_tables(stmt)}
+                if tables & ddl_tables:
+                    verdict = self.sqlGuard.check(stmt, timeout_ms=self._sql_timeout_ms())
+                else:
+                    verdict = self._check_sql(stmt)
+                if verdict.statement_type in DDL_TYPES:
+                    ddl_tables |= tables | {t.lower() for t in created_tables(stmt)}
+                if not verdict.allowed:
+                    self.output_signal.emit(f"## ⚠️ 安全校验失败（第{i}条）：{verdict.reason}")
+                    return f"## ⚠️ 安全校验失败（第{i}条）：{verdict.reason}"
+                if verdict.needs_confirm:
+                    self.output_signal.emit(f"## ⚠️ 第{i}条：{verdict.reason}")
+                    auto = False
+                checked.append(verdict.sql)
+            statements = checked
+
+        if not auto:
+            check = input("## 请确认操作[y/n]：")
+            if check.lower().startswith('y'):
+                self.output_signal.emit("## 开始执行...")
+            else:
+                return f"已取消执行！"
+
+        steps = plan_batch(statements)
+        with tracer.span("db.batch", {"db.statements": len(statements), "db.round_trips": len(steps)}) as span:
+            results, error = run_batch(self._db_transaction, steps, len(statements), cancel=self.cancel_token)
+            if error is not None:
+                span.error = error[1]
+        if error is not None:
+            failed = "、".join(str(i + 1) for i in error[0])
+            self.output_signal.emit(f"## 第{failed}条执行失败，已回滚：{error[1]}")
+            return f"## 批量执行失败（第{failed}条），全部操作已回滚：{error[1]}"
+        written = [stmt for stmt in statements if statement_type(stmt) not in READ_TYPES]
+        if written:
+            query_cache.invalidate(self._extract_sql_tables(";".join(written)))
+
+        reports = []
+        for i, (stmt, result) in enumerate(zip(statements, results), 1):
+            if isinstance(result, list):
+                body = self._format_result_as_json(result) if form_json else str(result)
+            else:
+                body = f"操作成功，受影响行数：{result}"
+            reports.append(f"## 第{i}条：{stmt}\n{body}")
+        self.output_signal.emit(f"## 批量执行完毕：{len(statements)}条语句，{len(steps)}次往返")
+        return "\n".join(reports)
+
+    def _db_transaction(self):
+        # DBHandler 提供事务接口时复用其连接，否则按 db_config 直连 MySQL
+        if hasattr(self.dbHandler, "transaction"):
+            return self.dbHandler.transaction()
+        return mysql_transaction(self.dbHandler.db_config)
+
     def _format_result_as_json(self, result: List[Dict]) -> str:
         import json
         return json.dumps(result, ensure_ascii=False, indent=4)
 
-    def _is_sql_safe(self, sql: str) -> bool:
-        return True
+    def _check_sql(self, sql: str):
+        return self.sqlGuard.check(sql, explain_fn=lambda q: self.dbHandler.execute(q, fetch_all=True),
+                                   timeout_ms=self._sql_timeout_ms())
+
+    def _sql_timeout_ms(self) -> Optional[int]:
+        # 查询超时不超过轮次剩余时间
+        remaining = self.cancel_token.remaining()
+        if remaining is None:
+            return None
+        remaining_ms = max(int(remaining * 1000), 1)
+        return min(self.sqlGuard.timeout_ms, remaining_ms) if self.sqlGuard.timeout_ms else remaining_ms
 
     def _markdown_to_html(self, md_content: str) -> str:
         html_content = markdown.markdown(md_content)
@@ -900,11 +1650,16 @@ class CoreAgent(QObject):
             color: TODO333;
         ">{html_content}</div>"""
 
-    def _send_email(self, to_addr, subject, body):
+    def _send_email(self, to_addr, subject, body) -> int:
+        # 入队即返回投递编号，由发件箱后台线程发送、重试
         from_addr = ("智农助手AgriMind", "FreshNIR@163.com")
         html_content = body.replace('\n', '<br>')
         html_body = self._markdown_to_html(html_content)
-        self.emailHandler.send_email(from_addr, [to_addr], subject, html_body, is_html=True)
+        return self.outbox.enqueue(from_addr, self._recipients(to_addr), subject, html_body, is_html=True)
+
+    @staticmethod
+    def _recipients(to_addr) -> List[str]:
+        return [a for a in re.split(r"[,;，；\s]+", to_addr or "") if a]
 
     def _get_email_content(self, cmd):
         example_content = json.dumps(
@@ -915,9 +1670,10 @@ class CoreAgent(QObject):
             },
             ensure_ascii=False
         )
-        response = client_Qwen.chat.completions.create(
-            model="qwen-max",
-            messages=[
+        json_data = self._structured_completion(
+            router.fixed("email", "qwen-max"),
+            client_Qwen,
+            [
                 {
                     "role": "system",
                     "content": f"""你是一个邮件发送助手。你的指令如下：
@@ -941,18 +1697,31 @@ class CoreAgent(QObject):
                     "content": cmd
                 }
             ],
-            response_format={"type": "json_object"},
+            EMAIL_SCHEMA,
         )
-        json_data = json.loads(response.choices[0].message.content)
         return json_data
 
-    def process_image(self, user_input, image_path):
+    @tracer.traced("agent.process_image")
+    def process_image(self, user_input, image_path, turn_id=None, deadline_s=None, session_id=None):
+        self._begin_turn(turn_id, deadline_s, session_id)
+        self._active_tool = "process_image"
+        try:
+            return self._process_image(user_input, image_path)
+        except Cancelled as e:
+            self.output_signal.emit(f"## ⏹ 任务已中止（{e.reason}）")
+            return None
+        finally:
+            self._active_tool = None
+            cancel_registry.unregister(self.turn_id)
+
+    def _process_image(self, user_input, image_path):
         self.history.append({"role": "user", "content": user_input})
         img_system_prompt = """
         你是专业的果蔬质量检测AI大模型，能够通过图像分析精准识别果蔬表面缺陷、成熟度、规格及品种，并结合多模态数据（如环境参数或用户描述）进行综合评估。
         你将根据用户的输入提供质量报告，包含缺陷定位、保质期预测及处理建议，并确保结果符合农业标准。支持多轮交互与可视化解释。
         """
-        url = get_url(image_path)
+        with tracer.span("image.upload"):
+            url = get_url(image_path)
         if self.enhanced_retrieval:
             retrieval_info = self._enhanced_retrieval(user_input)
             self.output_signal.emit(f"## 增强检索结果：{retrieval_info}")
@@ -966,7 +1735,8 @@ class CoreAgent(QObject):
                 {"type": "image_url", "image_url": {"url": url}}
             ]}
         ]
-        completion = client_Qwen.chat.completions.create(
+        completion = self._llm_create(
+            client_Qwen,
             model="qwen-vl-plus",
             messages=messages,
             extra_headers={"X-DashScope-OssResourceResolve": "enable"}
@@ -974,27 +1744,15 @@ class CoreAgent(QObject):
         answer = completion.choices[0].message.content
         self.output_signal.emit(answer)
         self.history.append({"role": "assistant", "content": answer})
+        # 与目录检测相同的方式提取品类；报告中没有可记录的指标时不必多一次调用
+        if extract_metrics(answer):
+            self._record_inspection(self._extract_fruit_category(user_input), answer)
         return answer
 
 
 if __name__ == '__main__':
-    db_config = {
-        "host": os.getenv("DB_HOST", "localhost"),
-        "user": os.getenv("DB_USER", "root"),
-        "password": os.getenv("DB_PASSWORD", ""),
-        "database": os.getenv("DB_NAME", "Fruit"),
-        "port": int(os.getenv("DB_PORT", "3306")),
-        "charset": os.getenv("DB_CHARSET", "utf8mb4"),
-        "autocommit": False,
-    }
-    email_config = {
-        "host": os.getenv("EMAIL_HOST", "smtp.163.com"),
-        "port": int(os.getenv("EMAIL_PORT", "465")),
-        "username": os.getenv("EMAIL_USERNAME", "FreshNIR@163.com"),
-        "password": os.getenv("EMAIL_PASSWORD", ""),
-        "use_ssl": bool(int(os.getenv("EMAIL_USE_SSL", "1"))),
-    }
-    agent = CoreAgent(os.getenv("AGENT_LOCATION", "成都市"), db_config, email_config)
+    agent = CoreAgent.from_env()
+    devices.start()
     while True:
         user_input = input("==> 用户: ")
         agent.turn(user_input)
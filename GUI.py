@@ -1,12 +1,15 @@
-import sys, os, zipfile, markdown, datetime, uuid, shutil
+import sys, os, zipfile, uuid, shutil
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QTextBrowser, QLineEdit, QPushButton, QAction, QFileDialog,
+    QLineEdit, QPushButton, QAction, QFileDialog,
     QSplitter, QMessageBox, QToolBar, QStyle, QSizePolicy, QLabel
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QObject, QUrl, QSize
-from PyQt5.QtGui import QTextCursor, QDesktopServices, QIcon, QFont, QPixmap
+from PyQt5.QtCore import Qt, QThread, pyqtSignal, QObject, QUrl, QSize, QTimer
+from PyQt5.QtGui import QDesktopServices, QIcon, QFont, QPixmap
 from AgriMind import CoreAgent
+from chat_view import ChatMessage, ChatView
+from devices import devices
+from usage import BudgetExceeded
 
 # ========= 主题常量 ========= #
 LIGHT_STYLE = """
@@ -29,6 +32,12 @@ QPushButton:disabled{ background:#4A4F44; color:#7A7F70; }
 """
 
 # ========= 子线程包装 ========= #
+def budget_notice(e: BudgetExceeded) -> str:
+    # 预算触线不是故障：说明触线的是哪一级预算。GUI 整个进程为一个会话，会话预算用完只能重启
+    if e.scope == "turn":
+        return f"**⚠️ 本轮 token 用量已达上限（{e.used}/{e.limit}）**，请精简需求后重试"
+    return f"**⚠️ 本会话 token 用量已达上限（{e.used}/{e.limit}）**，请重启程序开始新的会话"
+
 class AgentWorker(QThread):
     finished = pyqtSignal()
     aborted  = pyqtSignal()
@@ -40,12 +49,15 @@ class AgentWorker(QThread):
     def run(self):
         try:
             self.agent.turn(self.prompt, enhanced_retrieval=self.enhanced)
+        except BudgetExceeded as e:
+            self.agent.output_signal.emit(budget_notice(e))
         except Exception as e:
             self.agent.output_signal.emit(f"**⛔ 发生错误：** {e}")
         finally:
             self.finished.emit()
     def stop(self):
-        self.terminate()
+        # 协作式取消：进行中的请求尽快返回，线程随轮次结束自然退出，不会中断数据库事务
+        self.agent.cancel("用户停止")
         self.aborted.emit()
 
 class ImageAgentWorker(QThread):
@@ -59,12 +71,15 @@ class ImageAgentWorker(QThread):
     def run(self):
         try:
             self.agent.process_image(self.prompt, self.image_path)
+        except BudgetExceeded as e:
+            self.agent.output_signal.emit(budget_notice(e))
         except Exception as e:
             self.agent.output_signal.emit(f"**⛔ 发生错误：** {e}")
         finally:
             self.finished.emit()
     def stop(self):
-        self.terminate()
+        # 协作式取消：进行中的请求尽快返回，线程随轮次结束自然退出，不会中断数据库事务
+        self.agent.cancel("用户停止")
         self.aborted.emit()
 
 # ========= 主窗口 ========= #
@@ -94,8 +109,7 @@ class MainWindow(QMainWindow):
         left = QWidget()
         lytL = QVBoxLayout(left)
         lytL.setContentsMargins(6,6,6,6)
-        self.chat = QTextBrowser()
-        self.chat.setOpenExternalLinks(True)
+        self.chat = ChatView()
         self.chat.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         lytL.addWidget(self.chat)
 
@@ -146,7 +160,7 @@ class MainWindow(QMainWindow):
         self.btnRetrieval.setCheckable(True)
         self.btnRetrieval.clicked.connect(self.toggle_retrieval)
         btn_clear   = QPushButton("⚡ 清屏")
-        btn_clear.clicked.connect(self.chat.clear)
+        btn_clear.clicked.connect(self.clear_chat)
         for b in (btn_uploadZip, btn_uploadFile, btn_viewData, self.btnRetrieval, btn_clear):
             b.setMinimumHeight(48)
             rLyt.addWidget(b)
@@ -172,18 +186,32 @@ class MainWindow(QMainWindow):
         )
         self.agent = CoreAgent("成都", db_cfg, email_cfg)
         self.agent.enhanced_retrieval = False
-        self.agent.output_signal.connect(lambda text: self.add_message("agent", text))
+        devices.start()
+        # 绑定方法作为槽，工作线程发出的信号排队到主线程；短时间内的多次输出合并为一次刷新
+        self._pending = []
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(int(os.getenv("AGENT_GUI_COALESCE_MS", "50")))
+        self._flush_timer.timeout.connect(self._flush_messages)
+        self.agent.output_signal.connect(self.add_agent_message)
 
         self.show_welcome()
         self.dark = False
         self.setStyleSheet(LIGHT_STYLE)
 
     def show_welcome(self):
-        self.chat.setHtml("""
+        self._welcome = True
+        self.chat.clear()
+        self.chat.append([ChatMessage("welcome", """
         <div style='text-align:center;padding:60px 0;font-size:22px;color:#666'>
             👋 <b>嗨，我是智农助手智能体！</b><br>
             水果检测、市场行情…任何相关问题，随时问我吧~
-        </div>""")
+        </div>""")])
+
+    def clear_chat(self):
+        self._pending = []
+        self._welcome = False
+        self.chat.clear()
 
     def send_msg_shortcut(self):
         if QApplication.keyboardModifiers() == Qt.ControlModifier:
@@ -210,17 +238,24 @@ class MainWindow(QMainWindow):
         self.current_image_path = None
 
     def add_message(self, role, text):
-        if "👋" in self.chat.toPlainText():
-            self.chat.clear()
-        stamp = datetime.datetime.now().strftime("%H:%M")
+        self._pending.append(ChatMessage(role, text))
         if role == "user":
-            md = f"**{stamp}  🧑‍💻 你：**  \n{text}"
-        else:
-            md = f"**{stamp}  🤖 AgriMind：**  \n{text}"
-        html = f"<div style='margin:8px 0'>{markdown.markdown(md)}<br></div>"
-        self.chat.insertHtml(html)
-        self.chat.moveCursor(QTextCursor.End)
-        self.chat.ensureCursorVisible()
+            self._flush_messages()
+        elif not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def add_agent_message(self, text):
+        self.add_message("agent", text)
+
+    def _flush_messages(self):
+        self._flush_timer.stop()
+        if not self._pending:
+            return
+        if self._welcome:
+            self._welcome = False
+            self.chat.clear()
+        batch, self._pending = self._pending, []
+        self.chat.append(batch)
 
     def upload_zip(self):
         path,_ = QFileDialog.getOpenFileName(self,"选择数据集(.zip)","","Zip Files (*.zip)")
@@ -268,6 +303,8 @@ class MainWindow(QMainWindow):
     def toggle_theme(self):
         self.dark = not self.dark
         self.setStyleSheet(DARK_STYLE if self.dark else LIGHT_STYLE)
+        self.chat.delegate.set_text_color("#D4D9C7" if self.dark else "#5D6146")
+        self.chat.viewport().update()
 
 # ------- 工具：打开目录 ------- #
 def _open_dir(folder):
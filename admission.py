@@ -0,0 +1,188 @@
+"""
+准入控制：请求按优先级类别（交互对话、图像批处理、周期任务）排队，限制每类并发数与队列长度，
+队列已满或等待超时时立即以 429 + Retry-After 拒绝；空出的执行槽优先分配给高优先级类别，
+批处理负载激增时交互请求的延迟仍有上界
+"""
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+
+class Rejected(RuntimeError):
+    def __init__(self, name: str, reason: str, retry_after: int, status: int = 429):
+        super().__init__(f"{name} 请求被拒绝：{reason}")
+        self.name = name
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status = status
+
+
+class PriorityClass:
+    """
+    priority:       数值越小越优先
+    max_in_flight:  该类同时执行的上限
+    max_queue:      该类排队的上限，超出立即拒绝
+    max_wait_s:     排队超过该时长后放弃并拒绝
+    """
+
+    def __init__(self, name: str, priority: int, max_in_flight: int, max_queue: int, max_wait_s: float):
+        self.name = name
+        self.priority = priority
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.in_flight = 0
+        self.waiting: deque = deque()
+        self.stats = {"admitted": 0, "rejected_full": 0, "rejected_timeout": 0, "completed": 0}
+        self.waits_ms: deque = deque(maxlen=500)
+        # 服务时长的指数滑动平均，用于估计 Retry-After
+        self.service_s = 1.0
+
+
+class AdmissionController:
+    """reserved: 只留给最高优先级类别的执行槽数，其余类别合计最多占用 slots - reserved 个"""
+
+    def __init__(self, classes: List[PriorityClass], slots: int, reserved: int = 0):
+        self.classes: Dict[str, PriorityClass] = {c.name: c for c in classes}
+        self.slots = slots
+        self.reserved = reserved
+        self.in_flight = 0
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def _admissible(self, cls: PriorityClass, ticket) -> bool:
+        if self.in_flight >= self.slots or cls.in_flight >= cls.max_in_flight:
+            return False
+        if cls.waiting and cls.waiting[0] is not ticket:
+            return False
+        top = min(c.priority for c in self.classes.values())
+        if cls.priority > top:
+            shared = sum(c.in_flight for c in self.classes.values() if c.priority > top)
+            if shared >= self.slots - self.reserved:
+                return False
+        # 更高优先级的类别有可执行的排队请求时让行
+        for other in self.classes.values():
+            if other.priority < cls.priority and other.waiting and other.in_flight < other.max_in_flight:
+                return False
+        return True
+
+    def _retry_after(self, cls: PriorityClass) -> int:
+        backlog = len(cls.waiting) + cls.in_flight
+        return max(1, math.ceil(cls.service_s * backlog / max(cls.max_in_flight, 1)))
+
+    @contextmanager
+    def slot(self, name: str):
+        """获取执行槽，离开时释放；无法在期限内获得时抛出 Rejected"""
+        cls = self.classes[name]
+        ticket = object()
+        enqueued = time.monotonic()
+        with self._cond:
+            if self.closed:
+                raise Rejected(name, "服务正在关闭", self._retry_after(cls), status=503)
+            if not self._admissible(cls, ticket):
+                if len(cls.waiting) >= cls.max_queue:
+                    cls.stats["rejected_full"] += 1
+                    raise Rejected(name, "队列已满", self._retry_after(cls))
+                cls.waiting.append(ticket)
+                deadline = enqueued + cls.max_wait_s
+                try:
+                    while not self._admissible(cls, ticket):
+                        if self.closed:
+                            raise Rejected(name, "服务正在关闭", self._retry_after(cls), status=503)
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            cls.stats["rejected_timeout"] += 1
+                            raise Rejected(name, "排队超时", self._retry_after(cls))
+                        self._cond.wait(remaining)
+                finally:
+                    cls.waiting.remove(ticket)
+                    # 队首离开后，后面的请求可能已可执行
+                    self._cond.notify_all()
+            cls.in_flight += 1
+            self.in_flight += 1
+            cls.stats["admitted"] += 1
+            cls.waits_ms.append((time.monotonic() - enqueued) * 1000)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                cls.in_flight -= 1
+                self.in_flight -= 1
+                cls.stats["completed"] += 1
+                cls.service_s = 0.8 * cls.service_s + 0.2 * (time.monotonic() - started)
+                self._cond.notify_all()
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """停止接纳新请求并拒绝排队中的请求，等待执行中的请求结束；返回是否在超时前全部结束"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self.in_flight == 0, timeout)
+
+    def summary(self) -> Dict:
+        with self._cond:
+            result = {"slots": self.slots, "reserved": self.reserved, "in_flight": self.in_flight,
+                      "closed": self.closed, "classes": {}}
+            for cls in self.classes.values():
+                waits = sorted(cls.waits_ms)
+                result["classes"][cls.name] = dict(
+                    cls.stats,
+                    priority=cls.priority,
+                    in_flight=cls.in_flight,
+                    queued=len(cls.waiting),
+                    wait_p50_ms=round(waits[len(waits) // 2], 1) if waits else 0.0,
+                    wait_p95_ms=round(waits[int(len(waits) * 0.95)], 1) if waits else 0.0,
+                    service_avg_s=round(cls.service_s, 2),
+                )
+            return result
+
+
+class AgentPool:
+    """预先创建的 CoreAgent 实例；每个请求独占一个实例，避免并发轮次共享取消令牌与记忆"""
+
+    def __init__(self, factory: Callable[[], object], size: int):
+        self.agents = [factory() for _ in range(size)]
+        self._idle: "queue.Queue" = queue.Queue()
+        for agent in self.agents:
+            self._idle.put(agent)
+
+    @contextmanager
+    def lease(self):
+        agent = self._idle.get()
+        try:
+            yield agent
+        finally:
+            self._idle.put(agent)
+
+
+def admission_from_env(slots: Optional[int] = None) -> AdmissionController:
+    slots = slots or int(os.getenv("AGENT_POOL_SIZE", "2"))
+
+    def klass(name, priority, in_flight, queue_len, wait_s):
+        prefix = f"AGENT_ADMIT_{name.upper()}_"
+        return PriorityClass(
+            name,
+            priority,
+            max_in_flight=int(os.getenv(prefix + "MAX_IN_FLIGHT", str(in_flight))),
+            max_queue=int(os.getenv(prefix + "MAX_QUEUE", str(queue_len))),
+            max_wait_s=float(os.getenv(prefix + "MAX_WAIT", str(wait_s))),
+        )
+
+    # 交互请求可占满全部执行槽；批处理与周期任务合计至少留出一个给交互请求（只有一个槽时不预留）
+    reserved = int(os.getenv("AGENT_ADMIT_RESERVED", "1" if slots > 1 else "0"))
+    shared = max(slots - reserved, 1)
+    return AdmissionController(
+        [
+            klass("interactive", 0, slots, 32, 30),
+            klass("batch", 1, shared, 64, 120),
+            klass("job", 2, max(shared // 2, 1), 16, 300),
+        ],
+        slots,
+        reserved=min(reserved, slots - 1) if slots > 1 else 0,
+    )
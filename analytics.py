@@ -0,0 +1,251 @@
+"""
+本地统计分析：从工具报告（SQL 查询结果、检测报告中的 JSON 与 Markdown 表格）中识别表格数据，
+用 NumPy 计算描述统计、分位数、分组聚合与趋势，只把计算结果交给大模型解读
+"""
+import json
+import re
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+_DECODER = json.JSONDecoder()
+_JSON_START = re.compile(r"[\[{]")
+_MD_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+_NUMBER = re.compile(r"^[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?\s*%?$")
+_DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d", "%Y/%m/%d %H:%M:%S", "%Y/%m/%d")
+
+MAX_GROUPS = 30
+MIN_ROWS = 2
+
+
+def _records_from_json(value) -> List[List[Dict]]:
+    # 对象数组即一张表；对象中值为对象数组的字段（如报告中的 results）也各算一张表
+    if isinstance(value, list):
+        if len(value) >= MIN_ROWS and all(isinstance(r, dict) for r in value):
+            return [value]
+        return [t for v in value if isinstance(v, (dict, list)) for t in _records_from_json(v)]
+    if isinstance(value, dict):
+        return [t for v in value.values() if isinstance(v, (dict, list)) for t in _records_from_json(v)]
+    return []
+
+
+def _markdown_spans(text: str) -> List[Tuple[int, int, List[Dict]]]:
+    """Markdown 表格及其在文本中的起止位置"""
+    tables = []
+    lines = text.splitlines(keepends=True)
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    i = 0
+    while i < len(lines) - 1:
+        if "|" in lines[i] and _MD_SEPARATOR.match(lines[i + 1]):
+            start = i
+            header = [c.strip() for c in lines[i].strip().strip("|").split("|")]
+            rows = []
+            i += 2
+            while i < len(lines) and "|" in lines[i]:
+                cells = [c.strip() for c in lines[i].strip().strip("|").split("|")]
+                if len(cells) == len(header):
+                    rows.append(dict(zip(header, cells)))
+                i += 1
+            if len(rows) >= MIN_ROWS:
+                tables.append((offsets[start], offsets[i], rows))
+        else:
+            i += 1
+    return tables
+
+
+def _json_spans(text: str) -> Iterator[Tuple[int, int, object]]:
+    pos = 0
+    while True:
+        match = _JSON_START.search(text, pos)
+        if match is None:
+            return
+        try:
+            value, end = _DECODER.raw_decode(text, match.start())
+        except json.JSONDecodeError:
+            pos = match.start() + 1
+            continue
+        yield match.start(), end, value
+        pos = end
+
+
+def json_values(text: str) -> Iterator:
+    """依次解析文本中嵌入的 JSON 数组与对象"""
+    for _, _, value in _json_spans(text):
+        yield value
+
+
+def extract_tables(text: str) -> List[List[Dict]]:
+    """识别文本中的表格数据，返回记录列表的列表"""
+    tables = [t for value in json_values(text) for t in _records_from_json(value)]
+    tables.extend(records for _, _, records in _markdown_spans(text))
+    return tables
+
+
+def strip_tables(text: str) -> str:
+    """
+    去掉文本中会由 analyze 生成统计摘要的表格（含数值列），保留说明文字与只有分类列的表格；
+    一个 JSON 值中只要有一张表不能生成摘要，整个值保留
+    """
+    spans = []
+    for start, end, value in _json_spans(text):
+        tables = _records_from_json(value)
+        if tables and all(Table(t).numeric for t in tables):
+            spans.append((start, end))
+    spans.extend((start, end) for start, end, records in _markdown_spans(text) if Table(records).numeric)
+    kept, pos = [], 0
+    for start, end in sorted(spans):
+        if start >= pos:
+            kept.append(text[pos:start])
+            pos = end
+    kept.append(text[pos:])
+    return "".join(kept)
+
+
+def as_number(value) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str) and _NUMBER.match(value.strip()):
+        return float(value.strip().rstrip("%"))
+    return None
+
+
+def _as_time(value) -> Optional[float]:
+    if not isinstance(value, str):
+        return None
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).timestamp()
+        except ValueError:
+            continue
+    return None
+
+
+class Table:
+    """按列存储：数值列为 float64（缺失为 NaN），时间列为时间戳，其余为分类列"""
+
+    def __init__(self, records: List[Dict]):
+        self.rows = len(records)
+        columns = list(dict.fromkeys(k for r in records for k in r))
+        self.numeric: Dict[str, np.ndarray] = {}
+        self.times: Dict[str, np.ndarray] = {}
+        self.categorical: Dict[str, np.ndarray] = {}
+        for col in columns:
+            raw = [r.get(col) for r in records]
+            present = [v for v in raw if v not in (None, "")]
+            if not present:
+                continue
+            numbers = [as_number(v) for v in raw]
+            if sum(n is not None for n in numbers) >= 0.8 * len(present):
+                self.numeric[col] = np.array([np.nan if n is None else n for n in numbers], dtype=np.float64)
+                continue
+            stamps = [_as_time(v) for v in raw]
+            if sum(s is not None for s in stamps) >= 0.8 * len(present):
+                self.times[col] = np.array([np.nan if s is None else s for s in stamps], dtype=np.float64)
+                continue
+            self.categorical[col] = np.array(["" if v is None else str(v) for v in raw], dtype=object)
+        # 主键/外键与全部缺失的数值列不参与分析
+        for col in [c for c, v in self.numeric.items()
+                    if c.lower() == "id" or c.lower().endswith("_id") or np.all(np.isnan(v))]:
+            del self.numeric[col]
+
+
+def describe(table: Table) -> Dict[str, Dict]:
+    result = {}
+    for col, values in table.numeric.items():
+        v = values[~np.isnan(values)]
+        if not len(v):
+            continue
+        p25, p50, p75, p95 = np.percentile(v, [25, 50, 75, 95])
+        result[col] = {
+            "count": int(len(v)), "sum": _r(v.sum()), "mean": _r(v.mean()), "std": _r(v.std(ddof=1) if len(v) > 1 else 0.0),
+            "min": _r(v.min()), "p25": _r(p25), "median": _r(p50), "p75": _r(p75), "p95": _r(p95), "max": _r(v.max()),
+        }
+    return result
+
+
+def group_by(table: Table) -> Dict[str, Dict]:
+    """对每个取值数在 2..MAX_GROUPS 之间的分类列，按组计算各数值列的计数、均值、总和与极值"""
+    result = {}
+    for key, labels in table.categorical.items():
+        groups, inverse = np.unique(labels, return_inverse=True)
+        if not 2 <= len(groups) <= MAX_GROUPS or len(groups) == table.rows:
+            continue
+        per_group = {str(g): {} for g in groups}
+        for col, values in table.numeric.items():
+            mask = ~np.isnan(values)
+            counts = np.bincount(inverse[mask], minlength=len(groups))
+            sums = np.bincount(inverse[mask], weights=values[mask], minlength=len(groups))
+            mins = np.full(len(groups), np.inf)
+            maxs = np.full(len(groups), -np.inf)
+            np.minimum.at(mins, inverse[mask], values[mask])
+            np.maximum.at(maxs, inverse[mask], values[mask])
+            for i, g in enumerate(groups):
+                if counts[i]:
+                    per_group[str(g)][col] = {"count": int(counts[i]), "mean": _r(sums[i] / counts[i]),
+                                              "sum": _r(sums[i]), "min": _r(mins[i]), "max": _r(maxs[i])}
+        if any(per_group.values()):
+            result[key] = per_group
+    return result
+
+
+def trend(table: Table) -> Dict[str, Dict]:
+    """数值列随时间（无时间列时按行序）的线性趋势：斜率、首末变化与相关系数"""
+    if table.times:
+        axis_name, axis = next(iter(table.times.items()))
+        unit, scale = "per_day", 86400.0
+    else:
+        axis_name, axis = "row", np.arange(table.rows, dtype=np.float64)
+        unit, scale = "per_row", 1.0
+    result = {}
+    for col, values in table.numeric.items():
+        mask = ~np.isnan(values) & ~np.isnan(axis)
+        if mask.sum() < 3:
+            continue
+        x = (axis[mask] - axis[mask].min()) / scale
+        y = values[mask]
+        order = np.argsort(x, kind="stable")
+        x, y = x[order], y[order]
+        if np.ptp(x) == 0:
+            continue
+        slope, _ = np.polyfit(x, y, 1)
+        corr = np.corrcoef(x, y)[0, 1] if np.std(y) > 0 else 0.0
+        first, last = y[0], y[-1]
+        result[col] = {
+            "axis": axis_name, f"slope_{unit}": _r(slope), "first": _r(first), "last": _r(last),
+            "change_pct": _r((last - first) / abs(first) * 100) if first else None, "r": _r(corr),
+        }
+    return result
+
+
+def _r(value, digits=4):
+    return None if value is None or not np.isfinite(value) else round(float(value), digits)
+
+
+def analyze(texts: Iterable[str]) -> List[Dict]:
+    """对所有文本中识别出的表格逐一计算统计摘要"""
+    summaries = []
+    seen = set()
+    for text in texts:
+        if not isinstance(text, str):
+            continue
+        for records in extract_tables(text):
+            signature = json.dumps(records, ensure_ascii=False, sort_keys=True, default=str)
+            if signature in seen:
+                continue
+            seen.add(signature)
+            table = Table(records)
+            if not table.numeric:
+                continue
+            summaries.append({
+                "rows": table.rows,
+                "columns": {"numeric": list(table.numeric), "time": list(table.times), "categorical": list(table.categorical)},
+                "describe": describe(table),
+                "group_by": group_by(table),
+                "trend": trend(table),
+            })
+    return summaries
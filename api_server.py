@@ -2,36 +2,75 @@
 import os
 import tempfile
 import logging
+import threading
+import uuid
 from flask import Flask, request, jsonify
 
 from AgriMind import CoreAgent
+from tracing import tracer
+from usage import BudgetExceeded, ledger
+from model_router import router
+from query_cache import query_cache
+from cancellation import registry as cancel_registry
+from admission import AgentPool, Rejected, admission_from_env
+from singleflight import flights
+from failover import failover
+from cpu_pool import cpu_pool
+from devices import devices
 
 app = Flask(__name__)
 logging.basicConfig(format='[%(levelname)s] %(message)s', level=logging.INFO)
 
 
-def create_agent():
-    db_config = {
-        "host": os.getenv("DB_HOST", "localhost"),
-        "user": os.getenv("DB_USER", "root"),
-        "password": os.getenv("DB_PASSWORD", ""),
-        "database": os.getenv("DB_NAME", "Fruit"),
-        "port": int(os.getenv("DB_PORT", "3306")),
-        "charset": os.getenv("DB_CHARSET", "utf8mb4"),
-        "autocommit": False,
-    }
-    email_config = {
-        "host": os.getenv("EMAIL_HOST", "smtp.163.com"),
-        "port": int(os.getenv("EMAIL_PORT", "465")),
-        "username": os.getenv("EMAIL_USERNAME", "FreshNIR@163.com"),
-        "password": os.getenv("EMAIL_PASSWORD", ""),
-        "use_ssl": bool(int(os.getenv("EMAIL_USE_SSL", "1"))),
-    }
-    location = os.getenv("AGENT_LOCATION", "成都市")
-    return CoreAgent(location, db_config, email_config)
+# 每个请求独占一个智能体实例；执行槽数与实例数一致，由准入控制按优先级分配。
+# 导入本模块不创建智能体也不打开设备，由 startup() 在服务进程中完成
+pool = None
+admission = None
+# 不执行轮次的查询接口（检查点、发件箱）共享底层存储，任取一个实例即可
+agent = None
+_startup_lock = threading.Lock()
 
 
-agent = create_agent()
+def startup():
+    """创建智能体池与准入控制并启动设备采集；可重复调用，只执行一次"""
+    global pool, admission, agent
+    with _startup_lock:
+        if pool is not None:
+            return
+        new_pool = AgentPool(CoreAgent.from_env, int(os.getenv("AGENT_POOL_SIZE", "2")))
+        admission = admission_from_env(len(new_pool.agents))
+        agent = new_pool.agents[0]
+        devices.start()
+        pool = new_pool
+
+
+@app.before_request
+def ensure_started():
+    # 未经 serve.py 的生命周期启动（如其他 WSGI 服务器）时，在首个请求前启动
+    if pool is None:
+        startup()
+
+
+@app.errorhandler(Rejected)
+def handle_rejected(e):
+    response = jsonify({'error': str(e), 'class': e.name, 'retry_after': e.retry_after})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+@app.errorhandler(BudgetExceeded)
+def handle_budget_exceeded(e):
+    # 各接口未单独处理时的兜底：预算超限一律返回 429
+    return jsonify({'error': str(e), 'scope': e.scope}), 429
+
+
+def session_of(data):
+    """
+    会话由客户端通过 session_id 字段或 X-Session-Id 请求头指定；未指定时按客户端地址归为一个会话，
+    否则每个请求自成一个会话，会话预算就与轮次预算相同、形同虚设
+    """
+    return data.get('session_id') or request.headers.get('X-Session-Id') or f"client:{request.remote_addr}"
 
 
 @app.route('/api/chat', methods=['POST'])
@@ -41,15 +80,25 @@ def api_chat():
     enhanced = data.get('enhanced', False)
     if not user_input:
         return jsonify({'error': 'user_input required'}), 400
+    # 客户端可自带 turn_id，以便在请求进行中调用 /api/cancel/<turn_id>；timeout_s 为本轮截止时间
+    turn_id = data.get('turn_id') or uuid.uuid4().hex
+    session_id = session_of(data)
     outputs = []
 
     def collect(msg):
         outputs.append(msg)
 
-    agent.output_signal.connect(collect)
-    agent.turn(user_input, enhanced_retrieval=enhanced)
-    agent.output_signal.disconnect(collect)
-    return jsonify({'outputs': outputs})
+    with admission.slot('interactive'), pool.lease() as agent:
+        agent.output_signal.connect(collect)
+        try:
+            result = agent.turn(user_input, enhanced_retrieval=enhanced, turn_id=turn_id,
+                                deadline_s=data.get('timeout_s'), session_id=session_id)
+        except BudgetExceeded as e:
+            return jsonify({'error': str(e), 'outputs': outputs, 'turn_id': turn_id, 'session_id': session_id}), 429
+        finally:
+            agent.output_signal.disconnect(collect)
+    return jsonify({'outputs': outputs, 'turn_id': turn_id, 'session_id': session_id,
+                    'cancelled': result['cancelled']})
 
 
 @app.route('/api/image', methods=['POST'])
@@ -69,14 +118,115 @@ def api_image():
     def collect(msg):
         outputs.append(msg)
 
-    agent.output_signal.connect(collect)
-    agent.set_enhanced_retrieval(enhanced)
-    agent.process_image(prompt, path)
-    agent.output_signal.disconnect(collect)
+    turn_id = request.form.get('turn_id') or uuid.uuid4().hex
+    session_id = session_of(request.form)
+    timeout_s = request.form.get('timeout_s', type=float)
+
+    try:
+        with admission.slot('batch'), pool.lease() as agent:
+            agent.output_signal.connect(collect)
+            agent.enhanced_retrieval = enhanced
+            try:
+                agent.process_image(prompt, path, turn_id=turn_id, deadline_s=timeout_s, session_id=session_id)
+            except BudgetExceeded as e:
+                return jsonify({'error': str(e), 'outputs': outputs, 'turn_id': turn_id,
+                                'session_id': session_id}), 429
+            finally:
+                agent.output_signal.disconnect(collect)
+    finally:
+        os.remove(path)
+    return jsonify({'outputs': outputs, 'turn_id': turn_id, 'session_id': session_id})
+
+
+@app.route('/api/resume/<turn_id>', methods=['POST'])
+def api_resume(turn_id):
+    data = request.get_json(silent=True) or {}
+    outputs = []
+
+    def collect(msg):
+        outputs.append(msg)
+
+    with admission.slot('job'), pool.lease() as agent:
+        agent.output_signal.connect(collect)
+        try:
+            result = agent.resume(turn_id, deadline_s=data.get('timeout_s'))
+        except KeyError as e:
+            return jsonify({'error': str(e)}), 404
+        except BudgetExceeded as e:
+            return jsonify({'error': str(e), 'outputs': outputs, 'turn_id': turn_id}), 429
+        finally:
+            agent.output_signal.disconnect(collect)
+    return jsonify({'outputs': outputs, 'turn_id': turn_id, 'cancelled': result['cancelled'],
+                    'reports': result['reports']})
+
+
+@app.route('/api/checkpoints', methods=['GET'])
+def api_checkpoints():
+    return jsonify({'resumable': agent.checkpoints.resumable(request.args.get('limit', 50, type=int))})
+
+
+@app.route('/api/cancel/<turn_id>', methods=['POST'])
+def api_cancel(turn_id):
+    if not cancel_registry.cancel(turn_id, reason='客户端取消'):
+        return jsonify({'error': 'turn not found'}), 404
+    return jsonify({'turn_id': turn_id, 'cancelled': True})
+
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    return jsonify({
+        'spans': tracer.summary(),
+        'usage': ledger.summary(),
+        'routing': router.summary(),
+        'sql_cache': query_cache.summary(),
+        'outbox': agent.outbox.summary(),
+        'speculation': [a.speculator.summary() for a in pool.agents],
+        'admission': admission.summary(),
+        'singleflight': flights.summary(),
+        'failover': failover.summary(),
+        'plan_library': agent.plans.summary(),
+        'cpu_pool': cpu_pool.summary(),
+        'devices': devices.summary(),
+    })
+
+
+@app.route('/api/outbox/<int:handle>', methods=['GET'])
+def api_outbox(handle):
+    status = agent.outbox.status(handle)
+    if status is None:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(status)
+
+
+@app.route('/api/usage', methods=['GET'])
+def api_usage():
+    by = request.args.get('by', 'model')
+    try:
+        return jsonify({'by': by, 'totals': ledger.totals(by)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+def shutdown(grace_s=None):
+    """
+    优雅关闭：停止接纳新请求，等待执行中的轮次结束，超过 grace_s 后协作取消剩余轮次；
+    随后发出发件箱中已到期的邮件并关闭 CPU 进程池
+    """
+    grace_s = float(os.getenv('AGENT_SHUTDOWN_GRACE', '30')) if grace_s is None else grace_s
+    if pool is None:
+        cpu_pool.shutdown(wait=True)
+        return
+    if not admission.close(grace_s):
+        for turn_id in cancel_registry.active():
+            cancel_registry.cancel(turn_id, reason='服务关闭')
+        admission.close(10)
+    for a in pool.agents:
+        a.outbox.flush(5)
+        a.outbox.close()
+    cpu_pool.shutdown(wait=True)
+    devices.stop()
 
-    os.remove(path)
-    return jsonify({'outputs': outputs})
 
 if __name__ == '__main__':
+    startup()
     app.run(host='127.0.0.1', port=8000)
 
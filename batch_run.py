@@ -0,0 +1,319 @@
+"""
+批处理入口：读取 JSONL 任务文件（每行一个对话指令或图像检测任务），在智能体池中并发执行，
+结果逐行追加写入输出 JSONL。中断后以相同参数重新运行即可继续：已写出结果的任务跳过，
+执行到一半的对话轮次从检查点恢复。
+
+    python batch_run.py tasks.jsonl --out results.jsonl --concurrency 4
+
+任务行格式：
+    {"id": "q1", "prompt": "统计本周入库的苹果数量并生成报告", "enhanced": true}
+    {"id": "img-7", "image": "data/apple_07.jpg", "prompt": "检测苹果表面缺陷", "timeout_s": 300}
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Set
+
+from AgriMind import CoreAgent
+from admission import AgentPool
+from cancellation import registry as cancel_registry
+from cpu_pool import cpu_pool
+from devices import devices
+from singleflight import flights
+from tracing import _percentile, tracer
+from usage import ledger
+
+
+def read_tasks(path: str) -> Iterator[Dict]:
+    """逐行读取任务；无法解析的行也产出一项，由执行阶段记为错误"""
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                task = json.loads(line)
+                if not isinstance(task, dict):
+                    raise ValueError("任务行须为 JSON 对象")
+            except ValueError as e:
+                yield {"id": f"line-{lineno}", "_error": f"第 {lineno} 行格式错误：{e}"}
+                continue
+            task["id"] = str(task.get("id") or f"line-{lineno}")
+            yield task
+
+
+def read_results(path: str) -> Dict[str, str]:
+    """已写出的结果：id -> 最后一次的状态；进程崩溃时写了一半的末行忽略"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    # 末行可能截断在多字节字符中间，解码失败的字节替换后该行照常按格式错误忽略
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "id" in record:
+                done[str(record["id"])] = record.get("status")
+    return done
+
+
+class ResultWriter:
+    """结果逐行追加并落盘，中断时已完成的结果不会丢失"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # 上次运行被强行终止时末行可能不完整，另起一行写入；按字节检查，末尾可能是半个多字节字符
+        with open(path, "ab+") as f:
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class BatchStats:
+    def __init__(self, total: int, skipped: int):
+        self.total = total
+        self.skipped = skipped
+        self.started = time.monotonic()
+        self.latencies: List[float] = []
+        self.status: Dict[str, int] = {}
+        self.resumed = 0
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict):
+        with self._lock:
+            self.latencies.append(record["elapsed_s"])
+            self.status[record["status"]] = self.status.get(record["status"], 0) + 1
+            self.resumed += bool(record.get("resumed"))
+
+    def summary(self) -> Dict:
+        with self._lock:
+            latencies = list(self.latencies)
+            status = dict(self.status)
+            resumed = self.resumed
+        elapsed = time.monotonic() - self.started
+        completed = len(latencies)
+        return {
+            "total": self.total,
+            "skipped": self.skipped,
+            "completed": completed,
+            "status": status,
+            "resumed": resumed,
+            "wall_s": round(elapsed, 2),
+            "items_per_min": round(completed / elapsed * 60, 2) if elapsed > 0 else 0.0,
+            "latency_s": {
+                "p50": round(_percentile(latencies, 0.50), 2),
+                "p95": round(_percentile(latencies, 0.95), 2),
+                "max": round(max(latencies), 2) if latencies else 0.0,
+            },
+        }
+
+    def progress_line(self) -> str:
+        s = self.summary()
+        status = " ".join(f"{k}={v}" for k, v in sorted(s["status"].items()))
+        return (f"[batch] {s['completed']}/{s['total'] - s['skipped']} {status} "
+                f"{s['items_per_min']} 项/分钟 p50={s['latency_s']['p50']}s p95={s['latency_s']['p95']}s")
+
+
+class BatchRunner:
+    def __init__(self, pool: AgentPool, writer: ResultWriter, stats: BatchStats, run_id: str,
+                 enhanced=False, timeout_s: Optional[float] = None):
+        self.pool = pool
+        self.writer = writer
+        self.stats = stats
+        self.run_id = run_id
+        self.enhanced = enhanced
+        self.timeout_s = timeout_s
+        self.stopping = threading.Event()
+        self._active: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def turn_id(self, task_id: str) -> str:
+        # 同一批次、同一任务的 turn_id 固定，重新运行时据此找到检查点
+        return f"batch-{self.run_id}-{task_id}"
+
+    def run_task(self, task: Dict):
+        if self.stopping.is_set():
+            return
+        turn_id = self.turn_id(task["id"])
+        record = {"id": task["id"], "kind": "image" if task.get("image") else "chat", "turn_id": turn_id}
+        outputs = []
+        collect = outputs.append
+        started = time.monotonic()
+        with self._lock:
+            self._active.add(turn_id)
+        try:
+            # 每项任务在工作线程中自成一条 trace（含等待空闲 Agent 的时间），轮次的各阶段是它的子 span
+            with tracer.span("batch.task", {"batch.run_id": self.run_id, "batch.task_id": task["id"]}) as span, \
+                    self.pool.lease() as agent:
+                agent.output_signal.connect(collect)
+                try:
+                    record.update(self._execute(agent, task, turn_id))
+                except Exception as e:
+                    # 单项失败只记录到结果中，不影响其他任务
+                    record.update(status="error", error=f"{type(e).__name__}: {e}")
+                finally:
+                    agent.output_signal.disconnect(collect)
+                span.set("batch.status", record.get("status"))
+        finally:
+            with self._lock:
+                self._active.discard(turn_id)
+        # 因中断而取消的任务不写结果，下次运行时从检查点继续
+        if record.get("status") == "cancelled" and self.stopping.is_set():
+            return
+        record.update(outputs=outputs, elapsed_s=round(time.monotonic() - started, 3), finished_at=time.time())
+        self.writer.write(record)
+        self.stats.add(record)
+
+    def _execute(self, agent: CoreAgent, task: Dict, turn_id: str) -> Dict:
+        if task.get("_error"):
+            raise ValueError(task["_error"])
+        # 每项任务从干净的会话状态开始，前一项的对话历史不会进入下一项的上下文
+        agent.history = []
+        agent.memory = []
+        agent.user_target = "暂无"
+        agent.enhanced_retrieval = bool(task.get("enhanced", self.enhanced))
+        deadline_s = task.get("timeout_s") or self.timeout_s
+        prompt = task.get("prompt") or ""
+        # 各任务的用量与会话预算分别计算，任务行可用 session_id 把若干项归入同一会话
+        session_id = task.get("session_id") or turn_id
+
+        if task.get("image"):
+            if not os.path.isfile(task["image"]):
+                raise FileNotFoundError(f"图像不存在：{task['image']}")
+            answer = agent.process_image(prompt, task["image"], turn_id=turn_id, deadline_s=deadline_s,
+                                         session_id=session_id)
+            if answer is None:
+                return {"status": "cancelled", "cancelled": agent.cancel_token.reason}
+            return {"status": "ok", "reports": [answer]}
+
+        if not prompt:
+            raise ValueError("任务缺少 prompt 或 image")
+        checkpoint = agent.checkpoints.load(turn_id)
+        if checkpoint is not None:
+            result = agent.resume(turn_id, deadline_s=deadline_s)
+        else:
+            result = agent.turn(prompt, enhanced_retrieval=agent.enhanced_retrieval, turn_id=turn_id,
+                                deadline_s=deadline_s, session_id=session_id)
+        return {
+            "status": "cancelled" if result.get("cancelled") else "ok",
+            "resumed": checkpoint is not None,
+            "cancelled": result.get("cancelled"),
+            "finished": result.get("finished"),
+            "reports": result.get("reports"),
+        }
+
+    def interrupt(self, reason="批处理中断"):
+        self.stopping.set()
+        with self._lock:
+            active = list(self._active)
+        for turn_id in active:
+            cancel_registry.cancel(turn_id, reason=reason)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="AgriMind 批处理：JSONL 任务并发执行，结果流式写出，可中断续跑")
+    parser.add_argument("tasks", help="任务文件（JSONL）")
+    parser.add_argument("--out", default=None, help="结果文件（JSONL），默认为 <任务文件名>.results.jsonl")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("AGENT_BATCH_CONCURRENCY", "4")),
+                        help="并发执行的任务数（即智能体实例数）")
+    parser.add_argument("--timeout", type=float, default=None, help="单项任务的默认截止时间（秒）")
+    parser.add_argument("--enhanced", action="store_true", help="默认启用增强检索")
+    parser.add_argument("--retry-failed", action="store_true", help="重新执行结果为 error / cancelled 的任务")
+    parser.add_argument("--run-id", default=None, help="批次标识，用于生成固定的 turn_id；默认由结果文件路径得出")
+    parser.add_argument("--progress", type=float, default=10.0, help="进度输出间隔（秒），0 为不输出")
+    parser.add_argument("--debug", action="store_true", help="输出智能体的调试信息")
+    args = parser.parse_args(argv)
+
+    out = args.out or os.path.splitext(args.tasks)[0] + ".results.jsonl"
+    run_id = args.run_id or hashlib.sha1(os.path.abspath(out).encode("utf-8")).hexdigest()[:10]
+    previous = read_results(out)
+    skip = {i for i, status in previous.items() if status == "ok" or not args.retry_failed}
+
+    tasks, seen = [], set()
+    for task in read_tasks(args.tasks):
+        if task["id"] in seen:
+            print(f"[batch] 任务 id 重复：{task['id']}", file=sys.stderr)
+            return 2
+        seen.add(task["id"])
+        if task["id"] not in skip:
+            tasks.append(task)
+    skipped = len(seen) - len(tasks)
+    print(f"[batch] 共 {len(seen)} 项，跳过已完成 {skipped} 项，待执行 {len(tasks)} 项 -> {out}", file=sys.stderr)
+    if not tasks:
+        return 0
+
+    concurrency = max(1, min(args.concurrency, len(tasks)))
+    pool = AgentPool(CoreAgent.from_env, concurrency)
+    for agent in pool.agents:
+        agent.debug = args.debug
+    devices.start()
+    writer = ResultWriter(out)
+    stats = BatchStats(len(seen), skipped)
+    runner = BatchRunner(pool, writer, stats, run_id, enhanced=args.enhanced, timeout_s=args.timeout)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    pending = set()
+    next_report = time.monotonic() + args.progress
+    interrupted = False
+    try:
+        it = iter(tasks)
+        # 提交数保持在并发度的两倍以内，大文件不会一次性创建全部 future
+        while True:
+            while len(pending) < concurrency * 2:
+                task = next(it, None)
+                if task is None:
+                    break
+                pending.add(executor.submit(runner.run_task, task))
+            if not pending:
+                break
+            finished, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in finished:
+                future.result()
+            if args.progress and time.monotonic() >= next_report:
+                print(stats.progress_line(), file=sys.stderr)
+                next_report = time.monotonic() + args.progress
+    except KeyboardInterrupt:
+        interrupted = True
+        print("[batch] 收到中断，正在取消进行中的任务；重新运行相同命令即可继续", file=sys.stderr)
+        runner.interrupt()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        writer.close()
+        for agent in pool.agents:
+            agent.outbox.flush(5)
+            agent.outbox.close()
+        cpu_pool.shutdown(wait=True)
+        devices.stop()
+
+    summary = stats.summary()
+    summary.update(interrupted=interrupted, out=out, usage=ledger.summary()["total"],
+                   singleflight=flights.summary())
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if interrupted:
+        return 130
+    return 1 if summary["status"].get("error") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+本地 OpenAI 兼容模拟服务：按录制规则回放响应，并模拟首 token 延迟与生成速度
+DashScope / 智谱 / KwooLa 客户端均指向该服务即可离线运行 Agent
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+def estimate_tokens(text: str) -> int:
+    # 粗略估算：中文约 1.5 字/token，英文约 4 字符/token，取折中
+    return max(1, len(text) // 2)
+
+
+def _message_text(message: Dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content)
+
+
+class Recording:
+    """
+    单条录制规则，字段：
+      model / system_contains / user_contains: 匹配条件（均为可选，全部满足才命中）
+      content: 回放的文本；tool_calls: 回放的工具调用列表
+      latency_ms: 覆盖默认首 token 延迟；usage: 覆盖估算的 token 用量
+    """
+
+    def __init__(self, spec: Dict):
+        self.spec = spec
+
+    def matches(self, model: str, system: str, user: str, tool_names: List[str]) -> bool:
+        spec = self.spec
+        if spec.get("model") and spec["model"] != model:
+            return False
+        if spec.get("system_contains") and spec["system_contains"] not in system:
+            return False
+        if spec.get("user_contains") and spec["user_contains"] not in user:
+            return False
+        if "tools" in spec and bool(spec["tools"]) != bool(tool_names):
+            return False
+        return True
+
+
+class MockLLMState:
+    def __init__(self, recordings: List[Dict], ttft_ms=300.0, tokens_per_s=60.0, jitter=0.1,
+                 model_latency_ms: Optional[Dict[str, float]] = None, seed=0):
+        self.recordings = [Recording(r) for r in recordings]
+        self.ttft_ms = ttft_ms
+        self.tokens_per_s = tokens_per_s
+        self.jitter = jitter
+        self.model_latency_ms = model_latency_ms or {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.unmatched = 0
+            self.by_model: Dict[str, Dict[str, int]] = {}
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "unmatched": self.unmatched,
+                "by_model": {m: dict(v) for m, v in self.by_model.items()},
+            }
+
+    def complete(self, body: Dict) -> Dict:
+        model = body.get("model", "")
+        messages = body.get("messages", [])
+        system = "\n".join(_message_text(m) for m in messages if m.get("role") == "system")
+        users = [_message_text(m) for m in messages if m.get("role") == "user"]
+        user = users[-1] if users else ""
+        tool_names = [t.get("function", {}).get("name") for t in body.get("tools") or []]
+
+        recording = next((r for r in self.recordings if r.matches(model, system, user, tool_names)), None)
+        spec = recording.spec if recording else {"content": "（模拟响应）"}
+        content = spec.get("content")
+        tool_calls = spec.get("tool_calls")
+
+        prompt_text = "".join(_message_text(m) for m in messages)
+        usage = dict(spec.get("usage") or {})
+        usage.setdefault("prompt_tokens", estimate_tokens(prompt_text))
+        usage.setdefault("completion_tokens", estimate_tokens((content or "") + json.dumps(tool_calls or "")))
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        usage.setdefault("prompt_tokens_details", {"cached_tokens": 0})
+
+        with self._lock:
+            self.calls += 1
+            if recording is None:
+                self.unmatched += 1
+            stats = self.by_model.setdefault(model, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            stats["calls"] += 1
+            stats["prompt_tokens"] += usage["prompt_tokens"]
+            stats["completion_tokens"] += usage["completion_tokens"]
+            noise = 1.0 + self._rng.uniform(-self.jitter, self.jitter)
+
+        ttft = spec.get("latency_ms", self.model_latency_ms.get(model, self.ttft_ms))
+        gen = usage["completion_tokens"] / self.tokens_per_s * 1000 if self.tokens_per_s else 0.0
+        time.sleep(max(0.0, (ttft + gen) * noise) / 1000)
+
+        message = {"role": "assistant", "content": content}
+        if tool_calls:
+            message["tool_calls"] = [
+                {
+                    "id": f"call_{i}",
+                    "type": "function",
+                    "function": {
+                        "name": c["name"],
+                        "arguments": json.dumps(c.get("arguments", {}), ensure_ascii=False),
+                    },
+                }
+                for i, c in enumerate(tool_calls)
+            ]
+        return {
+            "id": f"chatcmpl-mock-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop",
+            }],
+            "usage": usage,
+        }
+
+
+def _make_handler(state: MockLLMState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, code: int, payload: Dict):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                self._send(200, state.snapshot())
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(200, state.complete(body))
+            elif self.path.rstrip("/").endswith("/reset"):
+                state.reset()
+                self._send(200, {"ok": True})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class MockLLMServer:
+    def __init__(self, state: MockLLMState, host="127.0.0.1", port=0):
+        self.state = state
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(state))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="AgriMind 离线模拟大模型服务")
+    parser.add_argument("--recordings", default=os.path.join(os.path.dirname(__file__), "recordings.json"))
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-s", type=float, default=60.0)
+    args = parser.parse_args()
+
+    with open(args.recordings, encoding="utf-8") as f:
+        recordings = json.load(f)
+    server = MockLLMServer(MockLLMState(recordings, args.ttft_ms, args.tokens_per_s), port=args.port).start()
+    print(f"模拟服务已启动：{server.base_url}")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,275 @@
+"""
+AgriMind 离线基准测试：启动模拟大模型服务、SQLite 数据库替身与合成图像集，
+按不同并发度驱动 turn / process_image 工作负载，输出吞吐、延迟分位数、大模型调用次数与 token 用量
+
+用法：
+    python -m bench.run_bench --concurrency 1,4,8 --iterations 24 --out bench_results.json
+    python -m bench.run_bench --baseline bench_results.json   # 与历史结果对比，退化时返回非零
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench.mock_llm_server import MockLLMServer, MockLLMState
+from bench.standins import NullEmailHandler, SQLiteDBHandler, StubLocalDataHandler, install_stub_modules
+from bench.synthetic_data import generate_dataset
+
+SCHEMA_VERSION = 1
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def _local_data_url(image_path: str) -> str:
+    # 替代 OSS 上传：直接内联为 data URL
+    with open(image_path, "rb") as f:
+        return "data:image/png;base64," + base64.b64encode(f.read()).decode("ascii")
+
+
+def _stub_vision(latency_ms_per_image: float):
+    def construct_structured_data(dir_path, category, output_dir, model_dir):
+        images = [f for f in os.listdir(dir_path) if f.lower().endswith((".png", ".jpg", ".bmp"))]
+        time.sleep(latency_ms_per_image * len(images) / 1000)
+        rows = "\n".join(f"| {name} | {category} | {(i * 7) % 20}% |" for i, name in enumerate(images))
+        return f"| 图像 | 品类 | 缺陷率 |\n| --- | --- | --- |\n{rows}"
+    return construct_structured_data
+
+
+def build_workload(scenarios: List[Dict], iterations: int) -> List[Dict]:
+    # 按权重确定性地轮转生成请求序列，保证多次运行可比
+    expanded = [s for s in scenarios for _ in range(max(1, int(s.get("weight", 1))))]
+    return [expanded[i % len(expanded)] for i in range(iterations)]
+
+
+def prepare_environment(args, server: MockLLMServer):
+    os.environ.update({
+        "DASHSCOPE_BASE_URL": server.base_url,
+        "ZHIPU_BASE_URL": server.base_url,
+        "KWOOLA_BASE_URL": server.base_url,
+        "DASHSCOPE_API_KEY": "mock",
+        "ZHIPU_API_KEY": "mock.mock",
+        "KWOOLA_API_KEY": "mock",
+    })
+    os.chdir(args.workdir)
+    generate_dataset("data", images_per_category=args.images_per_category)
+
+    # 未安装的 GUI、调度、智谱与 FastSAM 依赖先注册替身，否则 import AgriMind 直接失败
+    install_stub_modules(real_vision=args.vision_latency_ms is None)
+    import AgriMind
+    AgriMind.DBHandler = lambda cfg: SQLiteDBHandler(cfg, latency_ms=args.db_latency_ms)
+    AgriMind.SMTPSender = lambda cfg: NullEmailHandler(cfg, latency_ms=args.email_latency_ms)
+    AgriMind.LocalDataHandler = StubLocalDataHandler
+    AgriMind.get_url = _local_data_url
+    if args.vision_latency_ms is not None:
+        AgriMind.construct_structured_data = _stub_vision(args.vision_latency_ms)
+    return AgriMind
+
+
+def make_agent(module):
+    db_config = {"host": "bench", "user": "bench", "password": "", "database": "Fruit", "port": 0}
+    email_config = {"host": "bench", "port": 0, "username": "bench@example.com", "password": "", "use_ssl": False}
+    agent = module.CoreAgent("成都市", db_config, email_config)
+    agent.debug = False
+    agent.enhanced_retrieval = False
+    return agent
+
+
+def run_level(module, state: MockLLMState, workload: List[Dict], concurrency: int) -> Dict:
+    from tracing import tracer
+    from query_cache import query_cache
+
+    state.reset()
+    tracer.reset()
+    query_cache.reset()
+    local = threading.local()
+    latencies: Dict[str, List[float]] = {}
+    errors: List[str] = []
+    lock = threading.Lock()
+
+    def run_one(item: Dict):
+        if not hasattr(local, "agent"):
+            local.agent = make_agent(module)
+        start = time.perf_counter()
+        try:
+            if item["kind"] == "process_image":
+                local.agent.process_image(item["input"], os.path.abspath(item["image"]))
+            else:
+                local.agent.turn(item["input"])
+            ok = True
+        except Exception as e:
+            ok = False
+            with lock:
+                errors.append(f"{item['name']}: {type(e).__name__}: {e}")
+        elapsed = (time.perf_counter() - start) * 1000
+        if ok:
+            with lock:
+                latencies.setdefault(item["name"], []).append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run_one, workload))
+    duration = time.perf_counter() - start
+
+    llm = state.snapshot()
+    all_latencies = [v for values in latencies.values() for v in values]
+    completed = len(all_latencies)
+    total_tokens = sum(m["prompt_tokens"] + m["completion_tokens"] for m in llm["by_model"].values())
+
+    def latency_stats(values: List[float]) -> Dict:
+        return {
+            "count": len(values),
+            "mean_ms": round(statistics.fmean(values), 2) if values else 0.0,
+            "p50_ms": round(_percentile(values, 0.5), 2),
+            "p99_ms": round(_percentile(values, 0.99), 2),
+            "max_ms": round(max(values), 2) if values else 0.0,
+        }
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(workload),
+        "completed": completed,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(completed / duration, 3) if duration else 0.0,
+        "latency": latency_stats(all_latencies),
+        "by_scenario": {name: latency_stats(values) for name, values in sorted(latencies.items())},
+        "llm": {
+            "calls": llm["calls"],
+            "unmatched": llm["unmatched"],
+            "calls_per_request": round(llm["calls"] / completed, 2) if completed else 0.0,
+            "tokens_per_request": round(total_tokens / completed, 1) if completed else 0.0,
+            "by_model": dict(sorted(llm["by_model"].items())),
+        },
+        "stages": dict(sorted(tracer.summary().items())),
+    }
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions = []
+    old_runs = {r["concurrency"]: r for r in baseline.get("runs", [])}
+    for run in report["runs"]:
+        old = old_runs.get(run["concurrency"])
+        if old is None:
+            continue
+        checks = [
+            ("p50_ms", old["latency"]["p50_ms"], run["latency"]["p50_ms"], True),
+            ("p99_ms", old["latency"]["p99_ms"], run["latency"]["p99_ms"], True),
+            ("throughput_rps", old["throughput_rps"], run["throughput_rps"], False),
+            ("tokens_per_request", old["llm"]["tokens_per_request"], run["llm"]["tokens_per_request"], True),
+            ("calls_per_request", old["llm"]["calls_per_request"], run["llm"]["calls_per_request"], True),
+        ]
+        for metric, before, after, lower_is_better in checks:
+            if not before:
+                continue
+            change = (after - before) / before
+            print(f"  c={run['concurrency']:<3} {metric:<20} {before:>10} -> {after:<10} ({change:+.1%})")
+            worse = change > tolerance if lower_is_better else change < -tolerance
+            if worse:
+                regressions.append(f"c={run['concurrency']} {metric} {change:+.1%}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="AgriMind 离线基准测试")
+    parser.add_argument("--scenarios", default=os.path.join(BENCH_DIR, "scenarios.json"))
+    parser.add_argument("--recordings", default=os.path.join(BENCH_DIR, "recordings.json"))
+    parser.add_argument("--concurrency", default="1,4,8", help="逗号分隔的并发度列表")
+    parser.add_argument("--iterations", type=int, default=24, help="每个并发度下的请求数")
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="模拟首 token 延迟")
+    parser.add_argument("--tokens-per-s", type=float, default=60.0, help="模拟生成速度")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--db-latency-ms", type=float, default=2.0)
+    parser.add_argument("--email-latency-ms", type=float, default=200.0)
+    parser.add_argument("--vision-latency-ms", type=float, default=50.0,
+                        help="每张图的模拟分割耗时；传负数则使用真实 FastSAM 流水线")
+    parser.add_argument("--images-per-category", type=int, default=8)
+    parser.add_argument("--workdir", default=None, help="运行目录（默认临时目录）")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="用于回归对比的历史结果")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="允许的退化比例")
+    args = parser.parse_args(argv)
+    if args.vision_latency_ms is not None and args.vision_latency_ms < 0:
+        args.vision_latency_ms = None
+    for name in ("scenarios", "recordings", "out", "baseline"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    args.workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="agrimind-bench-"))
+    os.makedirs(args.workdir, exist_ok=True)
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    with open(args.recordings, encoding="utf-8") as f:
+        recordings = json.load(f)
+    with open(args.scenarios, encoding="utf-8") as f:
+        scenarios = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    state = MockLLMState(recordings, ttft_ms=args.ttft_ms, tokens_per_s=args.tokens_per_s, jitter=args.jitter)
+    server = MockLLMServer(state).start()
+    try:
+        module = prepare_environment(args, server)
+        workload = build_workload(scenarios, args.iterations)
+        levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+        runs = []
+        for c in levels:
+            run = run_level(module, state, workload, c)
+            runs.append(run)
+            print(f"c={c:<3} 吞吐 {run['throughput_rps']:.2f} req/s  "
+                  f"p50 {run['latency']['p50_ms']:.0f} ms  p99 {run['latency']['p99_ms']:.0f} ms  "
+                  f"LLM {run['llm']['calls_per_request']} 次/请求  {run['llm']['tokens_per_request']} tokens/请求  "
+                  f"错误 {run['errors']}")
+    finally:
+        server.stop()
+
+    report = {
+        "schema_version": SCHEMA_VERSION,
+        "config": {
+            "iterations": args.iterations,
+            "ttft_ms": args.ttft_ms,
+            "tokens_per_s": args.tokens_per_s,
+            "jitter": args.jitter,
+            "db_latency_ms": args.db_latency_ms,
+            "email_latency_ms": args.email_latency_ms,
+            "vision_latency_ms": args.vision_latency_ms,
+            "scenarios": [s["name"] for s in scenarios],
+        },
+        "runs": runs,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"结果已写入 {args.out}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("性能退化：" + "；".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""
+基准测试用的进程内替身：以 SQLite 代替 MySQL 的 DBHandler，以及不发信的邮件、知识库处理器
+接口与 AgriMindAlpha.Modules.Handlers 中的同名方法保持一致；以及 import AgriMind 之前注册的依赖模块替身
+"""
+import importlib.util
+import re
+import sqlite3
+import sys
+import threading
+import time
+import types
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Union
+
+SEED_SQL = """
+CREATE TABLE IF NOT EXISTS fruit_price (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fruit VARCHAR(32),
+    price REAL,
+    market VARCHAR(64),
+    record_date DATE
+);
+CREATE TABLE IF NOT EXISTS inspection_record (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fruit VARCHAR(32),
+    grade VARCHAR(8),
+    defect_rate REAL,
+    inspect_time DATETIME
+);
+"""
+
+
+def _seed_rows(conn: sqlite3.Connection, rows_per_fruit: int):
+    fruits = ["苹果", "砂糖橘", "香蕉", "草莓"]
+    prices = []
+    records = []
+    for i in range(rows_per_fruit):
+        for j, fruit in enumerate(fruits):
+            prices.append((fruit, 3.0 + j + (i % 7) * 0.1, "成都农产品中心", f"2026-09-{i % 28 + 1:02d}"))
+            records.append((fruit, "ABC"[i % 3], (i * 7 + j) % 20 / 100, f"2026-09-{i % 28 + 1:02d} 10:00:00"))
+    conn.executemany("INSERT INTO fruit_price (fruit, price, market, record_date) VALUES (?, ?, ?, ?)", prices)
+    conn.executemany("INSERT INTO inspection_record (fruit, grade, defect_rate, inspect_time) VALUES (?, ?, ?, ?)", records)
+    conn.commit()
+
+
+class SQLiteDBHandler:
+    """
+    DBHandler 的 SQLite 替身：翻译 Agent 用到的 MySQL 专有语句（INFORMATION_SCHEMA、DESC），
+    并可注入固定查询延迟以模拟网络往返
+    """
+
+    def __init__(self, db_config: Dict, path=":memory:", latency_ms=0.0, rows_per_fruit=200):
+        self.db_config = db_config
+        self.latency_ms = latency_ms
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SEED_SQL)
+        if not self.conn.execute("SELECT COUNT(*) FROM fruit_price").fetchone()[0]:
+            _seed_rows(self.conn, rows_per_fruit)
+        self.queries = 0
+
+    def get_table_names(self) -> List[str]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def _columns(self, table: str) -> List[Dict]:
+        rows = self.conn.execute(f"PRAGMA table_info({table})").fetchall()
+        return [
+            {"TABLE_NAME": table, "COLUMN_NAME": r["name"], "DATA_TYPE": r["type"].lower(), "COLUMN_COMMENT": ""}
+            for r in rows
+        ]
+
+    def _translate(self, sql: str) -> Optional[List[Dict]]:
+        upper = sql.upper()
+        if "INFORMATION_SCHEMA.TABLES" in upper:
+            return [{"TABLE_NAME": t} for t in self.get_table_names()]
+        if "INFORMATION_SCHEMA.COLUMNS" in upper:
+            return [c for t in self.get_table_names() for c in self._columns(t)]
+        if upper.lstrip().startswith("EXPLAIN"):
+            # 以表的总行数近似 MySQL EXPLAIN 的 rows 估计
+            tables = set(re.findall(r"(?:FROM|JOIN|UPDATE|INTO)\s+`?(\w+)`?", sql, re.IGNORECASE))
+            known = set(self.get_table_names())
+            return [
+                {"id": 1, "table": t, "rows": self.conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0], "filtered": 100.0}
+                for t in sorted(tables & known)
+            ]
+        m = re.match(r"\s*(?:DESC|DESCRIBE)\s+`?(\w+)`?", sql, re.IGNORECASE)
+        if m:
+            return [
+                {"Field": c["COLUMN_NAME"], "Type": c["DATA_TYPE"], "Null": "YES", "Key": "", "Default": None, "Extra": ""}
+                for c in self._columns(m.group(1))
+            ]
+        return None
+
+    def execute(self, sql: str, params: Optional[Union[List, Dict]] = None, fetch_all=True):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        with self._lock:
+            self.queries += 1
+            translated = self._translate(sql)
+            if translated is not None:
+                return translated
+            try:
+                # MySQL 的 %s 占位符与优化器 hint 在 SQLite 下需转换/去除
+                statement = re.sub(r"/\*\+.*?\*/", "", sql).replace("%s", "?")
+                cur = self.conn.execute(statement, params or [])
+                if cur.description is not None:
+                    rows = cur.fetchall() if fetch_all else cur.fetchmany(1)
+                    return [dict(r) for r in rows]
+                self.conn.commit()
+                return cur.rowcount
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                return f"SQL执行错误：{e}"
+
+    @contextmanager
+    def transaction(self):
+        """批量执行用的事务连接：整个事务期间持有锁"""
+        with self._lock:
+            yield _SQLiteTransaction(self)
+
+
+class _SQLiteTransaction:
+    def __init__(self, handler: SQLiteDBHandler):
+        self.handler = handler
+
+    def cursor(self):
+        return _SQLiteCursor(self.handler)
+
+    def commit(self):
+        self.handler.conn.commit()
+
+    def rollback(self):
+        self.handler.conn.rollback()
+
+
+class _SQLiteCursor:
+    """DB-API 游标的最小子集，复用 SQLiteDBHandler 的语句翻译；每次 execute/executemany 计一次往返"""
+
+    def __init__(self, handler: SQLiteDBHandler):
+        self.handler = handler
+        self.description = None
+        self.rowcount = -1
+        self._rows: List[Dict] = []
+
+    def _round_trip(self):
+        if self.handler.latency_ms:
+            time.sleep(self.handler.latency_ms / 1000)
+        self.handler.queries += 1
+
+    def execute(self, sql: str, params=None):
+        self._round_trip()
+        translated = self.handler._translate(sql)
+        if translated is None:
+            statement = re.sub(r"/\*\+.*?\*/", "", sql)
+            if params:
+                statement = statement.replace("%s", "?")
+            cur = self.handler.conn.execute(statement, params or [])
+            translated = [dict(r) for r in cur.fetchall()] if cur.description is not None else None
+            self.rowcount = cur.rowcount
+        if translated is not None:
+            self._rows = translated
+            self.description = [(k,) for k in translated[0]] if translated else [("",)]
+            self.rowcount = len(translated)
+        else:
+            self._rows, self.description = [], None
+
+    def executemany(self, sql: str, seq):
+        self._round_trip()
+        cur = self.handler.conn.executemany(sql.replace("%s", "?"), seq)
+        self._rows, self.description, self.rowcount = [], None, cur.rowcount
+
+    def fetchall(self):
+        return self._rows
+
+
+class NullEmailHandler:
+    def __init__(self, email_config: Dict, latency_ms=0.0):
+        self.email_config = email_config
+        self.latency_ms = latency_ms
+        self.sent = []
+
+    def send_email(self, from_addr, to_addrs, subject, body, is_html=False):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        self.sent.append({"to": list(to_addrs), "subject": subject})
+        return True
+
+    def close(self):
+        pass
+
+
+class StubLocalDataHandler:
+    def __init__(self, db_config: Dict):
+        self.files = [{"file_name": "柑橘采后处理规范.pdf"}, {"file_name": "苹果分级标准.txt"}]
+
+    def _check_dir(self, data_dir):
+        return True
+
+    def _get_existed_files(self):
+        return self.files
+
+    def search_file_by_keyword(self, keyword):
+        hits = [f["file_name"] for f in self.files if any(ch in f["file_name"] for ch in keyword)]
+        return "\n".join(hits) if hits else "无匹配文件"
+
+    def _upload_file(self, path):
+        self.files.append({"file_name": path})
+
+
+class _BoundSignal:
+    def __init__(self):
+        self._slots = []
+
+    def connect(self, slot):
+        self._slots.append(slot)
+
+    def disconnect(self, slot=None):
+        if slot is None:
+            self._slots.clear()
+        else:
+            self._slots.remove(slot)
+
+    def emit(self, *args):
+        for slot in list(self._slots):
+            slot(*args)
+
+
+class _Signal:
+    """pyqtSignal 的替身：每个实例一个信号，emit 时在当前线程直接调用已连接的槽"""
+
+    def __init__(self, *types_):
+        self._name = None
+
+    def __set_name__(self, owner, name):
+        self._name = "_signal_" + name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        signal = obj.__dict__.get(self._name)
+        if signal is None:
+            signal = obj.__dict__[self._name] = _BoundSignal()
+        return signal
+
+
+class _QObject:
+    def __init__(self, parent=None):
+        pass
+
+
+class _NullScheduler:
+    def __init__(self, *args, **kwargs):
+        self.jobs = []
+
+    def add_job(self, func, *args, **kwargs):
+        self.jobs.append(func)
+
+    def add_listener(self, *args, **kwargs):
+        pass
+
+    def get_jobs(self):
+        return list(self.jobs)
+
+    def start(self):
+        pass
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def _zhipu_client(api_key=None, base_url=None, **kwargs):
+    # 模拟服务兼容 OpenAI 协议，智谱客户端直接用 OpenAI 客户端代替
+    from openai import OpenAI
+
+    return OpenAI(api_key=api_key or "mock", base_url=base_url)
+
+
+def _no_fastsam(*args, **kwargs):
+    raise RuntimeError("未安装 FastSAM 图像模块，请用 --vision-latency-ms 模拟图像检测")
+
+
+def _no_upload(image_path):
+    raise RuntimeError("未安装图像上传模块")
+
+
+def _available(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _install(name: str, **attrs):
+    parts = name.split(".")
+    for i in range(1, len(parts) + 1):
+        module = sys.modules.setdefault(".".join(parts[:i]), types.ModuleType(".".join(parts[:i])))
+        if i > 1:
+            setattr(sys.modules[".".join(parts[:i - 1])], parts[i - 1], module)
+    for key, value in attrs.items():
+        setattr(module, key, value)
+
+
+def install_stub_modules(real_vision=False):
+    """
+    在 import AgriMind 之前把未安装的依赖注册为替身模块：PyQt5、zhipuai、apscheduler、markdown，
+    以及不随本仓库发布的 AgriMindAlpha 处理器与 Modules 图像模块。已安装的模块保持不动；
+    real_vision 为 False 时即使安装了 FastSAM 也不加载，图像检测由调用方替换为模拟实现
+    """
+    if not _available("PyQt5.QtCore"):
+        _install("PyQt5.QtCore", QObject=_QObject, pyqtSignal=_Signal)
+    if not _available("zhipuai"):
+        _install("zhipuai", ZhipuAI=_zhipu_client)
+    if not _available("apscheduler"):
+        _install("apscheduler.events", EVENT_JOB_REMOVED=1 << 10)
+        _install("apscheduler.schedulers.blocking", BlockingScheduler=_NullScheduler)
+    if not _available("markdown"):
+        _install("markdown", markdown=lambda text, **kwargs: text)
+    if not _available("AgriMindAlpha"):
+        _install("AgriMindAlpha.Modules.Handlers.DBH", DBHandler=SQLiteDBHandler)
+        _install("AgriMindAlpha.Modules.Handlers.LDH", LocalDataHandler=StubLocalDataHandler)
+    if not _available("Modules.ImageModules.url_generate"):
+        _install("Modules.ImageModules.url_generate", get_url=_no_upload)
+    if not real_vision or not _available("Modules.ImageModules.report"):
+        _install("Modules.ImageModules.report", construct_structured_data=_no_fastsam)
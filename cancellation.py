@@ -0,0 +1,126 @@
+"""
+协作式取消：每个轮次持有一个 CancelToken（可带截止时间），在步骤之间检查，
+并传递给大模型调用与数据库执行，使进行中的请求在取消或超时时尽快返回
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from tracing import tracer
+
+
+class Cancelled(RuntimeError):
+    def __init__(self, reason: str = "已取消"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    def __init__(self, deadline_s: Optional[float] = None):
+        self.deadline = time.monotonic() + deadline_s if deadline_s else None
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def cancel(self, reason: str = "已取消"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("已超时")
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """距截止时间的秒数；未设置截止时间时返回 None"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+    def on_cancel(self, callback: Callable[[], None]):
+        """注册取消时的回调（如关闭连接）；已取消时立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        remaining = self.remaining()
+        if remaining is not None:
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        self._event.wait(timeout)
+        return self.cancelled
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """
+        在后台线程执行阻塞调用，取消或超时时立即抛出 Cancelled，不再等待其返回；
+        被放弃的调用应自带超时（如 HTTP 请求的 timeout），以便随后自行结束
+        """
+        self.check()
+        done = threading.Event()
+        outcome = {}
+        fn = tracer.wrap(fn)
+
+        def target():
+            try:
+                outcome["value"] = fn(*args, **kwargs)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        worker = threading.Thread(target=target, name="cancellable-call", daemon=True)
+        worker.start()
+        while not done.wait(0.05):
+            if self.cancelled:
+                raise Cancelled(self.reason)
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["value"]
+
+
+class CancelRegistry:
+    """按 turn_id 登记进行中的轮次，供外部（如 HTTP 接口）取消"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, CancelToken] = {}
+
+    def register(self, turn_id: str, token: CancelToken):
+        with self._lock:
+            self._tokens[turn_id] = token
+
+    def unregister(self, turn_id: str):
+        with self._lock:
+            self._tokens.pop(turn_id, None)
+
+    def cancel(self, turn_id: str, reason: str = "已取消") -> bool:
+        with self._lock:
+            token = self._tokens.get(turn_id)
+        if token is None:
+            return False
+        token.cancel(reason)
+        return True
+
+    def active(self):
+        with self._lock:
+            return list(self._tokens)
+
+
+registry = CancelRegistry()
@@ -0,0 +1,182 @@
+"""
+聊天记录视图：QListView + 列表模型 + 绘制代理。只有可见的消息会被排版绘制，
+每条消息的 Markdown 只转换一次，排版结果按宽度缓存；超长的工具输出默认折叠，双击展开
+"""
+import datetime
+from collections import OrderedDict
+from typing import List, Optional
+
+import markdown
+from PyQt5.QtCore import QAbstractListModel, QEvent, QModelIndex, QPointF, QSize, Qt, QUrl
+from PyQt5.QtGui import QAbstractTextDocumentLayout, QDesktopServices, QPalette, QTextDocument
+from PyQt5.QtWidgets import QAbstractItemView, QListView, QStyle, QStyledItemDelegate
+
+MessageRole = Qt.UserRole + 1
+
+COLLAPSE_CHARS = 4000
+COLLAPSE_LINES = 60
+PREVIEW_LINES = 20
+PADDING = 8
+
+
+class ChatMessage:
+    def __init__(self, role: str, text: str, stamp: Optional[str] = None):
+        self.role = role
+        self.text = text
+        self.stamp = stamp or datetime.datetime.now().strftime("%H:%M")
+        lines = text.count("\n") + 1
+        self.collapsible = len(text) > COLLAPSE_CHARS or lines > COLLAPSE_LINES
+        self.collapsed = self.collapsible
+        self._html = {}
+
+    def html(self) -> str:
+        # 展开 / 折叠两种状态各转换一次 Markdown
+        key = self.collapsed
+        if key not in self._html:
+            if self.role == "welcome":
+                self._html[key] = self.text
+            else:
+                who = "🧑‍💻 你" if self.role == "user" else "🤖 AgriMind"
+                body = self.text
+                if self.collapsed:
+                    lines = body.split("\n")
+                    preview = "\n".join(lines[:PREVIEW_LINES])[:COLLAPSE_CHARS // 4]
+                    body = f"{preview}\n\n*……已折叠 {len(lines)} 行 / {len(self.text)} 字，双击展开*"
+                md = f"**{self.stamp}  {who}：**  \n{body}"
+                self._html[key] = f"<div style='margin:8px 0'>{markdown.markdown(md)}</div>"
+        return self._html[key]
+
+
+class ChatModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._messages: List[ChatMessage] = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._messages)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        message = self._messages[index.row()]
+        if role == MessageRole:
+            return message
+        if role == Qt.DisplayRole:
+            return message.text
+        return None
+
+    def append(self, messages: List[ChatMessage]):
+        """一次插入一批消息，只触发一次布局更新"""
+        if not messages:
+            return
+        start = len(self._messages)
+        self.beginInsertRows(QModelIndex(), start, start + len(messages) - 1)
+        self._messages.extend(messages)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._messages = []
+        self.endResetModel()
+
+    def toggle(self, row: int):
+        message = self._messages[row]
+        if message.collapsible:
+            message.collapsed = not message.collapsed
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+
+class ChatDelegate(QStyledItemDelegate):
+    """按 (消息, 宽度, 折叠状态) 缓存排好版的 QTextDocument，绘制与尺寸计算共用"""
+
+    def __init__(self, parent=None, cache_size=300):
+        super().__init__(parent)
+        self.cache_size = cache_size
+        self.text_color = "#5D6146"
+        self._docs: "OrderedDict[tuple, QTextDocument]" = OrderedDict()
+
+    def set_text_color(self, color: str):
+        self.text_color = color
+        self._docs.clear()
+
+    def reset(self):
+        self._docs.clear()
+
+    def _document(self, message: ChatMessage, width: int) -> QTextDocument:
+        # 以消息对象本身为键：缓存持有引用，已清空的消息的 id 不会被新消息复用而命中旧排版
+        key = (message, width, message.collapsed)
+        doc = self._docs.get(key)
+        if doc is None:
+            doc = QTextDocument()
+            doc.setDefaultFont(self.parent().font())
+            doc.setDefaultStyleSheet(f"body, p, li, td {{ color: {self.text_color}; }}")
+            doc.setHtml(message.html())
+            doc.setTextWidth(max(width - 2 * PADDING, 50))
+            self._docs[key] = doc
+            while len(self._docs) > self.cache_size:
+                self._docs.popitem(last=False)
+        else:
+            self._docs.move_to_end(key)
+        return doc
+
+    def sizeHint(self, option, index):
+        message = index.data(MessageRole)
+        doc = self._document(message, option.rect.width() or self.parent().viewport().width())
+        return QSize(int(doc.idealWidth()) + 2 * PADDING, int(doc.size().height()) + 2 * PADDING)
+
+    def paint(self, painter, option, index):
+        message = index.data(MessageRole)
+        doc = self._document(message, option.rect.width())
+        painter.save()
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(option.rect, option.palette.color(QPalette.AlternateBase))
+        painter.translate(option.rect.left() + PADDING, option.rect.top() + PADDING)
+        context = QAbstractTextDocumentLayout.PaintContext()
+        doc.documentLayout().draw(painter, context)
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        # 单击链接时用系统浏览器打开
+        if event.type() == QEvent.MouseButtonRelease:
+            message = index.data(MessageRole)
+            doc = self._document(message, option.rect.width())
+            pos = QPointF(event.pos() - option.rect.topLeft()) - QPointF(PADDING, PADDING)
+            anchor = doc.documentLayout().anchorAt(pos)
+            if anchor:
+                QDesktopServices.openUrl(QUrl(anchor))
+                return True
+        return super().editorEvent(event, model, option, index)
+
+
+class ChatView(QListView):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.chat_model = ChatModel(self)
+        self.delegate = ChatDelegate(self)
+        self.setModel(self.chat_model)
+        self.setItemDelegate(self.delegate)
+        # 清空记录后丢弃全部排版缓存，同时释放被缓存引用的旧消息
+        self.chat_model.modelReset.connect(self.delegate.reset)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setResizeMode(QListView.Adjust)
+        self.setWordWrap(True)
+        # 分批布局：长会话中新消息到来时不必一次性测量所有历史消息
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(50)
+        self.doubleClicked.connect(lambda index: self.chat_model.toggle(index.row()))
+
+    def append(self, messages: List[ChatMessage]):
+        at_bottom = self.verticalScrollBar().value() >= self.verticalScrollBar().maximum() - 4
+        self.chat_model.append(messages)
+        if at_bottom:
+            self.scrollToBottom()
+
+    def clear(self):
+        self.chat_model.clear()
+
+    def resizeEvent(self, event):
+        # 宽度变化后旧的排版缓存不再命中，由 LRU 自然淘汰
+        super().resizeEvent(event)
+        self.scheduleDelayedItemsLayout()
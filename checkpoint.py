@@ -0,0 +1,91 @@
+"""
+轮次检查点：每完成一个元任务就把任务链、已完成项、记忆与工具报告写入本地 SQLite，
+进程重启后可按 turn_id 从最后一个检查点继续，已完成的步骤（如图像分割）不必重跑
+"""
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    turn_id TEXT PRIMARY KEY,
+    session_id TEXT,
+    status TEXT NOT NULL,
+    step INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_checkpoints_status ON checkpoints (status, updated_at);
+"""
+
+# 可以继续执行的状态
+RESUMABLE = ("running", "cancelled", "failed")
+
+
+class CheckpointStore:
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def save(self, turn_id: str, session_id: str, state: Dict, step: int):
+        now = time.time()
+        payload = json.dumps(state, ensure_ascii=False, default=str)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO checkpoints (turn_id, session_id, status, step, state, created_at, updated_at) "
+                "VALUES (?, ?, 'running', ?, ?, ?, ?) "
+                "ON CONFLICT(turn_id) DO UPDATE SET status = 'running', step = excluded.step, "
+                "state = excluded.state, updated_at = excluded.updated_at",
+                (turn_id, session_id, step, payload, now, now),
+            )
+
+    def mark(self, turn_id: str, status: str, result: Optional[Dict] = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE checkpoints SET status = ?, result = ?, updated_at = ? WHERE turn_id = ?",
+                (status, json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                 time.time(), turn_id),
+            )
+
+    def load(self, turn_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM checkpoints WHERE turn_id = ?", (turn_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(
+            row,
+            state=json.loads(row["state"]),
+            result=json.loads(row["result"]) if row["result"] else None,
+        )
+
+    def resumable(self, limit=50) -> List[Dict]:
+        """未完成的轮次（最近更新的在前），不含完整状态"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT turn_id, session_id, status, step, created_at, updated_at FROM checkpoints "
+                f"WHERE status IN ({', '.join('?' * len(RESUMABLE))}) ORDER BY updated_at DESC LIMIT ?",
+                (*RESUMABLE, limit),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def prune(self, max_age_s: float) -> int:
+        """删除早于 max_age_s 的已完成检查点"""
+        with self._connect() as conn:
+            cur = conn.execute("DELETE FROM checkpoints WHERE status = 'done' AND updated_at < ?",
+                               (time.time() - max_age_s,))
+            return cur.rowcount
@@ -0,0 +1,101 @@
+"""
+CPU 进程池：图像分割等 CPU 密集任务提交到独立的工作进程执行，不占用承载大模型编排的进程的 GIL。
+workers 为 0 时在调用线程内直接执行（GUI 等单用户场景的默认行为）
+"""
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Optional
+
+from tracing import tracer
+
+
+def _init_worker():
+    # Ctrl+C 由主进程统一处理，工作进程随执行器关闭退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class CPUPool:
+    """
+    workers:              工作进程数，0 表示不使用进程池
+    max_tasks_per_child:  每个工作进程执行若干任务后重建，释放模型等常驻内存（Python 3.11+）
+    """
+
+    def __init__(self, workers: int, max_tasks_per_child: Optional[int] = None):
+        self.workers = workers
+        self.max_tasks_per_child = max_tasks_per_child
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "inline": 0}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("CPU 进程池已关闭")
+            if self._executor is None:
+                kwargs = {}
+                if self.max_tasks_per_child:
+                    kwargs["max_tasks_per_child"] = self.max_tasks_per_child
+                # spawn：工作进程不继承主进程的线程与连接，只导入任务函数所在的模块
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    **kwargs,
+                )
+            return self._executor
+
+    def _count(self, field: str):
+        with self._lock:
+            self._stats[field] += 1
+
+    def run(self, fn: Callable, *args, cancel=None):
+        """
+        在工作进程中执行 fn(*args) 并等待结果；fn 与参数须可序列化（模块级函数）。
+        cancel 为 CancelToken，取消时尚未开始的任务会被撤回，已开始的任务在后台执行完后丢弃。
+        工作进程中没有调用方的 span，任务在调用方的 trace 中记为一个 cpu.task span
+        """
+        with tracer.span("cpu.task", {"cpu.function": getattr(fn, "__name__", repr(fn)), "cpu.workers": self.workers}):
+            return self._run(fn, *args, cancel=cancel)
+
+    def _run(self, fn: Callable, *args, cancel=None):
+        if self.workers <= 0:
+            self._count("inline")
+            return fn(*args)
+        future = self._get_executor().submit(fn, *args)
+        self._count("submitted")
+        while True:
+            if cancel is not None and cancel.cancelled:
+                future.cancel()
+                self._count("cancelled")
+                cancel.check()
+            try:
+                result = future.result(timeout=0.05)
+            except FutureTimeout:
+                continue
+            except Exception:
+                self._count("failed")
+                raise
+            self._count("completed")
+            return result
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            in_flight = self._stats["submitted"] - self._stats["completed"] - self._stats["failed"] - self._stats["cancelled"]
+            return dict(self._stats, workers=self.workers, in_flight=max(in_flight, 0))
+
+
+cpu_pool = CPUPool(
+    int(os.getenv("AGENT_CPU_WORKERS", "0")),
+    max_tasks_per_child=int(os.getenv("AGENT_CPU_MAX_TASKS_PER_CHILD", "0")) or None,
+)
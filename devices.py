@@ -0,0 +1,298 @@
+"""
+设备数据采集：每个串口（含蓝牙 SPP 虚拟串口）或模拟设备由一个后台线程持续读取帧，
+写入预分配的 NumPy 环形缓冲区；智能体只读取缓冲区中的时间窗口，不会被采集阻塞
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+import spectra
+
+# 默认帧格式：2 字节帧头 + 133 个大端 uint16 光谱点 + 1 字节校验和（载荷字节和的低 8 位），共 269 字节
+FRAME_HEADER = b"\xaa\x55"
+FRAME_POINTS = 133
+FRAME_SIZE = len(FRAME_HEADER) + FRAME_POINTS * 2 + 1
+
+
+class FrameError(ValueError):
+    pass
+
+
+def parse_frame(frame: bytes) -> np.ndarray:
+    if len(frame) != FRAME_SIZE or not frame.startswith(FRAME_HEADER):
+        raise FrameError("帧长度或帧头错误")
+    payload = frame[len(FRAME_HEADER):-1]
+    if sum(payload) & 0xFF != frame[-1]:
+        raise FrameError("校验和错误")
+    return np.frombuffer(payload, dtype=">u2").astype(np.float32)
+
+
+def build_frame(points: np.ndarray) -> bytes:
+    payload = np.clip(np.asarray(points), 0, 65535).astype(">u2").tobytes()
+    return FRAME_HEADER + payload + bytes([sum(payload) & 0xFF])
+
+
+class RingBuffer:
+    """容量固定的帧缓冲区：写入只覆盖最旧的一行，不分配新内存"""
+
+    def __init__(self, capacity: int, width: int, dtype=np.float32):
+        self.capacity = capacity
+        self.width = width
+        self._frames = np.zeros((capacity, width), dtype=dtype)
+        self._stamps = np.zeros(capacity, dtype=np.float64)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def total(self) -> int:
+        return self._count
+
+    def push(self, frame: np.ndarray, stamp: Optional[float] = None):
+        with self._lock:
+            i = self._count % self.capacity
+            self._frames[i] = frame
+            self._stamps[i] = time.time() if stamp is None else stamp
+            self._count += 1
+
+    def window(self, seconds: Optional[float] = None, last: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """按时间顺序返回 (时间戳, 帧) 的副本；seconds 取最近若干秒，last 取最近若干帧"""
+        with self._lock:
+            n = min(self._count, self.capacity)
+            start = self._count - n
+            order = np.arange(start, self._count) % self.capacity
+            stamps = self._stamps[order]
+            frames = self._frames[order]
+        if seconds is not None and n:
+            # 相对当前时间取窗口：设备断开后不会把很久以前的最后几秒当作最新数据
+            keep = stamps >= time.time() - seconds
+            stamps, frames = stamps[keep], frames[keep]
+        if last is not None:
+            stamps, frames = stamps[-last:], frames[-last:]
+        return stamps, frames
+
+
+class SerialSource:
+    """串口设备；蓝牙 SPP 设备配对后同样以串口（如 COM3、/dev/rfcomm0）出现"""
+
+    def __init__(self, port: str, baudrate=9600, timeout=2.0, parse: Callable[[bytes], np.ndarray] = parse_frame):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.parse = parse
+        self.width = FRAME_POINTS
+        self._serial = None
+
+    def open(self):
+        import serial
+
+        self._serial = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
+
+    def read(self) -> Optional[np.ndarray]:
+        # 按帧头重新同步，避免从帧中间开始读取导致后续帧全部错位
+        ser = self._serial
+        if ser.read(1) != FRAME_HEADER[:1] or ser.read(1) != FRAME_HEADER[1:]:
+            return None
+        rest = ser.read(FRAME_SIZE - len(FRAME_HEADER))
+        if len(rest) < FRAME_SIZE - len(FRAME_HEADER):
+            raise FrameError("帧不完整")
+        return self.parse(FRAME_HEADER + rest)
+
+    def close(self):
+        if self._serial is not None:
+            self._serial.close()
+            self._serial = None
+
+
+class SimulatedSource:
+    """模拟近红外光谱仪：若干高斯吸收峰叠加基线漂移、散射与噪声，按 rate_hz 产生帧，用于测试与演示"""
+
+    def __init__(self, width=FRAME_POINTS, rate_hz=10.0, seed: Optional[int] = None):
+        self.width = width
+        self.rate_hz = rate_hz
+        self._rng = np.random.default_rng(seed)
+        x = np.linspace(0, 1, width)
+        bands = [(0.22, 0.03, 900), (0.48, 0.05, 1400), (0.71, 0.04, 1100)]
+        self._base = 2000 + sum(a * np.exp(-((x - c) / w) ** 2) for c, w, a in bands)
+        self._x = x
+        self._next = None
+
+    def open(self):
+        self._next = time.monotonic()
+
+    def read(self) -> Optional[np.ndarray]:
+        self._next += 1.0 / self.rate_hz
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        scale = 1 + self._rng.normal(0, 0.02)
+        drift = self._rng.normal(0, 30) * self._x
+        noise = self._rng.normal(0, 8, self.width)
+        return parse_frame(build_frame(self._base * scale + drift + noise))
+
+    def close(self):
+        pass
+
+
+class DeviceReader:
+    """后台读取线程：读取失败时关闭并按指数退避重连"""
+
+    def __init__(self, name: str, source, capacity=3000):
+        self.name = name
+        self.source = source
+        self.buffer = RingBuffer(capacity, source.width)
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.connected = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"device-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                self.source.open()
+                self.connected = True
+                backoff = 1.0
+                while not self._stop.is_set():
+                    try:
+                        frame = self.source.read()
+                    except FrameError as e:
+                        self.errors += 1
+                        self.last_error = str(e)
+                        continue
+                    if frame is not None:
+                        self.buffer.push(frame)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                logging.warning(f"设备 {self.name} 读取失败，{backoff:.0f}s 后重连：{self.last_error}")
+            finally:
+                self.connected = False
+                try:
+                    self.source.close()
+                except Exception:
+                    pass
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def status(self) -> Dict:
+        stamps, _ = self.buffer.window(last=50)
+        rate = float((len(stamps) - 1) / (stamps[-1] - stamps[0])) if len(stamps) > 1 and stamps[-1] > stamps[0] else 0.0
+        return {
+            "device": self.name,
+            "running": self.running,
+            "connected": self.connected,
+            "frames_total": self.buffer.total,
+            "buffered": len(self.buffer),
+            "rate_hz": round(rate, 2),
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_frame_at": float(stamps[-1]) if len(stamps) else None,
+        }
+
+
+class DeviceRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._readers: Dict[str, DeviceReader] = {}
+
+    def add(self, name: str, source, capacity=3000) -> DeviceReader:
+        with self._lock:
+            reader = self._readers[name] = DeviceReader(name, source, capacity)
+        return reader
+
+    def get(self, name: Optional[str] = None, start=True) -> Optional[DeviceReader]:
+        """按名称取读取器（缺省为唯一或第一个设备）；未启动时启动后台采集"""
+        with self._lock:
+            if name:
+                reader = self._readers.get(name)
+            else:
+                reader = next(iter(self._readers.values()), None)
+        if reader is not None and start:
+            reader.start()
+        return reader
+
+    def names(self):
+        with self._lock:
+            return list(self._readers)
+
+    def serial_names(self):
+        """独占打开的串口设备；同一端口只能由一个进程读取"""
+        with self._lock:
+            return [name for name, r in self._readers.items() if isinstance(r.source, SerialSource)]
+
+    def window(self, name: Optional[str] = None, seconds: Optional[float] = 5.0, last: Optional[int] = None,
+               pipeline: str = "sg+snv") -> Dict:
+        """读取最近的时间窗口并预处理、聚合；不等待新数据"""
+        reader = self.get(name)
+        if reader is None:
+            raise KeyError(f"未配置设备 {name or ''}".strip())
+        _, frames = reader.buffer.window(seconds=seconds, last=last)
+        result = reader.status()
+        if len(frames):
+            result.update(pipeline=pipeline, **spectra.summarize(spectra.preprocess(frames, pipeline)))
+        return result
+
+    def start(self):
+        """启动全部设备的后台采集；进程启动时调用，首次查询时缓冲区中已有数据"""
+        with self._lock:
+            readers = list(self._readers.values())
+        for reader in readers:
+            reader.start()
+
+    def stop(self):
+        for reader in list(self._readers.values()):
+            reader.stop()
+
+    def summary(self) -> Dict:
+        with self._lock:
+            readers = list(self._readers.values())
+        return {r.name: r.status() for r in readers}
+
+
+def source_from_spec(spec: str):
+    """sim[:频率] 或 serial:端口[:波特率]"""
+    kind, _, rest = spec.partition(":")
+    if kind == "sim":
+        return SimulatedSource(rate_hz=float(rest or 10))
+    if kind == "serial":
+        port, _, baud = rest.partition(":")
+        return SerialSource(port, int(baud or 9600))
+    raise ValueError(f"未知的设备类型：{spec}")
+
+
+def registry_from_env() -> DeviceRegistry:
+    # AGENT_DEVICES 形如 "nir=serial:COM3:9600,demo=sim:20"，默认不配置设备；
+    # 后台采集由各入口在启动时调用 devices.start() 开始
+    registry = DeviceRegistry()
+    capacity = int(os.getenv("AGENT_DEVICE_BUFFER", "3000"))
+    for item in filter(None, (s.strip() for s in os.getenv("AGENT_DEVICES", "").split(","))):
+        name, _, spec = item.partition("=")
+        registry.add(name.strip(), source_from_spec(spec.strip()), capacity)
+    return registry
+
+
+devices = registry_from_env()
@@ -0,0 +1,437 @@
+"""
+大模型调用的多服务商故障转移与对冲请求：每个逻辑模型对应按优先级排列的“服务商:模型”后端列表，
+首个请求超过该后端近期延迟分位数仍未返回时，向下一个后端发出对冲请求，先成功者胜出；
+落败的对冲请求使用独立连接，关闭连接即中止，无法中止的请求完成后仍交给调用方记账。
+连续失败的服务商由熔断器移出轮转，冷却后放行一个探测请求
+"""
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cancellation import Cancelled
+from tracing import tracer
+
+# 请求超时、冲突与限流可以换后端重试；其余 4xx 是请求本身的问题，换服务商也不会成功
+RETRYABLE_STATUS = (408, 409, 429)
+
+# 只对调用方指定的服务商有意义的参数（如 DashScope 的 enable_search、OSS 解析请求头），转移到其他服务商时去掉
+PROVIDER_SPECIFIC = ("extra_body", "extra_headers")
+
+
+def is_retryable(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status not in RETRYABLE_STATUS:
+        return False
+    return True
+
+
+class CircuitBreaker:
+    """closed -> 连续 failures 次失败 -> open；冷却 cooldown_s 后进入 half_open，只放行一个探测请求"""
+
+    def __init__(self, failures=5, cooldown_s=30.0):
+        self.failures = failures
+        self.cooldown_s = cooldown_s
+        self.state = "closed"
+        self.consecutive = 0
+        self.trips = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown_s:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive = 0
+            self._probing = False
+
+    def release(self):
+        """探测请求以既非成功也非失败的结果结束（如 4xx）时归还探测名额，下一个请求继续探测"""
+        with self._lock:
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive >= self.failures):
+                self.state = "open"
+                self.trips += 1
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class LatencyTracker:
+    """最近若干次成功调用的延迟；样本不足时不给出分位数（不发对冲）"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class Backend:
+    def __init__(self, provider: str, model: str, client):
+        self.provider = provider
+        self.model = model
+        self.client = client
+        self.key = f"{provider}:{model}"
+        self.latency = LatencyTracker()
+        self.stats = {"calls": 0, "ok": 0, "failures": 0, "hedges": 0, "wins": 0, "abandoned": 0}
+
+
+class _Attempt:
+    """一次在途请求；close 用于中止对冲请求的独立连接"""
+
+    def __init__(self, backend: Backend, hedge: bool, close: Optional[Callable[[], None]] = None):
+        self.backend = backend
+        self.hedge = hedge
+        self.close = close
+        self.abandoned = threading.Event()
+
+
+class FailoverRouter:
+    """
+    routes: 逻辑模型（调用方请求的模型名）-> ["服务商:模型", ...]；未配置的模型只使用调用方传入的客户端，
+    仍参与对冲与熔断统计。hedge_budget 为对冲请求占总请求数的上限，避免慢服务商被额外流量拖垮；
+    hedge_same_backend 允许无备选后端时向同一后端对冲，会让该服务商的负载翻倍，默认关闭
+    """
+
+    def __init__(self, hedge=True, percentile=0.95, min_delay_s=0.5, hedge_budget=0.1, hedge_same_backend=False,
+                 failures=5, cooldown_s=30.0):
+        self.hedge = hedge
+        self.percentile = percentile
+        self.min_delay_s = min_delay_s
+        self.hedge_budget = hedge_budget
+        self.hedge_same_backend = hedge_same_backend
+        self.failures = failures
+        self.cooldown_s = cooldown_s
+        self.providers: Dict[str, object] = {}
+        self.unsupported: Dict[str, frozenset] = {}
+        self.routes: Dict[str, List[Tuple[str, str]]] = {}
+        self._backends: Dict[str, Backend] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._credit = 0.0
+        self._hedges = {"fired": 0, "won": 0, "skipped_budget": 0}
+        self._lock = threading.Lock()
+
+    def add_provider(self, name: str, client, unsupported=()):
+        """unsupported: 该服务商不接受的调用参数（如 "tools"、"response_format"），转移到该服务商时去掉"""
+        with self._lock:
+            self.providers[name] = client
+            self.unsupported[name] = frozenset(unsupported)
+
+    def add_route(self, model: str, backends: List[str]):
+        specs = []
+        for spec in backends:
+            provider, _, target = spec.partition(":")
+            if provider not in self.providers:
+                raise ValueError(f"未知的服务商：{provider}")
+            specs.append((provider, target or model))
+        with self._lock:
+            self.routes[model] = specs
+
+    def load_config(self, path: str, client_factory: Callable[[str, Optional[str]], object]):
+        """
+        读取 JSON 配置（文件不存在时跳过）：
+        {"providers": {"deepseek": {"base_url": "...", "api_key_env": "DEEPSEEK_API_KEY", "unsupported": ["response_format"]}},
+         "routes": {"qwen-max": ["dashscope:qwen-max", "deepseek:deepseek-chat"]}}
+        """
+        if not path or not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        for name, spec in config.get("providers", {}).items():
+            self.add_provider(name, client_factory(spec["base_url"], os.getenv(spec.get("api_key_env", ""))),
+                              spec.get("unsupported", ()))
+        for model, backends in config.get("routes", {}).items():
+            self.add_route(model, backends)
+
+    def _provider_of(self, client) -> str:
+        with self._lock:
+            for name, known in self.providers.items():
+                if known is client:
+                    return name
+            name = f"client-{id(client):x}"
+            self.providers[name] = client
+            return name
+
+    def _backend(self, provider: str, model: str) -> Backend:
+        key = f"{provider}:{model}"
+        with self._lock:
+            backend = self._backends.get(key)
+            if backend is None:
+                backend = self._backends[key] = Backend(provider, model, self.providers[provider])
+            if provider not in self._breakers:
+                self._breakers[provider] = CircuitBreaker(self.failures, self.cooldown_s)
+            return backend
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        with self._lock:
+            return self._breakers.setdefault(provider, CircuitBreaker(self.failures, self.cooldown_s))
+
+    def backends(self, client, model: str) -> List[Backend]:
+        specs = self.routes.get(model) or [(self._provider_of(client), model)]
+        return [self._backend(provider, target) for provider, target in specs]
+
+    def _next(self, pending: List[Backend], force=False) -> Optional[Backend]:
+        """按优先级取下一个熔断器放行的后端；force 时全部熔断也取第一个，保证请求总能发出"""
+        for i, backend in enumerate(pending):
+            if self.breaker(backend.provider).allow():
+                return pending.pop(i)
+        if force and pending:
+            return pending.pop(0)
+        return None
+
+    def _take_credit(self) -> bool:
+        with self._lock:
+            if self._credit >= 1.0:
+                self._credit -= 1.0
+                self._hedges["fired"] += 1
+                return True
+            self._hedges["skipped_budget"] += 1
+            return False
+
+    def _refund_credit(self):
+        with self._lock:
+            self._credit += 1.0
+            self._hedges["fired"] -= 1
+
+    def _kwargs_for(self, backend: Backend, kwargs: Dict, origin: str) -> Dict:
+        """按后端改写调用参数：换用该后端的模型名，去掉该服务商不接受的参数与其他服务商专有的参数"""
+        drop = set(self.unsupported.get(backend.provider, ()))
+        if backend.provider != origin:
+            drop.update(PROVIDER_SPECIFIC)
+        return dict({k: v for k, v in kwargs.items() if k not in drop}, model=backend.model)
+
+    def _dedicated(self, client) -> Tuple[object, Optional[Callable[[], None]]]:
+        """
+        对冲请求使用独立连接的客户端副本，落败时关闭连接即可中止请求，不影响共享连接池里的其他请求；
+        客户端不支持（非 OpenAI SDK 或缺少 httpx）时使用原客户端，落败后只能等它自行结束
+        """
+        copy = getattr(client, "copy", None)
+        if copy is None:
+            return client, None
+        try:
+            import httpx
+        except ImportError:
+            return client, None
+        http_client = httpx.Client(timeout=getattr(client, "timeout", None))
+        return copy(http_client=http_client), http_client.close
+
+    def _attempt(self, backend: Backend, kwargs: Dict, client=None, abandoned: Optional[threading.Event] = None,
+                 hedge=False):
+        """执行一次调用并更新该后端的延迟与熔断状态；被放弃的请求完成后同样计入，被中止引起的失败不计入熔断"""
+        breaker = self.breaker(backend.provider)
+        with self._lock:
+            backend.stats["calls"] += 1
+        started = time.monotonic()
+        try:
+            with tracer.span("llm.attempt", {"agent.llm_backend": backend.key, "agent.hedge": hedge}):
+                response = (client or backend.client).chat.completions.create(**kwargs)
+        except Exception as e:
+            if abandoned is not None and abandoned.is_set():
+                breaker.release()
+                raise
+            with self._lock:
+                backend.stats["failures"] += 1
+            if is_retryable(e):
+                breaker.failure()
+            else:
+                breaker.release()
+            raise
+        backend.latency.add(time.monotonic() - started)
+        breaker.success()
+        with self._lock:
+            backend.stats["ok"] += 1
+        return response
+
+    def create(self, client, cancel=None, on_abandoned: Optional[Callable[[object, Backend], None]] = None,
+               **kwargs) -> Tuple[object, Backend, bool]:
+        """
+        返回 (响应, 实际提供响应的后端, 是否由对冲请求胜出)；所有后端都失败时抛出最后一个异常。
+        落败或因取消被放弃的请求若仍成功返回，以 on_abandoned(响应, 后端) 通知调用方记账（在该请求的线程中调用）
+        """
+        origin = self._provider_of(client)
+        pending = self.backends(client, kwargs["model"])
+        with self._lock:
+            self._credit = min(self._credit + self.hedge_budget, 10.0)
+        if kwargs.get("stream"):
+            # 流式响应无法对冲，只在建立连接失败时依次转移
+            response, backend = self._failover(pending, kwargs, origin, cancel)
+            return response, backend, False
+
+        results: "queue.Queue" = queue.Queue()
+        attempts: List[_Attempt] = []
+        # 请求完成时交回结果与被放弃二者互斥，保证每个成功响应要么被采用、要么交给 on_abandoned
+        settle = threading.Lock()
+
+        def launch(backend: Backend, hedge: bool):
+            call_client, close = self._dedicated(backend.client) if hedge else (backend.client, None)
+            attempt = _Attempt(backend, hedge, close)
+            attempts.append(attempt)
+            call_kwargs = self._kwargs_for(backend, kwargs, origin)
+
+            def target():
+                try:
+                    response, error = self._attempt(backend, call_kwargs, call_client, attempt.abandoned, hedge), None
+                except Exception as e:
+                    response, error = None, e
+                with settle:
+                    abandoned = attempt.abandoned.is_set()
+                    if not abandoned:
+                        results.put((attempt, response, error))
+                if close is not None:
+                    # 非流式响应已完整读出，独立连接用完即关
+                    close()
+                if abandoned and error is None:
+                    self._settle_abandoned(backend, response, on_abandoned)
+
+            threading.Thread(target=tracer.wrap(target), name=f"llm-{backend.key}", daemon=True).start()
+
+        primary = self._next(pending, force=True)
+        launch(primary, False)
+        in_flight = 1
+        delay = primary.latency.percentile(self.percentile) if self.hedge else None
+        hedge_at = time.monotonic() + max(delay, self.min_delay_s) if delay is not None else None
+        last_error: Optional[BaseException] = None
+        winner: Optional[_Attempt] = None
+        try:
+            while in_flight:
+                try:
+                    attempt, response, error = results.get(timeout=0.05)
+                except queue.Empty:
+                    if cancel is not None and cancel.cancelled:
+                        raise Cancelled(cancel.reason)
+                    # 先确认对冲额度再取后端：_next 可能占用半开熔断器的探测名额，取出的后端必须发出请求
+                    if hedge_at is not None and time.monotonic() >= hedge_at:
+                        hedge_at = None
+                        if self._take_credit():
+                            target = self._next(pending)
+                            if target is None and self.hedge_same_backend and self.breaker(primary.provider).state == "closed":
+                                target = primary
+                            if target is None:
+                                self._refund_credit()
+                            else:
+                                with self._lock:
+                                    target.stats["hedges"] += 1
+                                launch(target, True)
+                                in_flight += 1
+                    continue
+                in_flight -= 1
+                backend = attempt.backend
+                if error is None:
+                    winner = attempt
+                    with self._lock:
+                        backend.stats["wins"] += 1
+                        if attempt.hedge:
+                            self._hedges["won"] += 1
+                    return response, backend, attempt.hedge
+                last_error = error
+                if not is_retryable(error):
+                    raise error
+                # 失败后立即转移到下一个后端，不等待对冲延迟
+                target = self._next(pending)
+                if target is not None:
+                    launch(target, False)
+                    in_flight += 1
+            raise last_error
+        finally:
+            self._abandon([a for a in attempts if a is not winner], results, settle, on_abandoned)
+
+    def _abandon(self, attempts: List[_Attempt], results: "queue.Queue", settle: threading.Lock,
+                 on_abandoned: Optional[Callable[[object, Backend], None]]):
+        """放弃其余在途请求：关闭对冲请求的独立连接；已返回但未被取走的成功响应同样交给 on_abandoned"""
+        with settle:
+            for attempt in attempts:
+                attempt.abandoned.set()
+            finished = []
+            while True:
+                try:
+                    finished.append(results.get_nowait())
+                except queue.Empty:
+                    break
+        for attempt in attempts:
+            if attempt.close is not None:
+                try:
+                    attempt.close()
+                except Exception:
+                    pass
+        for attempt, response, error in finished:
+            if error is None:
+                self._settle_abandoned(attempt.backend, response, on_abandoned)
+
+    def _settle_abandoned(self, backend: Backend, response, on_abandoned):
+        with self._lock:
+            backend.stats["abandoned"] += 1
+        if on_abandoned is not None:
+            on_abandoned(response, backend)
+
+    def _failover(self, pending: List[Backend], kwargs: Dict, origin: str, cancel=None) -> Tuple[object, Backend]:
+        backend = self._next(pending, force=True)
+        while True:
+            if cancel is not None:
+                cancel.check()
+            try:
+                return self._attempt(backend, self._kwargs_for(backend, kwargs, origin)), backend
+            except Exception as e:
+                backend = self._next(pending) if is_retryable(e) else None
+                if backend is None:
+                    raise
+
+    def summary(self) -> Dict:
+        with self._lock:
+            backends = list(self._backends.values())
+            breakers = dict(self._breakers)
+            hedges = dict(self._hedges)
+        return {
+            "hedges": hedges,
+            "backends": {
+                b.key: dict(b.stats, p50_s=b.latency.percentile(0.5), hedge_after_s=b.latency.percentile(self.percentile))
+                for b in backends
+            },
+            "breakers": {name: {"state": br.state, "consecutive_failures": br.consecutive, "trips": br.trips}
+                         for name, br in breakers.items()},
+        }
+
+
+def failover_from_env() -> FailoverRouter:
+    return FailoverRouter(
+        hedge=os.getenv("AGENT_HEDGE", "1") != "0",
+        percentile=float(os.getenv("AGENT_HEDGE_PERCENTILE", "0.95")),
+        min_delay_s=float(os.getenv("AGENT_HEDGE_MIN_DELAY", "0.5")),
+        hedge_budget=float(os.getenv("AGENT_HEDGE_BUDGET", "0.1")),
+        hedge_same_backend=os.getenv("AGENT_HEDGE_SAME_BACKEND", "0") == "1",
+        failures=int(os.getenv("AGENT_BREAKER_FAILURES", "5")),
+        cooldown_s=float(os.getenv("AGENT_BREAKER_COOLDOWN", "30")),
+    )
+
+
+failover = failover_from_env()
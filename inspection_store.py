@@ -0,0 +1,194 @@
+"""
+检测结果列式存储：每次检测的结构化指标按 品类/日期 分区追加写入，每列一个 float64 文件，
+读取时用 np.memmap 映射、向量化分桶聚合，趋势类问题无需经过 MySQL 与大模型。
+每个写入进程使用独立的段目录，多进程部署时无需跨进程加锁
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import analytics
+
+TS = "ts"
+BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+_LABELED = re.compile(r"([一-龥A-Za-z_][一-龥A-Za-z0-9_]{0,15})\s*[：:=]\s*([-+]?\d+(?:\.\d+)?)\s*(%?)")
+
+
+def extract_metrics(report: str) -> Dict[str, float]:
+    """
+    从检测报告中提取数值指标：表格的行数与各数值列均值、JSON 对象中的顶层数值字段，
+    以及“缺陷率：12%”形式的标注数值（百分数按比例存储）
+    """
+    metrics: Dict[str, float] = {}
+    for records in analytics.extract_tables(report):
+        table = analytics.Table(records)
+        metrics.setdefault("items", float(table.rows))
+        for col, values in table.numeric.items():
+            if not np.all(np.isnan(values)):
+                metrics.setdefault(col, float(np.nanmean(values)))
+    for value in analytics.json_values(report):
+        if isinstance(value, dict):
+            for key, v in value.items():
+                number = analytics.as_number(v)
+                if number is not None:
+                    metrics.setdefault(str(key), number)
+    for label, number, percent in _LABELED.findall(report):
+        metrics.setdefault(label, float(number) / 100 if percent else float(number))
+    return metrics
+
+
+class InspectionStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.writer = f"w{os.getpid()}"
+        self._lock = threading.Lock()
+        self._schemas: Dict[str, Dict[str, str]] = {}
+
+    @staticmethod
+    def _file_name(column: str) -> str:
+        return "ts.f64" if column == TS else hashlib.sha1(column.encode("utf-8")).hexdigest()[:12] + ".f64"
+
+    @staticmethod
+    def _safe(name: str) -> str:
+        return re.sub(r"[\\/:*?\"<>|\s]+", "_", name.strip()) or "未分类"
+
+    def _segment(self, category: str, day: str) -> str:
+        return os.path.join(self.root, self._safe(category), day, self.writer)
+
+    def _load_schema(self, segment: str) -> Dict[str, str]:
+        path = os.path.join(segment, "schema.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def append(self, category: str, metrics: Dict[str, float], ts: Optional[float] = None):
+        """追加一行；新出现的列用 NaN 回填已有行，缺失的列写入 NaN"""
+        ts = time.time() if ts is None else ts
+        day = datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+        segment = self._segment(category, day)
+        with self._lock:
+            os.makedirs(segment, exist_ok=True)
+            schema = self._schemas.get(segment)
+            if schema is None:
+                schema = self._schemas[segment] = self._load_schema(segment)
+            rows = self._rows(segment)
+            new_columns = [c for c in metrics if c not in schema and c != TS]
+            for column in new_columns:
+                schema[column] = self._file_name(column)
+                # 覆盖写：上次可能在写入 schema.json 之前崩溃，留下了未登记的同名列文件
+                with open(os.path.join(segment, schema[column]), "wb") as f:
+                    f.write(np.full(rows, np.nan).tobytes())
+            if new_columns:
+                tmp = os.path.join(segment, "schema.json.tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(schema, f, ensure_ascii=False)
+                os.replace(tmp, os.path.join(segment, "schema.json"))
+            for column, file_name in schema.items():
+                with open(os.path.join(segment, file_name), "r+b") as f:
+                    # 上次写入在时间列之前中断时，部分列比时间列多出一行，先与时间列对齐再追加
+                    size = f.seek(0, os.SEEK_END)
+                    if size > rows * 8:
+                        f.truncate(rows * 8)
+                    elif size < rows * 8:
+                        f.write(np.full(rows - size // 8, np.nan).tobytes())
+                    f.seek(rows * 8)
+                    f.write(np.float64(metrics.get(column, np.nan)).tobytes())
+            # 时间列最后写入，读取时以它的长度为准，未写完的行不可见
+            with open(os.path.join(segment, self._file_name(TS)), "ab") as f:
+                f.write(np.float64(ts).tobytes())
+
+    @staticmethod
+    def _rows(segment: str) -> int:
+        path = os.path.join(segment, "ts.f64")
+        return os.path.getsize(path) // 8 if os.path.exists(path) else 0
+
+    @staticmethod
+    def _map(path: str, rows: int) -> np.ndarray:
+        if rows == 0:
+            return np.empty(0)
+        return np.memmap(path, dtype=np.float64, mode="r", shape=(rows,))
+
+    def categories(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def metrics(self, category: Optional[str] = None) -> List[str]:
+        pattern = os.path.join(self.root, self._safe(category) if category else "*", "*", "*", "schema.json")
+        names = set()
+        for path in glob.glob(pattern):
+            with open(path, encoding="utf-8") as f:
+                names.update(json.load(f))
+        return sorted(names)
+
+    def scan(self, metric: str, category: Optional[str] = None, start: Optional[float] = None,
+             end: Optional[float] = None):
+        """返回时间范围内的 (时间戳, 指标值)，只打开范围内日期分区的文件"""
+        first_day = datetime.fromtimestamp(start).strftime("%Y-%m-%d") if start else None
+        last_day = datetime.fromtimestamp(end).strftime("%Y-%m-%d") if end else None
+        stamps, values = [], []
+        for segment in glob.glob(os.path.join(self.root, self._safe(category) if category else "*", "*", "*")):
+            day = os.path.basename(os.path.dirname(segment))
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            schema = self._load_schema(segment)
+            if metric not in schema:
+                continue
+            rows = self._rows(segment)
+            ts = self._map(os.path.join(segment, "ts.f64"), rows)
+            column = self._map(os.path.join(segment, schema[metric]), rows)
+            mask = ~np.isnan(column)
+            if start:
+                mask &= ts >= start
+            if end:
+                mask &= ts < end
+            stamps.append(np.asarray(ts[mask]))
+            values.append(np.asarray(column[mask]))
+        if not stamps:
+            return np.empty(0), np.empty(0)
+        return np.concatenate(stamps), np.concatenate(values)
+
+    def aggregate(self, metric: str, category: Optional[str] = None, days: float = 30, bucket: str = "day",
+                  now: Optional[float] = None) -> Dict:
+        """按小时/天/周分桶的计数、均值、极值，以及整段的线性趋势（每天变化量）"""
+        now = time.time() if now is None else now
+        start = now - days * 86400
+        stamps, values = self.scan(metric, category, start, now)
+        result = {"metric": metric, "category": category, "days": days, "bucket": bucket, "count": int(len(values))}
+        if not len(values):
+            return result
+        width = BUCKETS[bucket]
+        # 按本地时间对齐桶边界
+        tz = datetime.fromtimestamp(now).astimezone().utcoffset().total_seconds()
+        index = ((stamps + tz) // width).astype(np.int64)
+        keys, inverse = np.unique(index, return_inverse=True)
+        counts = np.bincount(inverse)
+        sums = np.bincount(inverse, weights=values)
+        mins = np.full(len(keys), np.inf)
+        maxs = np.full(len(keys), -np.inf)
+        np.minimum.at(mins, inverse, values)
+        np.maximum.at(maxs, inverse, values)
+        fmt = "%Y-%m-%d %H:00" if bucket == "hour" else "%Y-%m-%d"
+        result["buckets"] = [
+            {"start": datetime.fromtimestamp(int(k) * width - tz).strftime(fmt), "count": int(c),
+             "mean": round(float(s / c), 6), "min": round(float(lo), 6), "max": round(float(hi), 6)}
+            for k, c, s, lo, hi in zip(keys, counts, sums, mins, maxs)
+        ]
+        result.update(mean=round(float(values.mean()), 6), min=round(float(values.min()), 6),
+                      max=round(float(values.max()), 6))
+        if len(values) >= 3 and np.ptp(stamps) > 0:
+            slope = np.polyfit((stamps - stamps.min()) / 86400, values, 1)[0]
+            result["slope_per_day"] = round(float(slope), 6)
+        return result
+
+
+inspection_store = InspectionStore(os.getenv("AGENT_INSPECTION_STORE", "inspections"))
@@ -0,0 +1,173 @@
+"""
+自适应模型路由：根据调用角色的延迟/成本 SLO、输入规模与廉价的难度估计为每次调用挑选模型，
+输出解析失败时沿模型阶梯升级重试，并记录每次路由决策以便离线调优
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+# 模型阶梯：由快/便宜到慢/强。latency_ms 为基准延迟，per_kchar_ms 为每千字输入的额外延迟，cost 为相对单价
+DEFAULT_PROFILES = {
+    "qwen-turbo": {"latency_ms": 900.0, "per_kchar_ms": 60.0, "cost": 1.0},
+    "qwen-plus": {"latency_ms": 2200.0, "per_kchar_ms": 150.0, "cost": 3.0},
+    "qwen-max": {"latency_ms": 5500.0, "per_kchar_ms": 400.0, "cost": 10.0},
+}
+DEFAULT_LADDER = ["qwen-turbo", "qwen-plus", "qwen-max"]
+
+# 各调用角色的 SLO：latency_ms 为期望延迟上限，min_tier 为最低允许档位，max_cost 为相对单价上限
+DEFAULT_SLOS = {
+    "analyze": {"latency_ms": 8000.0, "min_tier": 0},
+    "query_process": {"latency_ms": 8000.0, "min_tier": 0},
+    "plan": {"latency_ms": 9000.0, "min_tier": 0},
+    "schedule": {"latency_ms": 10000.0, "min_tier": 0},
+}
+
+_CLAUSE_SPLIT = re.compile(r"[，,。；;、\n]|并且|然后|之后|再|并|同时|以及")
+_REASONING_WORDS = ("分析", "总结", "报告", "对比", "比较", "趋势", "预测", "原因", "建议", "评估", "如果", "是否")
+_MULTI_STEP_WORDS = ("每隔", "定时", "周期", "邮件", "发送", "保存", "插入", "写入", "存入", "创建")
+_FAILURE_WORDS = ("错误", "失败", "未找到", "异常", "Error", "error")
+_TASK_LINE = re.compile(r"^\s*\d-")
+
+
+def estimate_difficulty(role: str, text: str) -> float:
+    """
+    基于文本特征的廉价难度估计，返回 [0, 1]：子句数、推理类/多步骤关键词、角色相关的额外信号
+    """
+    clauses = [c for c in _CLAUSE_SPLIT.split(text) if c.strip()]
+    score = min(len(clauses), 6) * 0.07
+    score += min(sum(w in text for w in _REASONING_WORDS), 3) * 0.1
+    score += min(sum(w in text for w in _MULTI_STEP_WORDS), 3) * 0.1
+    score += min(len(text) / 2000, 0.2)
+    if role == "analyze":
+        # 数据库操作需要由 analyze 直接写出 SQL，难度更高；直接生成则几乎无需推理
+        stripped = text.lstrip()
+        if stripped.startswith("2"):
+            score += 0.3
+        elif stripped.startswith("4"):
+            score -= 0.2
+    elif role == "plan":
+        # 融合规划需同时完成拆解与首个工具调用，整体难度略高
+        score += 0.1
+    elif role == "schedule":
+        score += min(sum(w in text for w in _FAILURE_WORDS), 2) * 0.15
+        score += min(sum(1 for line in text.split("\n") if _TASK_LINE.match(line)), 5) * 0.04
+    return max(0.0, min(1.0, score))
+
+
+class RoutingDecision:
+    def __init__(self, role: str, model: str, difficulty: float, input_chars: int, reason: str,
+                 escalated_from: Optional[str] = None):
+        self.role = role
+        self.model = model
+        self.difficulty = difficulty
+        self.input_chars = input_chars
+        self.reason = reason
+        self.escalated_from = escalated_from
+
+    def to_dict(self) -> Dict:
+        return {
+            "role": self.role,
+            "model": self.model,
+            "difficulty": round(self.difficulty, 3),
+            "input_chars": self.input_chars,
+            "reason": self.reason,
+            "escalated_from": self.escalated_from,
+        }
+
+
+class ModelRouter:
+    def __init__(self, ladder: Optional[List[str]] = None, profiles: Optional[Dict] = None,
+                 slos: Optional[Dict] = None, thresholds=(0.35, 0.7), log_path: Optional[str] = None,
+                 enabled=True, ewma=0.2):
+        self.ladder = list(ladder or DEFAULT_LADDER)
+        self.profiles = {k: dict(v) for k, v in (profiles or DEFAULT_PROFILES).items()}
+        self.slos = dict(DEFAULT_SLOS, **(slos or {}))
+        self.thresholds = thresholds
+        self.log_path = log_path
+        self.enabled = enabled
+        self.ewma = ewma
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=500)
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def predict_latency(self, model: str, input_chars: int) -> float:
+        profile = self.profiles.get(model, {})
+        return profile.get("latency_ms", 0.0) + profile.get("per_kchar_ms", 0.0) * input_chars / 1000
+
+    def route(self, role: str, text: str, default: str = "qwen-max",
+              input_chars: Optional[int] = None) -> RoutingDecision:
+        """text 用于难度估计；input_chars 为实际提示规模（缺省取 text 长度），用于预测延迟"""
+        input_chars = len(text) if input_chars is None else input_chars
+        if not self.enabled:
+            return RoutingDecision(role, default, 0.0, input_chars, "disabled")
+
+        difficulty = estimate_difficulty(role, text)
+        low, high = self.thresholds
+        required = 0 if difficulty < low else (1 if difficulty < high else 2)
+        required = min(required, len(self.ladder) - 1)
+
+        slo = self.slos.get(role, {})
+        floor = min(slo.get("min_tier", 0), len(self.ladder) - 1)
+        tier = max(required, floor)
+        reason = f"difficulty={difficulty:.2f}->tier{required}"
+
+        # SLO 约束：延迟或单价超出上限时向下调整，但不低于角色的最低档位
+        while tier > floor:
+            model = self.ladder[tier]
+            too_slow = slo.get("latency_ms") and self.predict_latency(model, input_chars) > slo["latency_ms"]
+            too_costly = slo.get("max_cost") and self.profiles.get(model, {}).get("cost", 0) > slo["max_cost"]
+            if not (too_slow or too_costly):
+                break
+            tier -= 1
+            reason += f", slo->tier{tier}"
+
+        return RoutingDecision(role, self.ladder[tier], difficulty, input_chars, reason)
+
+    def fixed(self, role: str, model: str) -> RoutingDecision:
+        """不参与路由的调用点（固定模型），仍可复用决策记录与升级逻辑"""
+        return RoutingDecision(role, model, 0.0, 0, "fixed")
+
+    def escalate(self, decision: RoutingDecision, reason: str) -> Optional[RoutingDecision]:
+        """输出不可用时升级到阶梯中的下一档，已是最高档时返回 None"""
+        if decision.model not in self.ladder:
+            return None
+        idx = self.ladder.index(decision.model)
+        if idx + 1 >= len(self.ladder):
+            return None
+        return RoutingDecision(decision.role, self.ladder[idx + 1], decision.difficulty, decision.input_chars,
+                               f"escalate: {reason}", escalated_from=decision.model)
+
+    def record(self, decision: RoutingDecision, outcome: str, latency_ms: float):
+        entry = dict(decision.to_dict(), outcome=outcome, latency_ms=round(latency_ms, 1), ts=time.time())
+        with self._lock:
+            self._recent.append(entry)
+            counts = self._counts.setdefault(f"{decision.role}:{decision.model}", {"calls": 0, "failures": 0})
+            counts["calls"] += 1
+            if outcome != "ok":
+                counts["failures"] += 1
+            # 以观测到的延迟修正基准延迟，扣除输入规模带来的部分
+            profile = self.profiles.get(decision.model)
+            if profile is not None and outcome == "ok":
+                observed = latency_ms - profile.get("per_kchar_ms", 0.0) * decision.input_chars / 1000
+                profile["latency_ms"] = (1 - self.ewma) * profile["latency_ms"] + self.ewma * max(observed, 0.0)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                "decisions": {k: dict(v) for k, v in self._counts.items()},
+                "escalations": sum(1 for e in self._recent if e["escalated_from"]),
+                "latency_ms": {m: round(p["latency_ms"], 1) for m, p in self.profiles.items()},
+            }
+
+
+router = ModelRouter(
+    log_path=os.getenv("AGENT_ROUTING_LOG") or None,
+    enabled=os.getenv("AGENT_ADAPTIVE_ROUTING", "1") != "0",
+)
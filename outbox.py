@@ -0,0 +1,341 @@
+"""
+邮件发件箱：消息先持久化到 SQLite 再立即返回投递编号，由后台线程取出到期消息，
+合并内容相同的消息批量发送，复用 SMTP 连接，失败时按指数退避重试
+"""
+import json
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from email.header import Header
+from email.mime.text import MIMEText
+from email.utils import formataddr, parseaddr
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    from_addr TEXT NOT NULL,
+    to_addrs TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    is_html INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    claimed_at REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at);
+"""
+
+Address = Union[str, Tuple[str, str]]
+
+
+def check_recipients(to_addrs: Union[str, Sequence[str]]) -> List[str]:
+    """返回解析后的收件地址；为空或含无法解析的地址时抛出 ValueError，不让注定失败的消息入队后反复重试"""
+    if isinstance(to_addrs, str):
+        to_addrs = [to_addrs]
+    addrs = []
+    for raw in to_addrs or []:
+        _, addr = parseaddr(raw or "")
+        local, _, domain = addr.rpartition("@")
+        if not local or not domain or any(c.isspace() for c in addr):
+            raise ValueError(f"无法解析的收件人地址：{raw!r}")
+        addrs.append(addr)
+    if not addrs:
+        raise ValueError("未指定收件人")
+    return addrs
+
+
+class SMTPSender:
+    """
+    与 EmailHandler.send_email 签名一致的发送器，但在多次发送之间保持 SMTP 会话，
+    连接断开时自动重连一次。部分收件人被服务器拒绝时同样抛出 SMTPRecipientsRefused（其余收件人已送达），
+    由调用方按 recipients 中的地址与应答码处理
+    """
+
+    def __init__(self, email_config: Dict):
+        self.email_config = email_config
+        self._conn: Optional[smtplib.SMTP] = None
+
+    def _connect(self) -> smtplib.SMTP:
+        cfg = self.email_config
+        if cfg.get("use_ssl", True):
+            conn = smtplib.SMTP_SSL(cfg["host"], cfg.get("port", 465), timeout=30)
+        else:
+            conn = smtplib.SMTP(cfg["host"], cfg.get("port", 25), timeout=30)
+            if cfg.get("starttls"):
+                conn.starttls()
+        if cfg.get("username"):
+            conn.login(cfg["username"], cfg.get("password", ""))
+        return conn
+
+    def send_email(self, from_addr: Address, to_addrs: Sequence[str], subject: str, body: str, is_html=False):
+        name, addr = from_addr if isinstance(from_addr, tuple) else ("", from_addr)
+        message = MIMEText(body, "html" if is_html else "plain", "utf-8")
+        message["From"] = formataddr((str(Header(name, "utf-8")), addr)) if name else addr
+        # 多个收件人合并发送时不互相暴露地址
+        message["To"] = to_addrs[0] if len(to_addrs) == 1 else "undisclosed-recipients:;"
+        message["Subject"] = Header(subject, "utf-8")
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = self._connect()
+            try:
+                refused = self._conn.sendmail(addr, list(to_addrs), message.as_string())
+                if refused:
+                    raise smtplib.SMTPRecipientsRefused(refused)
+                return True
+            except smtplib.SMTPServerDisconnected:
+                self._conn = None
+                if attempt:
+                    raise
+        return False
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.quit()
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._conn = None
+
+
+class EmailOutbox:
+    """
+    path:          SQLite 文件路径（多个进程/线程可共享，按租约认领消息）
+    sender:        具有 send_email(from_addr, to_addrs, subject, body, is_html) 的发送器
+    batch_size:    单封邮件合并的收件人上限
+    max_attempts:  超过后标记为 failed
+    idle_close_s:  队列空闲超过该时长后关闭 SMTP 连接
+    """
+
+    def __init__(self, path: str, sender, batch_size=50, max_attempts=5, base_backoff_s=2.0,
+                 max_backoff_s=300.0, lease_s=300.0, idle_close_s=30.0, poll_s=5.0):
+        self.path = path
+        self.sender = sender
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_backoff_s = base_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.lease_s = lease_s
+        self.idle_close_s = idle_close_s
+        self.poll_s = poll_s
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            pending = conn.execute("SELECT COUNT(*) FROM outbox WHERE status IN ('queued', 'sending')").fetchone()[0]
+        if pending:
+            # 上次退出前未发送完的消息
+            self._ensure_worker()
+
+    @contextmanager
+    def _connect(self):
+        # 自动提交模式，需要原子认领时显式 BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, from_addr: Address, to_addrs: Sequence[str], subject: str, body: str, is_html=False) -> int:
+        """持久化一条消息并返回投递编号，发送在后台完成；收件人为空或无法解析时立即抛出 ValueError"""
+        to_addrs = check_recipients(to_addrs)
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO outbox (from_addr, to_addrs, subject, body, is_html, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (json.dumps(from_addr, ensure_ascii=False), json.dumps(list(to_addrs), ensure_ascii=False),
+                 subject, body, int(is_html), now, now),
+            )
+            handle = cur.lastrowid
+        self._ensure_worker()
+        self._wake.set()
+        return handle
+
+    def status(self, handle: int) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, to_addrs, subject, status, attempts, last_error, created_at, sent_at FROM outbox WHERE id = ?",
+                (handle,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(row, to_addrs=json.loads(row["to_addrs"]))
+
+    def summary(self) -> Dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return {r[0]: r[1] for r in rows}
+
+    def flush(self, timeout=30.0) -> bool:
+        """等待当前已到期的消息处理完毕，返回是否在超时前清空"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._connect() as conn:
+                due = conn.execute(
+                    "SELECT COUNT(*) FROM outbox WHERE status IN ('queued', 'sending') AND next_attempt_at <= ?",
+                    (time.time(),),
+                ).fetchone()[0]
+            if not due:
+                return True
+            self._wake.set()
+            time.sleep(0.05)
+        return False
+
+    def close(self, timeout=5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stop.clear()
+                self._worker = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+                self._worker.start()
+
+    def _claim(self) -> List[sqlite3.Row]:
+        """认领到期消息；超过租约仍处于 sending 的消息视为发送方已退出，可重新认领"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT * FROM outbox WHERE (status = 'queued' AND next_attempt_at <= ?) "
+                "OR (status = 'sending' AND claimed_at < ?) ORDER BY id LIMIT ?",
+                (now, now - self.lease_s, self.batch_size * 4),
+            ).fetchall()
+            if rows:
+                conn.executemany("UPDATE outbox SET status = 'sending', claimed_at = ? WHERE id = ?",
+                                 [(now, r["id"]) for r in rows])
+            conn.execute("COMMIT")
+        return rows
+
+    def _batches(self, rows: List[sqlite3.Row]) -> List[Tuple[List[int], List[str], sqlite3.Row]]:
+        """内容相同的消息合并发送，每批收件人不超过 batch_size"""
+        groups: Dict[Tuple, List[sqlite3.Row]] = {}
+        for row in rows:
+            groups.setdefault((row["from_addr"], row["subject"], row["body"], row["is_html"]), []).append(row)
+        batches = []
+        for members in groups.values():
+            ids, recipients = [], []
+            for row in members:
+                addrs = json.loads(row["to_addrs"])
+                if ids and len(recipients) + len(addrs) > self.batch_size:
+                    batches.append((ids, recipients, members[0]))
+                    ids, recipients = [], []
+                ids.append(row["id"])
+                recipients.extend(a for a in addrs if a not in recipients)
+            batches.append((ids, recipients, members[0]))
+        return batches
+
+    def _send(self, ids: List[int], recipients: List[str], row: sqlite3.Row):
+        from_addr = json.loads(row["from_addr"])
+        from_addr = tuple(from_addr) if isinstance(from_addr, list) else from_addr
+        try:
+            self.sender.send_email(from_addr, recipients, row["subject"], row["body"], is_html=bool(row["is_html"]))
+        except smtplib.SMTPRecipientsRefused as e:
+            self._refused(ids, e.recipients)
+            return
+        except Exception as e:
+            self._fail(ids, e)
+            return
+        with self._connect() as conn:
+            conn.executemany("UPDATE outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1, last_error = NULL "
+                             "WHERE id = ?", [(time.time(), i) for i in ids])
+
+    def _fail(self, ids: List[int], error: Exception):
+        # 连接可能已失效，下次发送时重建
+        close = getattr(self.sender, "close", None)
+        if close is not None:
+            close()
+        now = time.time()
+        with self._connect() as conn:
+            for i in ids:
+                attempts = conn.execute("SELECT attempts FROM outbox WHERE id = ?", (i,)).fetchone()[0] + 1
+                delay = min(self.base_backoff_s * 2 ** (attempts - 1), self.max_backoff_s)
+                delay += random.uniform(0, delay * 0.1)
+                status = "failed" if attempts >= self.max_attempts else "queued"
+                conn.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (status, attempts, now + delay, f"{type(error).__name__}: {error}", i),
+                )
+
+    def _refused(self, ids: List[int], refused: Dict[str, Tuple[int, bytes]]):
+        """
+        按消息处理被拒绝的收件人：其余收件人已送达，只保留被拒绝的地址；
+        全部为 4xx 临时拒绝时按退避重新排队，有 5xx 永久拒绝时标记为 failed
+        """
+        now = time.time()
+        with self._connect() as conn:
+            for i in ids:
+                row = conn.execute("SELECT to_addrs, attempts FROM outbox WHERE id = ?", (i,)).fetchone()
+                addrs = json.loads(row["to_addrs"])
+                rejected = [a for a in addrs if a in refused]
+                if not rejected:
+                    conn.execute("UPDATE outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1, "
+                                 "last_error = NULL WHERE id = ?", (now, i))
+                    continue
+                attempts = row["attempts"] + 1
+                temporary = all(400 <= refused[a][0] < 500 for a in rejected)
+                status = "queued" if temporary and attempts < self.max_attempts else "failed"
+                delay = min(self.base_backoff_s * 2 ** (attempts - 1), self.max_backoff_s)
+                delay += random.uniform(0, delay * 0.1)
+                reasons = []
+                for a in rejected:
+                    code, reply = refused[a]
+                    reply = reply.decode("utf-8", "replace") if isinstance(reply, bytes) else reply
+                    reasons.append(f"{a} ({code} {reply})")
+                error = "收件人被拒绝：" + "；".join(reasons)
+                if len(rejected) < len(addrs):
+                    error += f"；其余 {len(addrs) - len(rejected)} 人已送达"
+                conn.execute(
+                    "UPDATE outbox SET status = ?, to_addrs = ?, attempts = ?, next_attempt_at = ?, last_error = ? "
+                    "WHERE id = ?",
+                    (status, json.dumps(rejected, ensure_ascii=False), attempts, now + delay, error, i),
+                )
+
+    def _next_due_in(self) -> float:
+        with self._connect() as conn:
+            due = conn.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'queued'").fetchone()[0]
+        if due is None:
+            return self.poll_s
+        return max(0.0, min(due - time.time(), self.poll_s))
+
+    def _run(self):
+        idle_since = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                rows = self._claim()
+                if rows:
+                    for ids, recipients, row in self._batches(rows):
+                        self._send(ids, recipients, row)
+                    idle_since = time.monotonic()
+                    continue
+                if time.monotonic() - idle_since > self.idle_close_s:
+                    close = getattr(self.sender, "close", None)
+                    if close is not None:
+                        close()
+                wait_s = self._next_due_in()
+            except sqlite3.OperationalError as e:
+                # 数据库被锁或暂时不可用时线程不能退出，否则队列无人处理；已认领的消息在租约到期后重新认领
+                print(f"[outbox] 访问发件箱失败，{self.poll_s}s 后重试：{e}")
+                wait_s = self.poll_s
+            self._wake.wait(wait_s)
+            self._wake.clear()
+        close = getattr(self.sender, "close", None)
+        if close is not None:
+            close()
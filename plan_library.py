@@ -0,0 +1,171 @@
+"""
+规划模板库：成功执行的任务链把品类、数据目录、时间间隔、邮箱等槽位替换为占位符后存为参数化模板；
+新请求在本地抽取槽位，骨架与模板完全一致时直接实例化任务链，省去大模型规划；
+无相同骨架的模板或模板成功次数不足时回退到大模型规划器。
+骨架中槽位以外的文字（“大于/小于”“今天/昨天”等）决定请求含义，只差一个字也可能是相反的操作，因此不做模糊匹配
+"""
+import json
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from singleflight import normalize_text
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plan_templates (
+    skeleton TEXT PRIMARY KEY,
+    chain TEXT NOT NULL,
+    successes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+DEFAULT_FRUITS = (
+    "苹果", "梨", "香蕉", "橙子", "橘子", "砂糖橘", "柑橘", "沃柑", "柚子", "柠檬", "葡萄", "提子", "草莓", "蓝莓",
+    "樱桃", "车厘子", "桃子", "油桃", "水蜜桃", "李子", "芒果", "菠萝", "凤梨", "荔枝", "龙眼", "桂圆", "猕猴桃",
+    "奇异果", "火龙果", "西瓜", "哈密瓜", "甜瓜", "木瓜", "石榴", "柿子", "红枣", "山竹", "榴莲", "椰子",
+    "番茄", "西红柿", "黄瓜", "土豆", "马铃薯", "胡萝卜", "白菜", "生菜", "菠菜", "茄子", "辣椒", "青椒", "洋葱",
+    "南瓜", "西兰花",
+)
+
+_EMAIL = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)+")
+_PATH = re.compile(r"(?:[A-Za-z]:)?(?:[A-Za-z0-9_.\-]+[\\/])+[A-Za-z0-9_.\-]+")
+_INTERVAL = re.compile(r"\d+(?:\.\d+)?\s*个?(?:秒钟|秒|分钟|小时|天|周|星期)")
+_PLACEHOLDER = re.compile(r"\{([a-z]+\d+)\}")
+# 骨架中不影响含义的空白与标点
+_NOISE = re.compile(r"[\s，。！？；、,!?;]+")
+
+
+@lru_cache(maxsize=16)
+def _vocabulary(words: Tuple[str, ...]) -> Optional["re.Pattern"]:
+    # 长词优先，避免“砂糖橘”被拆成其他词
+    words = sorted({w for w in words if w}, key=len, reverse=True)
+    return re.compile("|".join(map(re.escape, words))) if words else None
+
+
+def extract_slots(text: str, fruits: Iterable[str] = DEFAULT_FRUITS,
+                  directories: Iterable[str] = ()) -> Tuple[str, Dict[str, str]]:
+    """返回 (骨架, 槽位)：骨架中各槽位替换为 {email0}、{path0}、{dir0}、{interval0}、{fruit0} 形式的占位符"""
+    slots: Dict[str, str] = {}
+    skeleton = text or ""
+    patterns = [("email", _EMAIL), ("path", _PATH), ("dir", _vocabulary(tuple(directories))),
+                ("interval", _INTERVAL), ("fruit", _vocabulary(tuple(fruits)))]
+    for kind, pattern in patterns:
+        if pattern is None:
+            continue
+
+        def placeholder(match, kind=kind):
+            value = match.group(0)
+            # 同一取值多次出现时使用同一个占位符
+            for name, known in slots.items():
+                if known == value and name.rstrip("0123456789") == kind:
+                    return "{" + name + "}"
+            name = f"{kind}{sum(n.rstrip('0123456789') == kind for n in slots)}"
+            slots[name] = value
+            return "{" + name + "}"
+
+        skeleton = pattern.sub(placeholder, skeleton)
+    return _NOISE.sub("", normalize_text(skeleton)), slots
+
+
+def instantiate(chain: List[str], slots: Dict[str, str]) -> Optional[List[str]]:
+    """用槽位取值填充模板；模板中有请求未提供的槽位时返回 None"""
+    if any(name not in slots for item in chain for name in _PLACEHOLDER.findall(item)):
+        return None
+    return [_PLACEHOLDER.sub(lambda m: slots[m.group(1)], item) for item in chain]
+
+
+class PlanLibrary:
+    """
+    min_successes: 模板须由规划器以相同的任务链成功执行过若干次才会被使用；
+    使用模板的轮次失败时成功计数清零，由规划器重新规划并学习
+    """
+
+    def __init__(self, path: str, min_successes=2, enabled=True):
+        self.path = path
+        self.min_successes = min_successes
+        self.enabled = enabled
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def match(self, skeleton: str, slots: Dict[str, str]) -> Optional[Dict]:
+        """返回 {"skeleton", "chain"}，chain 已用槽位实例化；无可用模板时返回 None"""
+        if not self.enabled:
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT chain FROM plan_templates WHERE skeleton = ? AND successes >= ?",
+                (skeleton, self.min_successes),
+            ).fetchone()
+            if row is None:
+                return None
+            chain = instantiate(json.loads(row["chain"]), slots)
+            if chain is None:
+                return None
+            conn.execute("UPDATE plan_templates SET hits = hits + 1 WHERE skeleton = ?", (skeleton,))
+        return {"skeleton": skeleton, "chain": chain}
+
+    def learn(self, skeleton: str, slots: Dict[str, str], chain: List[str],
+              fruits: Iterable[str] = DEFAULT_FRUITS, directories: Iterable[str] = ()) -> bool:
+        """
+        记录规划器给出且成功执行的任务链。链中出现的槽位取值替换为占位符；替换后仍含槽位类取值
+        （如请求中没有的品类、换算过的时间间隔）的链无法安全复用，不记录
+        """
+        if not self.enabled or not chain:
+            return False
+        template = []
+        for item in chain:
+            for name, value in sorted(slots.items(), key=lambda kv: len(kv[1]), reverse=True):
+                item = item.replace(value, "{" + name + "}")
+            template.append(item)
+        if any(extract_slots(_PLACEHOLDER.sub("", item), fruits, directories)[1] for item in template):
+            return False
+        payload = json.dumps(template, ensure_ascii=False)
+        now = time.time()
+        with self._connect() as conn:
+            # 规划器对同一骨架给出不同的任务链时以最新的为准，成功计数重新开始
+            conn.execute(
+                "INSERT INTO plan_templates (skeleton, chain, successes, created_at, updated_at) "
+                "VALUES (?, ?, 1, ?, ?) "
+                "ON CONFLICT(skeleton) DO UPDATE SET "
+                "successes = CASE WHEN chain = excluded.chain THEN successes + 1 ELSE 1 END, "
+                "failures = CASE WHEN chain = excluded.chain THEN failures ELSE 0 END, "
+                "chain = excluded.chain, updated_at = excluded.updated_at",
+                (skeleton, payload, now, now),
+            )
+        return True
+
+    def settle(self, skeleton: str, ok: bool):
+        """记录使用模板的轮次结果"""
+        with self._connect() as conn:
+            if ok:
+                conn.execute("UPDATE plan_templates SET successes = successes + 1, updated_at = ? WHERE skeleton = ?",
+                             (time.time(), skeleton))
+            else:
+                conn.execute("UPDATE plan_templates SET successes = 0, failures = failures + 1, updated_at = ? "
+                             "WHERE skeleton = ?", (time.time(), skeleton))
+
+    def summary(self) -> Dict:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) AS templates, COALESCE(SUM(successes >= ?), 0) AS active, "
+                "COALESCE(SUM(hits), 0) AS hits, COALESCE(SUM(failures), 0) AS failures FROM plan_templates",
+                (self.min_successes,),
+            ).fetchone()
+        return dict(row)
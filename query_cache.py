@@ -0,0 +1,153 @@
+"""
+只读 SQL 的结果缓存：以规范化后的 SQL（去注释、压缩空白、关键字大写）与参数为键，
+按表建立反向索引，经由 Agent 的写操作按表失效；TTL 兜底外部写入
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sql_lexer import table_refs, tokenize
+
+# 结果随时间或会话变化的函数，含这些函数的查询不缓存
+NONDETERMINISTIC = {
+    "NOW", "RAND", "UUID", "UUID_SHORT", "SYSDATE", "CURDATE", "CURTIME", "CURRENT_DATE", "CURRENT_TIME",
+    "CURRENT_TIMESTAMP", "LOCALTIME", "LOCALTIMESTAMP", "UNIX_TIMESTAMP", "UTC_DATE", "UTC_TIME",
+    "UTC_TIMESTAMP", "LAST_INSERT_ID", "FOUND_ROWS", "ROW_COUNT", "CONNECTION_ID", "USER", "DATABASE",
+}
+
+
+def normalize(sql: str) -> Tuple[str, List[str]]:
+    """
+    返回 (规范化 SQL, 引用的表名)。表名保留大小写（MySQL 在 Linux 下区分），其余单词统一大写；
+    含非确定性函数时规范化 SQL 为空串，表示不可缓存
+    """
+    tokens = tokenize(sql.strip().rstrip(";"))
+    refs = set(table_refs(tokens))
+    parts = []
+    for i, t in enumerate(tokens):
+        if not t.significant:
+            continue
+        if t.kind == "word" and i not in refs:
+            if t.upper in NONDETERMINISTIC:
+                return "", []
+            parts.append(t.upper)
+        else:
+            parts.append(t.value)
+    return " ".join(parts), list(dict.fromkeys(tokens[i].name for i in sorted(refs)))
+
+
+class QueryCache:
+    """
+    max_entries: LRU 容量，0 表示关闭缓存
+    ttl_s:       条目存活时间，用于兜底未经 Agent 的外部写入
+    """
+
+    def __init__(self, max_entries=256, ttl_s=60.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict], List[str]]]" = OrderedDict()
+        self._by_table: Dict[str, set] = {}
+        # 每张表的写入代数：查询执行期间表被写过时，结果可能早于写入，不应存入缓存
+        self._generations: Dict[str, int] = {}
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0, "expirations": 0, "evictions": 0,
+                       "stale_puts": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def key(self, sql: str, params=None, database: Optional[str] = None) -> Optional[Tuple[str, List[str]]]:
+        """返回 (缓存键, 涉及的表)；不可缓存时返回 None"""
+        normalized, tables = normalize(sql)
+        if not normalized:
+            return None
+        key = json.dumps([database, normalized, params], ensure_ascii=False, default=str, sort_keys=True)
+        return key, tables
+
+    def generation(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        """查询前记录涉及各表的写入代数，执行后随结果传给 put"""
+        with self._lock:
+            return tuple(self._generations.get(t.lower(), 0) for t in tables)
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            stored_at, rows, _ = entry
+            if self.ttl_s and time.monotonic() - stored_at > self.ttl_s:
+                self._drop(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return list(rows)
+
+    def put(self, key: str, rows: List[Dict], tables: Iterable[str], generation: Optional[Tuple[int, ...]] = None):
+        """generation 为查询前 generation() 的返回值；其后任一表被失效过时丢弃这次结果"""
+        if not self.enabled:
+            return
+        tables = [t.lower() for t in tables]
+        with self._lock:
+            if generation is not None and generation != tuple(self._generations.get(t, 0) for t in tables):
+                self._stats["stale_puts"] += 1
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic(), list(rows), tables)
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self, tables: Iterable[str]) -> int:
+        """使引用了任一表的条目失效，返回失效条目数"""
+        dropped = 0
+        with self._lock:
+            for table in tables:
+                self._generations[table.lower()] = self._generations.get(table.lower(), 0) + 1
+                for key in list(self._by_table.get(table.lower(), ())):
+                    self._drop(key)
+                    dropped += 1
+            self._stats["invalidations"] += dropped
+        return dropped
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for table in entry[2]:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def summary(self) -> Dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                hit_rate=round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            )
+
+
+query_cache = QueryCache(
+    max_entries=int(os.getenv("AGENT_SQL_CACHE_SIZE", "256")),
+    ttl_s=float(os.getenv("AGENT_SQL_CACHE_TTL", "60")),
+)
@@ -0,0 +1,85 @@
+"""
+生产部署入口：uvicorn 接收连接，Flask 应用经 a2wsgi 在有界线程池中执行——本质上仍是多线程的 Flask，
+并不是异步应用（智能体轮次以阻塞 I/O 为主）；图像分割等 CPU 任务交给 cpu_pool 的独立进程。
+
+    pip install uvicorn a2wsgi
+    AGENT_HTTP_WORKERS=4 AGENT_CPU_WORKERS=2 python serve.py
+
+智能体池与设备采集在 worker 的生命周期启动阶段创建（api_server.startup）；
+收到 SIGTERM/SIGINT 后 uvicorn 停止接收连接，生命周期关闭阶段调用 api_server.shutdown
+"""
+import asyncio
+import os
+from typing import Callable
+
+
+class Lifespan:
+    """为 WSGI 适配后的应用补上 ASGI 生命周期事件，HTTP 请求原样转交"""
+
+    def __init__(self, app, on_startup: Callable[[], None], on_shutdown: Callable[[], None]):
+        self.app = app
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "lifespan":
+            return await self.app(scope, receive, send)
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await loop.run_in_executor(None, self.on_startup)
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": f"{type(e).__name__}: {e}"})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await loop.run_in_executor(None, self.on_shutdown)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_app():
+    # 由 uvicorn 在每个 worker 进程中调用；导入 api_server 不创建智能体，startup 在生命周期启动阶段执行
+    from a2wsgi import WSGIMiddleware
+
+    import api_server
+
+    threads = int(os.getenv("AGENT_HTTP_THREADS", "0")) or int(os.getenv("AGENT_POOL_SIZE", "2")) + 8
+    return Lifespan(WSGIMiddleware(api_server.app, workers=threads), api_server.startup, api_server.shutdown)
+
+
+def check_workers(workers: int):
+    """串口只能被一个进程打开，多个 worker 会互相抢占同一端口"""
+    from devices import devices
+
+    serial = devices.serial_names()
+    if workers > 1 and serial:
+        raise SystemExit(
+            f"AGENT_HTTP_WORKERS={workers} 时不能配置串口设备（{', '.join(serial)}）；"
+            "请改为单个 worker，或从 AGENT_DEVICES 中移除串口设备"
+        )
+
+
+def main():
+    import uvicorn
+
+    workers = int(os.getenv("AGENT_HTTP_WORKERS", "1"))
+    check_workers(workers)
+    # 未显式配置时，CPU 工作进程数按 HTTP worker 数均分核心
+    os.environ.setdefault("AGENT_CPU_WORKERS", str(max((os.cpu_count() or 2) // workers - 1, 1)))
+    uvicorn.run(
+        "serve:create_app",
+        factory=True,
+        lifespan="on",
+        host=os.getenv("AGENT_HTTP_HOST", "127.0.0.1"),
+        port=int(os.getenv("AGENT_HTTP_PORT", "8000")),
+        workers=workers,
+        timeout_graceful_shutdown=int(os.getenv("AGENT_SHUTDOWN_GRACE", "30")),
+        log_level=os.getenv("AGENT_LOG_LEVEL", "info"),
+    )
+
+
+if __name__ == "__main__":
+    main()
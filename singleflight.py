@@ -0,0 +1,101 @@
+"""
+请求合并（single-flight）：相同键的并发调用只执行一次，其余调用等待并共享同一结果；
+用于工具分发与大模型调用，多个操作员或周期任务同时发起相同请求时节省重复的模型调用、图像处理与查询
+"""
+import hashlib
+import json
+import threading
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from cancellation import Cancelled
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    private_errors: 只属于执行者本身的异常（如执行者的轮次被取消），
+      不传递给等待者，等待者改为自行执行
+    """
+
+    def __init__(self, private_errors: Tuple = (Cancelled,)):
+        self.private_errors = private_errors
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, namespace: str, field: str):
+        stats = self._stats.setdefault(namespace, {"calls": 0, "executed": 0, "shared": 0, "errors": 0})
+        stats[field] += 1
+
+    def do(self, namespace: str, key: Hashable, fn: Callable[[], object], cancel=None) -> Tuple[object, bool]:
+        """
+        返回 (结果, 是否共享了他人的执行)。cancel 为等待者的 CancelToken，
+        等待期间取消只影响自身，不影响正在执行的调用
+        """
+        full_key = (namespace, key)
+        while True:
+            with self._lock:
+                flight = self._flights.get(full_key)
+                if flight is None:
+                    flight = self._flights[full_key] = _Flight()
+                    leader = True
+                    self._count(namespace, "calls")
+                    self._count(namespace, "executed")
+                else:
+                    leader = False
+                    flight.waiters += 1
+            if leader:
+                return self._lead(namespace, full_key, flight, fn), False
+            while not flight.done.wait(0.05):
+                if cancel is not None:
+                    cancel.check()
+            if isinstance(flight.error, self.private_errors):
+                continue
+            with self._lock:
+                self._count(namespace, "calls")
+                self._count(namespace, "shared")
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+
+    def _lead(self, namespace: str, full_key, flight: _Flight, fn: Callable[[], object]):
+        try:
+            flight.value = fn()
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            if not isinstance(e, self.private_errors):
+                with self._lock:
+                    self._count(namespace, "errors")
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(full_key, None)
+            flight.done.set()
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                namespace: dict(stats, in_flight=sum(1 for k in self._flights if k[0] == namespace))
+                for namespace, stats in self._stats.items()
+            }
+
+
+def normalize_text(text) -> str:
+    return " ".join(str(text or "").split()).casefold()
+
+
+def fingerprint(payload) -> str:
+    """任意 JSON 可序列化对象的稳定摘要，用作合并键"""
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=repr)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+flights = SingleFlight()
@@ -0,0 +1,81 @@
+"""
+推测执行：在规划类大模型调用进行时，提前为下一个待处理元任务执行廉价、幂等的准备工作
+（表名预热、数据目录解析、本地知识库检索等）。真实调用到来时按键取用结果，未被取用的结果在轮次结束时丢弃
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Hashable, List, Tuple
+
+from tracing import tracer
+
+MISS = object()
+
+
+class Speculator:
+    def __init__(self, max_workers=1):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculate")
+        self._lock = threading.Lock()
+        self._pending: Dict[Hashable, Tuple[Future, float]] = {}
+        self._draining: List[Future] = []
+        self._stats = {"started": 0, "hits": 0, "misses": 0, "discarded": 0, "errors": 0, "saved_ms": 0.0}
+
+    def start(self, key: Hashable, fn: Callable[[], object]) -> bool:
+        """提交推测任务；同一键已在进行时不重复提交"""
+        with self._lock:
+            if key in self._pending:
+                return False
+            future = self._executor.submit(self._timed, tracer.wrap(fn))
+            self._pending[key] = (future, time.perf_counter())
+            self._stats["started"] += 1
+        return True
+
+    @staticmethod
+    def _timed(fn: Callable[[], object]):
+        start = time.perf_counter()
+        return fn(), (time.perf_counter() - start) * 1000
+
+    def take(self, key: Hashable, timeout: float = None):
+        """取用推测结果（仍在执行时等待其完成）；不存在或执行出错时返回 MISS，由调用方自行计算"""
+        with self._lock:
+            entry = self._pending.pop(key, None)
+        if entry is None:
+            with self._lock:
+                self._stats["misses"] += 1
+            return MISS
+        future, _ = entry
+        waited = time.perf_counter()
+        try:
+            value, duration_ms = future.result(timeout)
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            return MISS
+        # 节省的时间 = 推测任务总耗时 - 取用时仍需等待的时间
+        saved = max(duration_ms - (time.perf_counter() - waited) * 1000, 0.0)
+        with self._lock:
+            self._stats["hits"] += 1
+            self._stats["saved_ms"] += saved
+        return value
+
+    def discard(self):
+        """丢弃未被取用的结果：尚未开始的任务撤回，已在执行的任务不等待，由下一次 drain 收尾"""
+        with self._lock:
+            entries = list(self._pending.values())
+            self._pending.clear()
+            self._stats["discarded"] += len(entries)
+        running = [future for future, _ in entries if not future.cancel()]
+        with self._lock:
+            self._draining = [f for f in self._draining if not f.done()] + running
+
+    def drain(self, timeout: float = None):
+        """等待被丢弃但仍在执行的任务结束；下一轮次访问同一资源（如数据库连接）之前调用"""
+        with self._lock:
+            draining, self._draining = self._draining, []
+        if draining:
+            wait(draining, timeout)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, saved_ms=round(self._stats["saved_ms"], 1), in_flight=len(self._pending),
+                        draining=sum(not f.done() for f in self._draining))
@@ -0,0 +1,189 @@
+"""
+多语句 SQL 批量执行：将已通过校验的语句规划为执行步骤（连续的同构 INSERT 合并为一次 executemany），
+在同一连接、同一事务内依次执行，任一语句失败则整体回滚，并按原语句顺序返回各自结果
+"""
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cancellation import Cancelled
+from sql_lexer import Token, significant, tokenize
+
+_HEAD_KEYWORDS = {"INSERT", "REPLACE", "IGNORE", "INTO", "VALUES", "VALUE"}
+_ESCAPES = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+
+
+class BatchStep:
+    """
+    sql:     实际执行的语句；params 非空时为带 %s 占位符的模板，以 executemany 执行
+    sources: 该步骤覆盖的原语句序号
+    counts:  executemany 时每条原语句提供的行数
+    """
+
+    def __init__(self, sql: str, sources: List[int], params: Optional[List[Tuple]] = None,
+                 counts: Optional[List[int]] = None):
+        self.sql = sql
+        self.sources = sources
+        self.params = params
+        self.counts = counts or []
+
+
+def _unquote(value: str) -> str:
+    quote, body = value[0], value[1:-1]
+    out, i = [], 0
+    while i < len(body):
+        ch = body[i]
+        if ch == "\\" and i + 1 < len(body):
+            nxt = body[i + 1]
+            # MySQL 中 \% 与 \_ 保留反斜杠
+            out.append(_ESCAPES.get(nxt, "\\" + nxt if nxt in "%_" else nxt))
+            i += 2
+        elif ch == quote and body[i + 1:i + 2] == quote:
+            out.append(quote)
+            i += 2
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+
+def _literal(tokens: List[Token]):
+    """单个字面量（字符串 / 数字 / 负数 / NULL / TRUE / FALSE）转为 Python 值，否则抛出 ValueError"""
+    if len(tokens) == 2 and tokens[0].value == "-" and tokens[1].kind == "number":
+        return -_number(tokens[1].value)
+    if len(tokens) != 1:
+        raise ValueError
+    t = tokens[0]
+    if t.kind == "string":
+        return _unquote(t.value)
+    if t.kind == "number":
+        return _number(t.value)
+    if t.kind == "word" and t.upper in ("NULL", "TRUE", "FALSE"):
+        return {"NULL": None, "TRUE": 1, "FALSE": 0}[t.upper]
+    raise ValueError
+
+
+def _number(value: str):
+    return float(value) if "." in value else int(value)
+
+
+def parametrize_insert(sql: str) -> Optional[Tuple[str, List[Tuple]]]:
+    """
+    将只含字面量的 INSERT ... VALUES (...), (...) 拆为 (带 %s 占位符的模板, 参数行)，
+    含表达式、子查询或 ON DUPLICATE KEY 等无法参数化时返回 None
+    """
+    sig = significant(tokenize(sql))
+    if not sig or sig[0].upper not in ("INSERT", "REPLACE"):
+        return None
+    values_at = next((i for i, t in enumerate(sig) if t.kind == "word" and t.upper in ("VALUES", "VALUE")
+                      and t.depth == 0), None)
+    if values_at is None:
+        return None
+    # 关键字统一大小写，使写法不同的同表 INSERT 也能合并
+    head = " ".join(t.upper if t.upper in _HEAD_KEYWORDS else t.value for t in sig[:values_at + 1])
+
+    rows, i = [], values_at + 1
+    while i < len(sig):
+        if sig[i].value != "(" or sig[i].depth != 0:
+            return None
+        row, item, i = [], [], i + 1
+        while i < len(sig) and not (sig[i].value == ")" and sig[i].depth == 0):
+            if sig[i].value == "," and sig[i].depth == 1:
+                row.append(item)
+                item = []
+            else:
+                item.append(sig[i])
+            i += 1
+        if i >= len(sig):
+            return None
+        row.append(item)
+        try:
+            rows.append(tuple(_literal(v) for v in row))
+        except ValueError:
+            return None
+        i += 1
+        if i < len(sig):
+            if sig[i].value != ",":
+                return None
+            i += 1
+    if not rows or len({len(r) for r in rows}) != 1:
+        return None
+    return f"{head} ({', '.join(['%s'] * len(rows[0]))})", rows
+
+
+def plan_batch(statements: List[str]) -> List[BatchStep]:
+    """连续且模板相同的 INSERT 合并为一个 executemany 步骤，其余语句各占一步"""
+    steps: List[BatchStep] = []
+    for idx, sql in enumerate(statements):
+        parsed = parametrize_insert(sql)
+        if parsed is None:
+            steps.append(BatchStep(sql, [idx]))
+            continue
+        template, rows = parsed
+        last = steps[-1] if steps else None
+        if last is not None and last.params is not None and last.sql == template:
+            last.sources.append(idx)
+            last.params.extend(rows)
+            last.counts.append(len(rows))
+        else:
+            steps.append(BatchStep(template, [idx], list(rows), [len(rows)]))
+    return steps
+
+
+def _fetch_dicts(cursor) -> List[Dict]:
+    rows = cursor.fetchall()
+    names = [d[0] for d in cursor.description]
+    return [r if isinstance(r, dict) else dict(zip(names, r)) for r in rows]
+
+
+def run_batch(transaction: Callable, steps: List[BatchStep], count: int,
+              cancel=None) -> Tuple[List, Optional[Tuple[List[int], str]]]:
+    """
+    transaction() 返回产出 DB-API 连接的上下文管理器；所有步骤在其中执行后提交
+    cancel 为 CancelToken 时在每一步之前检查，取消则回滚并抛出 Cancelled
+    返回 (按原语句顺序的结果列表, 失败信息)；失败信息为 (失败步骤覆盖的语句序号, 错误)，此时事务已回滚
+    """
+    results: List = [None] * count
+    with transaction() as conn:
+        cursor = conn.cursor()
+        step = None
+        try:
+            for step in steps:
+                if cancel is not None:
+                    cancel.check()
+                if step.params is not None:
+                    cursor.executemany(step.sql, step.params)
+                    for src, n in zip(step.sources, step.counts):
+                        results[src] = n
+                else:
+                    cursor.execute(step.sql)
+                    results[step.sources[0]] = _fetch_dicts(cursor) if cursor.description else cursor.rowcount
+            conn.commit()
+        except Cancelled:
+            conn.rollback()
+            raise
+        except Exception as e:
+            conn.rollback()
+            return results, (step.sources if step is not None else [], str(e))
+    return results, None
+
+
+@contextmanager
+def mysql_transaction(db_config: Dict):
+    """DBHandler 未提供事务接口时按 db_config 直连 MySQL"""
+    import pymysql
+    import pymysql.cursors
+
+    conn = pymysql.connect(
+        host=db_config.get("host", "localhost"),
+        port=int(db_config.get("port") or 3306),
+        user=db_config.get("user"),
+        password=db_config.get("password", ""),
+        database=db_config.get("database"),
+        charset=db_config.get("charset", "utf8mb4"),
+        cursorclass=pymysql.cursors.DictCursor,
+        autocommit=False,
+    )
+    try:
+        yield conn
+    finally:
+        conn.close()
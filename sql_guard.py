@@ -0,0 +1,150 @@
+"""
+LLM 生成 SQL 的执行前检查：语句分类与危险操作拦截、SELECT 的 LIMIT 注入/收紧、
+MAX_EXECUTION_TIME 超时 hint，以及基于 EXPLAIN 的扫描行数估计与阈值拦截
+"""
+import os
+from typing import Callable, Dict, List, Optional
+
+from sql_lexer import Token, locking_clause, main_keyword, render, significant, tokenize
+
+READ_TYPES = {"SELECT", "WITH", "SHOW", "DESC", "DESCRIBE", "EXPLAIN"}
+WRITE_TYPES = {"INSERT", "UPDATE", "DELETE", "REPLACE"}
+DDL_TYPES = {"CREATE", "ALTER"}
+# 整条语句禁止执行的类型与关键字/函数
+BLOCKED_TYPES = {"DROP", "TRUNCATE", "GRANT", "REVOKE", "SHUTDOWN", "KILL", "LOAD", "SET", "USE", "FLUSH", "RENAME"}
+BLOCKED_WORDS = {"OUTFILE", "DUMPFILE", "SLEEP", "BENCHMARK", "LOAD_FILE"}
+
+
+class SQLVerdict:
+    def __init__(self, allowed: bool, sql: str, statement_type: Optional[str], reason="",
+                 estimated_rows: Optional[int] = None, needs_confirm=False, locking=False):
+        self.allowed = allowed
+        self.sql = sql
+        self.statement_type = statement_type
+        self.reason = reason
+        self.estimated_rows = estimated_rows
+        self.needs_confirm = needs_confirm
+        # SELECT ... FOR UPDATE 等加锁读取：有副作用，不缓存、不合并
+        self.locking = locking
+
+    @property
+    def read_only(self) -> bool:
+        return self.statement_type in READ_TYPES and not self.locking
+
+
+class SQLGuard:
+    """
+    max_rows:        SELECT 返回行数上限，缺少 LIMIT 时自动注入，超出时收紧
+    max_scan_rows:   EXPLAIN 估计扫描行数的上限，超出时按 on_exceed 处理（reject 拒绝 / confirm 交由调用方确认）
+    timeout_ms:      注入到 SELECT 的 MAX_EXECUTION_TIME（毫秒），0 表示不注入
+    """
+
+    def __init__(self, max_rows=1000, max_scan_rows=1_000_000, timeout_ms=5000, on_exceed="reject", explain=True):
+        self.max_rows = max_rows
+        self.max_scan_rows = max_scan_rows
+        self.timeout_ms = timeout_ms
+        self.on_exceed = on_exceed
+        self.explain = explain
+
+    def check(self, sql: str, explain_fn: Optional[Callable[[str], object]] = None,
+              timeout_ms: Optional[int] = None) -> SQLVerdict:
+        tokens = tokenize(sql.strip().rstrip(";").strip())
+        sig = significant(tokens)
+        # WITH ... DELETE 等按主语句分类，WHERE 规则与只读判断都针对主语句
+        stype = main_keyword(sig)
+        if not sig or stype is None:
+            return SQLVerdict(False, sql, stype, "无法识别的SQL语句")
+        if any(t.value == ";" for t in sig):
+            return SQLVerdict(False, sql, stype, "单条执行中不允许包含多条语句")
+        if stype in BLOCKED_TYPES:
+            return SQLVerdict(False, sql, stype, f"禁止执行 {stype} 操作")
+        blocked = {t.upper for t in sig if t.kind == "word"} & BLOCKED_WORDS
+        if blocked:
+            return SQLVerdict(False, sql, stype, f"禁止使用 {', '.join(sorted(blocked))}")
+        if stype in ("UPDATE", "DELETE") and not any(t.kind == "word" and t.upper == "WHERE" and t.depth == 0 for t in sig):
+            return SQLVerdict(False, sql, stype, f"{stype} 必须带 WHERE 条件")
+        if stype not in READ_TYPES | WRITE_TYPES | DDL_TYPES:
+            return SQLVerdict(False, sql, stype, f"不支持的语句类型 {stype}")
+
+        locking = locking_clause(sig) is not None
+        if stype in ("SELECT", "WITH"):
+            tokens = self._enforce_limit(tokens)
+        rewritten = render(tokens).strip()
+
+        estimated = None
+        if self.explain and explain_fn is not None and stype in ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT", "REPLACE"):
+            estimated = self.estimate_rows(explain_fn(f"EXPLAIN {rewritten}"))
+            if estimated is not None and self.max_scan_rows and estimated > self.max_scan_rows:
+                reason = f"预计扫描 {estimated} 行，超过阈值 {self.max_scan_rows}"
+                if self.on_exceed == "confirm":
+                    return SQLVerdict(True, self._with_timeout(rewritten, stype, timeout_ms), stype, reason,
+                                      estimated, needs_confirm=True, locking=locking)
+                return SQLVerdict(False, sql, stype, reason, estimated, locking=locking)
+
+        return SQLVerdict(True, self._with_timeout(rewritten, stype, timeout_ms), stype, "", estimated, locking=locking)
+
+    def _enforce_limit(self, tokens: List[Token]) -> List[Token]:
+        if not self.max_rows:
+            return tokens
+        sig_idx = [i for i, t in enumerate(tokens) if t.significant]
+        for pos, i in enumerate(sig_idx):
+            t = tokens[i]
+            if t.kind == "word" and t.upper == "LIMIT" and t.depth == 0:
+                following = [tokens[j] for j in sig_idx[pos + 1:pos + 4]]
+                # LIMIT n / LIMIT offset, n / LIMIT n OFFSET m：行数所在位置不同
+                if len(following) >= 3 and following[1].value == ",":
+                    count_token = following[2]
+                else:
+                    count_token = following[0] if following else None
+                if count_token is not None and count_token.kind == "number" and int(float(count_token.value)) > self.max_rows:
+                    idx = tokens.index(count_token)
+                    tokens = tokens[:idx] + [Token("number", str(self.max_rows), 0)] + tokens[idx + 1:]
+                return tokens
+        # 插在最后一个有效 token 之后，避免落入行尾注释；有 FOR UPDATE / LOCK IN SHARE MODE 等锁定子句时插在其前
+        last = sig_idx[-1] + 1 if sig_idx else len(tokens)
+        lock_at = locking_clause([tokens[i] for i in sig_idx])
+        if lock_at:
+            last = sig_idx[lock_at - 1] + 1
+        limit = [Token("ws", " ", 0), Token("word", "LIMIT", 0), Token("ws", " ", 0),
+                 Token("number", str(self.max_rows), 0)]
+        return tokens[:last] + limit + tokens[last:]
+
+    def _with_timeout(self, sql: str, stype: str, timeout_ms: Optional[int]) -> str:
+        timeout = self.timeout_ms if timeout_ms is None else timeout_ms
+        if not timeout or stype != "SELECT":
+            return sql
+        tokens = tokenize(sql)
+        for i, t in enumerate(tokens):
+            if t.kind == "word" and t.upper == "SELECT":
+                hint = Token("comment", f" /*+ MAX_EXECUTION_TIME({int(timeout)}) */", 0)
+                return render(tokens[:i + 1] + [hint] + tokens[i + 1:])
+        return sql
+
+    @staticmethod
+    def estimate_rows(plan) -> Optional[int]:
+        """
+        根据 EXPLAIN 结果估计扫描行数：同一 select id 内的表按嵌套循环连接相乘，不同 id 之间相加
+        """
+        if not isinstance(plan, list) or not plan:
+            return None
+        per_select: Dict[object, float] = {}
+        for row in plan:
+            if not isinstance(row, dict) or row.get("rows") is None:
+                continue
+            rows = float(row["rows"])
+            filtered = float(row.get("filtered") or 100.0) / 100.0
+            key = row.get("id", 1)
+            # 驱动表取全部扫描行数，被驱动表按过滤比例计入
+            per_select[key] = per_select[key] * max(rows * filtered, 1.0) if key in per_select else rows
+        if not per_select:
+            return None
+        return int(sum(per_select.values()))
+
+
+def guard_from_env() -> SQLGuard:
+    return SQLGuard(
+        max_rows=int(os.getenv("AGENT_SQL_MAX_ROWS", "1000")),
+        max_scan_rows=int(os.getenv("AGENT_SQL_MAX_SCAN_ROWS", "1000000")),
+        timeout_ms=int(os.getenv("AGENT_SQL_TIMEOUT_MS", "5000")),
+        on_exceed=os.getenv("AGENT_SQL_ON_EXCEED", "reject"),
+    )
@@ -0,0 +1,222 @@
+"""
+轻量 SQL 词法分析：一次正则扫描切分为带括号深度的 token，供安全校验、改写等模块复用
+不做完整语法分析，只识别字符串、注释、标识符、数字与标点
+"""
+import re
+from typing import List, NamedTuple, Optional
+
+_TOKEN = re.compile(
+    r"""
+     (?P<ws>\s+)
+    |(?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+    |(?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    |(?P<quoted>`(?:[^`]|``)*`)
+    |(?P<number>\d+(?:\.\d+)?(?![\w]))
+    |(?P<word>\w+)
+    |(?P<punct>[(),;.])
+    |(?P<op><=|>=|<>|!=|:=|[-+*/%=<>@:?!|&^~])
+    |(?P<other>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+class Token(NamedTuple):
+    kind: str
+    value: str
+    depth: int
+
+    @property
+    def upper(self) -> str:
+        return self.value.upper() if self.kind == "word" else self.value
+
+    @property
+    def name(self) -> str:
+        """标识符的名称（去除反引号）"""
+        if self.kind == "quoted":
+            return self.value[1:-1].replace("``", "`")
+        return self.value
+
+    @property
+    def significant(self) -> bool:
+        return self.kind not in ("ws", "comment")
+
+
+def tokenize(sql: str) -> List[Token]:
+    tokens = []
+    depth = 0
+    for m in _TOKEN.finditer(sql or ""):
+        kind, value = m.lastgroup, m.group()
+        if value == ")":
+            depth = max(0, depth - 1)
+        tokens.append(Token(kind, value, depth))
+        if value == "(":
+            depth += 1
+    return tokens
+
+
+def significant(tokens: List[Token]) -> List[Token]:
+    return [t for t in tokens if t.significant]
+
+
+def render(tokens: List[Token]) -> str:
+    return "".join(t.value for t in tokens)
+
+
+def strip_comments(sql: str) -> str:
+    return render([t for t in tokenize(sql) if t.kind != "comment"]).strip()
+
+
+# 其后紧跟表名的关键字；TABLE 覆盖 CREATE / ALTER / DROP / TRUNCATE TABLE
+_TABLE_KEYWORDS = {"FROM", "JOIN", "INTO", "UPDATE", "TABLE", "DESC", "DESCRIBE"}
+_SKIP_AFTER_TABLE = {"IF", "NOT", "EXISTS", "IGNORE", "LOW_PRIORITY", "TEMPORARY"}
+# 不会作为表别名出现的关键字
+_CLAUSE_WORDS = {
+    "WHERE", "JOIN", "LEFT", "RIGHT", "INNER", "OUTER", "CROSS", "NATURAL", "STRAIGHT_JOIN", "ON", "USING",
+    "GROUP", "ORDER", "HAVING", "LIMIT", "UNION", "EXCEPT", "INTERSECT", "SET", "VALUES", "VALUE", "SELECT",
+    "WINDOW", "FOR", "LOCK", "PARTITION", "FORCE", "USE", "IGNORE", "INTO", "WITH", "AS", "LIKE",
+}
+
+
+def _cte_names(sig: List[Token]) -> set:
+    """WITH name AS (...), name2 AS (...) 中定义的公用表表达式名称"""
+    names = set()
+    for i in range(1, len(sig) - 2):
+        if (sig[i - 1].upper in ("WITH", "RECURSIVE", ",") and sig[i].kind in ("word", "quoted")
+                and sig[i + 1].upper == "AS" and sig[i + 2].value == "("):
+            names.add(sig[i].name.lower())
+    return names
+
+
+def table_refs(tokens: List[Token], ctes: Optional[set] = None) -> List[int]:
+    """
+    返回 tokens 中表名 token 的下标：FROM / JOIN 后（含逗号分隔的多表）、INSERT INTO、UPDATE、
+    CREATE / ALTER / DROP / TRUNCATE TABLE 与 DESC 之后；库名.表名 时取表名，排除 CTE 名称，子查询递归处理
+    """
+    sig = [(i, t) for i, t in enumerate(tokens) if t.significant]
+    if ctes is None:
+        ctes = _cte_names([t for _, t in sig])
+    refs: List[int] = []
+    k = 0
+    while k < len(sig):
+        _, t = sig[k]
+        k += 1
+        if t.kind != "word" or t.upper not in _TABLE_KEYWORDS:
+            continue
+        if t.upper in ("DESC", "DESCRIBE") and k > 1:
+            continue  # ORDER BY x DESC
+        while True:
+            while k < len(sig) and sig[k][1].upper in _SKIP_AFTER_TABLE:
+                k += 1
+            if k >= len(sig):
+                break
+            idx, name = sig[k]
+            if name.value == "(":
+                # 派生表：递归提取括号内的表名后跳到匹配的右括号，继续读取别名与后续表
+                depth = name.depth
+                k += 1
+                while k < len(sig) and not (sig[k][1].value == ")" and sig[k][1].depth == depth):
+                    k += 1
+                end = sig[k][0] if k < len(sig) else len(tokens)
+                refs.extend(idx + 1 + r for r in table_refs(tokens[idx + 1:end], ctes))
+                k += 1
+            elif name.kind in ("word", "quoted") and name.upper not in _CLAUSE_WORDS:
+                if k + 2 < len(sig) and sig[k + 1][1].value == ".":
+                    k += 2
+                    idx, name = sig[k]
+                if name.name.lower() not in ctes:
+                    refs.append(idx)
+                k += 1
+            else:
+                break
+            if t.upper != "FROM":
+                break
+            # FROM a [AS] x, b y：跳过别名后遇到逗号则继续读取下一张表
+            if k < len(sig) and sig[k][1].upper == "AS":
+                k += 1
+            if k < len(sig) and sig[k][1].kind in ("word", "quoted") and sig[k][1].upper not in _CLAUSE_WORDS:
+                k += 1
+            if k < len(sig) and sig[k][1].value == ",":
+                k += 1
+                continue
+            break
+    return refs
+
+
+def created_tables(sql: str) -> List[str]:
+    """CREATE [TEMPORARY] TABLE [IF NOT EXISTS] 新建的表名"""
+    sig = significant(tokenize(sql))
+    names = []
+    for i, t in enumerate(sig):
+        if t.upper == "CREATE":
+            j = i + 1
+            while j < len(sig) and sig[j].upper in ("TEMPORARY", "TABLE", "IF", "NOT", "EXISTS"):
+                j += 1
+            if j < len(sig) and "TABLE" in (x.upper for x in sig[i + 1:j]):
+                if j + 2 < len(sig) and sig[j + 1].value == ".":
+                    j += 2
+                names.append(sig[j].name)
+    return names
+
+
+def rename_tables(sql: str, mapping: dict) -> str:
+    """按 mapping 替换语句中的表名 token，保留反引号，不触及字符串、注释与列名"""
+    tokens = tokenize(sql)
+    for i in table_refs(tokens):
+        new = mapping.get(tokens[i].name)
+        if new is not None:
+            value = f"`{new}`" if tokens[i].kind == "quoted" else new
+            tokens[i] = Token(tokens[i].kind, value, tokens[i].depth)
+    return render(tokens)
+
+
+def split_statements(sql: str) -> List[str]:
+    """按括号外的分号切分多条语句，忽略字符串/注释中的分号，丢弃只含空白与注释的片段"""
+    statements, current = [], []
+    for t in tokenize(sql) + [Token("punct", ";", 0)]:
+        if t.value == ";" and t.depth == 0:
+            if any(x.significant for x in current):
+                statements.append(render(current).strip())
+            current = []
+        else:
+            current.append(t)
+    return statements
+
+
+# WITH 公用表表达式之后可以跟的主语句
+_WITH_TARGETS = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def main_keyword(sig: List[Token]) -> Optional[str]:
+    """
+    有效 token 序列的语句类型（大写）：一般为首个关键字；顶层 WITH 之后取括号外第一个 DML 关键字，
+    WITH ... SELECT 仍记为 WITH，WITH ... DELETE 记为 DELETE，无法确定时返回 None
+    """
+    first = None
+    for t in sig:
+        if t.kind == "word":
+            first = t.upper
+            break
+        if t.value != "(":
+            return None
+    if first != "WITH":
+        return first
+    main = next((t.upper for t in sig if t.kind == "word" and t.depth == 0 and t.upper in _WITH_TARGETS), None)
+    if main is None:
+        return None
+    return "WITH" if main == "SELECT" else main
+
+
+def locking_clause(sig: List[Token]) -> Optional[int]:
+    """顶层 FOR UPDATE / FOR SHARE / LOCK IN SHARE MODE 子句在 sig 中的起始下标"""
+    for i in range(len(sig) - 1):
+        t, nxt = sig[i], sig[i + 1]
+        if t.kind == "word" and t.depth == 0 and nxt.kind == "word" and (
+                (t.upper == "FOR" and nxt.upper in ("UPDATE", "SHARE")) or (t.upper == "LOCK" and nxt.upper == "IN")):
+            return i
+    return None
+
+
+def statement_type(sql: str) -> Optional[str]:
+    """返回语句类型（大写），如 SELECT / INSERT / DESC；WITH 开头的语句按 main_keyword 取主语句"""
+    return main_keyword(significant(tokenize(sql)))
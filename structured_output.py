@@ -0,0 +1,253 @@
+"""
+结构化输出：各调用点的 JSON Schema 定义、轻量校验器（支持 type / required / properties / items / enum / minItems / pattern）、
+本地快速修复解析（去除代码块围栏、注释、尾逗号，提取最后一个 JSON 对象）以及不合规时的重问循环
+"""
+import json
+import re
+from typing import Callable, Dict, List, Optional
+
+ANALYZE_SCHEMA = {
+    "type": "object",
+    "required": ["response", "call", "end"],
+    "properties": {
+        "response": {"type": "string"},
+        "call": {
+            "type": "object",
+            "required": ["name"],
+            "properties": {
+                "name": {"type": ["string", "null"]},
+                "arguments": {"type": ["object", "string"]},
+            },
+        },
+        "end": {"type": "boolean"},
+    },
+}
+
+PLAN_SCHEMA = {
+    "type": "object",
+    "required": ["chain", "first"],
+    "properties": {
+        "chain": {"type": "array", "minItems": 1, "items": {"type": "string", "pattern": r"^\d-"}},
+        "first": ANALYZE_SCHEMA,
+    },
+}
+
+SCHEDULE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "keep": {"type": "array", "items": {"type": "string"}},
+        "add": {"type": "array", "items": {"type": "string"}},
+        "remove": {"type": "array", "items": {"type": "string"}},
+        "update": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["from", "to"],
+                "properties": {"from": {"type": "string"}, "to": {"type": "string"}},
+            },
+        },
+    },
+}
+
+ALARM_SCHEMA = {
+    "type": "object",
+    "required": ["cmd", "minutes", "total_time"],
+    "properties": {
+        "cmd": {"type": "string"},
+        "minutes": {"type": ["number", "string"]},
+        "total_time": {"type": ["number", "string"]},
+    },
+}
+
+EMAIL_SCHEMA = {
+    "type": "object",
+    "required": ["to_addr", "subject", "content"],
+    "properties": {
+        "to_addr": {"type": "string"},
+        "subject": {"type": "string"},
+        "content": {"type": "string"},
+    },
+}
+
+
+class StructuredOutputError(ValueError):
+    pass
+
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "number": (int, float),
+    "integer": int,
+    "null": type(None),
+}
+
+
+def _is_type(value, name: str) -> bool:
+    if name in ("number", "integer") and isinstance(value, bool):
+        return False
+    return isinstance(value, _TYPES[name])
+
+
+def validate(instance, schema: Dict, path="$") -> List[str]:
+    """返回所有校验错误（空列表表示通过）"""
+    errors = []
+    expected = schema.get("type")
+    if expected is not None:
+        names = expected if isinstance(expected, list) else [expected]
+        if not any(_is_type(instance, n) for n in names):
+            return [f"{path}: 期望类型 {expected}，实际为 {type(instance).__name__}"]
+    if "enum" in schema and instance not in schema["enum"]:
+        errors.append(f"{path}: {instance!r} 不在可选值 {schema['enum']} 中")
+    if isinstance(instance, str) and "pattern" in schema and not re.search(schema["pattern"], instance):
+        errors.append(f"{path}: {instance!r} 不匹配 {schema['pattern']}")
+    if isinstance(instance, dict):
+        for key in schema.get("required", []):
+            if key not in instance:
+                errors.append(f"{path}: 缺少字段 {key}")
+        for key, sub in schema.get("properties", {}).items():
+            if key in instance:
+                errors.extend(validate(instance[key], sub, f"{path}.{key}"))
+    if isinstance(instance, list):
+        if len(instance) < schema.get("minItems", 0):
+            errors.append(f"{path}: 至少需要 {schema['minItems']} 项")
+        if "items" in schema:
+            for i, item in enumerate(instance):
+                errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+_FENCE = re.compile(r"```[ \t]*(\w*)[ \t]*\n?(.*?)```", re.DOTALL)
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def code_blocks(text: str, lang: Optional[str] = None) -> List[str]:
+    """提取 Markdown 代码块内容；指定 lang 时只返回该语言（忽略大小写）及未标注语言的代码块"""
+    blocks = []
+    for tag, body in _FENCE.findall(text or ""):
+        if lang is None or not tag or tag.lower() == lang.lower():
+            blocks.append(body.strip())
+    return blocks
+
+
+def _repair(text: str) -> str:
+    """在字符串字面量之外去除注释、尾逗号，并把 Python 字面量替换为 JSON 字面量"""
+    out = []
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if ch == '"':
+            j = i + 1
+            while j < n and text[j] != '"':
+                j += 2 if text[j] == "\\" else 1
+            out.append(text[i:j + 1])
+            i = j + 1
+        elif text.startswith("//", i):
+            while i < n and text[i] != "\n":
+                i += 1
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+        elif ch == ",":
+            j = i + 1
+            # 跳过空白与注释，判断是否为尾逗号
+            while j < n:
+                if text[j] in " \t\r\n":
+                    j += 1
+                elif text.startswith("//", j):
+                    newline = text.find("\n", j)
+                    j = n if newline < 0 else newline
+                elif text.startswith("/*", j):
+                    end = text.find("*/", j + 2)
+                    j = n if end < 0 else end + 2
+                else:
+                    break
+            if j < n and text[j] in "]}":
+                i += 1
+            else:
+                out.append(ch)
+                i += 1
+        elif ch.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.append(_PY_LITERALS.get(word, word))
+            i = j
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+
+def _last_object(text: str):
+    decoder = json.JSONDecoder()
+    found = None
+    i = text.find("{")
+    while i >= 0:
+        try:
+            obj, end = decoder.raw_decode(text, i)
+        except json.JSONDecodeError:
+            i = text.find("{", i + 1)
+            continue
+        if isinstance(obj, dict):
+            found = obj
+        i = text.find("{", end)
+    return found
+
+
+def parse_json(text: str):
+    """
+    快速修复解析：直接解析 → 代码块内解析 → 修复注释/尾逗号后提取最后一个 JSON 对象
+    """
+    text = (text or "").strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    candidates = code_blocks(text, "json")[::-1] + [text]
+    for candidate in candidates:
+        repaired = _repair(candidate)
+        try:
+            return json.loads(repaired)
+        except json.JSONDecodeError:
+            pass
+        obj = _last_object(repaired)
+        if obj is not None:
+            return obj
+    raise StructuredOutputError(f"无法从模型输出中解析 JSON：{text[:200]}")
+
+
+def reask_prompt(errors: List[str]) -> str:
+    return (
+        "你上一次的输出不符合要求：\n"
+        + "\n".join(f"- {e}" for e in errors[:5])
+        + "\n请只输出一个符合上述格式要求的 JSON 对象，不要包含代码块标记、注释或任何解释。"
+    )
+
+
+def complete_structured(ask: Callable[[List[Dict], int], str], messages: List[Dict], schema: Dict, max_reasks=1,
+                        on_checked: Optional[Callable[[int, List[str]], None]] = None):
+    """
+    ask(messages, attempt) 返回模型输出文本；解析并按 schema 校验，不合规时把该输出与错误原因追加到对话中重问，
+    最多 max_reasks 次。on_checked(attempt, errors) 在每次校验后调用（errors 为空表示通过）
+    """
+    messages = list(messages)
+    for attempt in range(max_reasks + 1):
+        output = ask(messages, attempt)
+        try:
+            result = parse_json(output)
+            errors = validate(result, schema)
+        except StructuredOutputError as e:
+            result, errors = None, [str(e)]
+        if on_checked is not None:
+            on_checked(attempt, errors)
+        if not errors:
+            return result
+        messages += [
+            {"role": "assistant", "content": output},
+            {"role": "user", "content": reask_prompt(errors)},
+        ]
+    raise StructuredOutputError(f"LLM 返回的内容不符合要求：{errors}\nRaw output:\n{output}")
@@ -0,0 +1,128 @@
+"""
+表名纠错：在本地用编辑距离、分词（含单复数归一）与拼音相似度把 SQL 中不存在的表名映射到真实表名，
+并记录经大模型确认的纠错结果作为别名表；只有本地置信度不足时才需要调用大模型
+"""
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+_SPLIT = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+|[一-鿿]+")
+_CJK = re.compile(r"[一-鿿]")
+
+
+def levenshtein(a: str, b: str) -> int:
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ses", "xes", "ches", "shes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokens(name: str) -> List[str]:
+    """按下划线、驼峰与数字边界切分并归一为小写单数"""
+    return [_singular(t.lower()) for t in _SPLIT.findall(name)]
+
+
+def _pinyin(name: str) -> Optional[Tuple[str, str]]:
+    """中文表名的 (全拼, 首字母)；未安装 pypinyin 或不含中文时返回 None"""
+    if not _CJK.search(name):
+        return None
+    try:
+        from pypinyin import lazy_pinyin
+    except ImportError:
+        return None
+    syllables = [s for s in lazy_pinyin(name) if s.strip("_")]
+    return "".join(syllables).lower(), "".join(s[0] for s in syllables).lower()
+
+
+def _ratio(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    return 1.0 - levenshtein(a, b) / max(len(a), len(b))
+
+
+def similarity(name: str, table: str) -> float:
+    """取编辑距离、分词重合度、拼音三种相似度中的最大值，范围 [0, 1]"""
+    a, b = tokens(name), tokens(table)
+    score = max(_ratio(name.lower(), table.lower()), _ratio("".join(a), "".join(b)))
+    if a and b:
+        score = max(score, len(set(a) & set(b)) / len(set(a) | set(b)))
+    pinyin = _pinyin(name)
+    if pinyin is not None:
+        compact = "".join(b)
+        score = max(score, _ratio(pinyin[0], compact), 0.9 if pinyin[1] == compact else 0.0)
+    return score
+
+
+class TableResolver:
+    """
+    threshold: 最佳候选的相似度下限
+    margin:    最佳候选需领先第二名的幅度，否则视为歧义交由大模型
+    alias_path: 别名表 JSON 路径，记录 {错误表名: 正确表名}
+    """
+
+    def __init__(self, alias_path: Optional[str] = None, threshold=0.75, margin=0.1):
+        self.alias_path = alias_path
+        self.threshold = threshold
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._aliases: Dict[str, str] = {}
+        if alias_path and os.path.exists(alias_path):
+            try:
+                with open(alias_path, encoding="utf-8") as f:
+                    self._aliases = {str(k): str(v) for k, v in json.load(f).items()}
+            except (OSError, ValueError):
+                self._aliases = {}
+
+    def resolve(self, name: str, valid_tables: List[str]) -> Tuple[Optional[str], float, str]:
+        """返回 (表名, 置信度, 依据)；置信度不足时表名为 None"""
+        if name in valid_tables:
+            return name, 1.0, "exact"
+        lowered = {t.lower(): t for t in valid_tables}
+        if name.lower() in lowered:
+            return lowered[name.lower()], 1.0, "case"
+        with self._lock:
+            alias = self._aliases.get(name) or self._aliases.get(name.lower())
+        if alias in valid_tables:
+            return alias, 1.0, "alias"
+
+        scored = sorted(((similarity(name, t), t) for t in valid_tables), reverse=True)
+        if not scored:
+            return None, 0.0, "none"
+        best_score, best = scored[0]
+        runner_up = scored[1][0] if len(scored) > 1 else 0.0
+        if best_score >= self.threshold and best_score - runner_up >= self.margin:
+            return best, best_score, "similarity"
+        return None, best_score, "low_confidence"
+
+    def learn(self, wrong: str, correct: str):
+        with self._lock:
+            if self._aliases.get(wrong) == correct:
+                return
+            self._aliases[wrong] = correct
+            if not self.alias_path:
+                return
+            tmp = f"{self.alias_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._aliases, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.alias_path)
+
+    def aliases(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._aliases)
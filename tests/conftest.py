@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 被测模块位于仓库根目录（扁平布局）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,163 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AgentPool, PriorityClass, Rejected, admission_from_env
+
+
+def _controller(slots=1, reserved=0, **overrides):
+    interactive = dict(max_in_flight=slots, max_queue=8, max_wait_s=5)
+    interactive.update(overrides)
+    return AdmissionController(
+        [
+            PriorityClass("interactive", 0, **interactive),
+            PriorityClass("batch", 1, max_in_flight=slots, max_queue=8, max_wait_s=5),
+        ],
+        slots,
+        reserved=reserved,
+    )
+
+
+def _hold(controller, name):
+    """在后台线程占住一个执行槽，返回 (释放事件, 线程)"""
+    entered, release = threading.Event(), threading.Event()
+
+    def target():
+        with controller.slot(name):
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    assert entered.wait(5)
+    return release, thread
+
+
+def _wait_queued(cls, n):
+    deadline = time.monotonic() + 5
+    while len(cls.waiting) < n:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def _waiter(controller, name, order, label):
+    def target():
+        with controller.slot(name):
+            order.append(label)
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread
+
+
+def test_full_queue_is_rejected_with_429_and_retry_after():
+    controller = _controller(max_queue=1)
+    release, holder = _hold(controller, "interactive")
+    order = []
+    queued = _waiter(controller, "interactive", order, "queued")
+    _wait_queued(controller.classes["interactive"], 1)
+
+    with pytest.raises(Rejected) as info:
+        with controller.slot("interactive"):
+            pass
+    assert info.value.status == 429
+    assert info.value.reason == "队列已满"
+    assert info.value.retry_after >= 1
+
+    release.set()
+    holder.join(5)
+    queued.join(5)
+    assert order == ["queued"]
+    stats = controller.summary()["classes"]["interactive"]
+    assert stats["rejected_full"] == 1 and stats["admitted"] == 2 and stats["completed"] == 2
+
+
+def test_waiters_are_admitted_in_fifo_order():
+    controller = _controller()
+    release, holder = _hold(controller, "interactive")
+    order, threads = [], []
+    for i in range(4):
+        threads.append(_waiter(controller, "interactive", order, i))
+        _wait_queued(controller.classes["interactive"], i + 1)
+
+    release.set()
+    for t in [holder] + threads:
+        t.join(5)
+    assert order == [0, 1, 2, 3]
+
+
+def test_queue_wait_timeout_is_rejected():
+    controller = _controller(max_wait_s=0.05)
+    release, holder = _hold(controller, "interactive")
+    try:
+        with pytest.raises(Rejected) as info:
+            with controller.slot("interactive"):
+                pass
+        assert info.value.status == 429 and info.value.reason == "排队超时"
+    finally:
+        release.set()
+        holder.join(5)
+    stats = controller.summary()["classes"]["interactive"]
+    assert stats["rejected_timeout"] == 1 and stats["queued"] == 0
+
+
+def test_freed_slot_goes_to_higher_priority_class_first():
+    controller = _controller()
+    release, holder = _hold(controller, "batch")
+    order = []
+    batch = _waiter(controller, "batch", order, "batch")
+    _wait_queued(controller.classes["batch"], 1)
+    interactive = _waiter(controller, "interactive", order, "interactive")
+    _wait_queued(controller.classes["interactive"], 1)
+
+    release.set()
+    for t in (holder, batch, interactive):
+        t.join(5)
+    assert order == ["interactive", "batch"]
+
+
+def test_reserved_slot_is_left_for_interactive_requests():
+    controller = _controller(slots=2, reserved=1)
+    release, holder = _hold(controller, "batch")
+    try:
+        # 批处理已占满共享的槽位，剩下的一个只留给交互请求
+        controller.classes["batch"].max_wait_s = 0.05
+        with pytest.raises(Rejected):
+            with controller.slot("batch"):
+                pass
+        with controller.slot("interactive"):
+            assert controller.in_flight == 2
+    finally:
+        release.set()
+        holder.join(5)
+
+
+def test_close_rejects_new_requests_with_503_and_waits_for_in_flight():
+    controller = _controller()
+    release, holder = _hold(controller, "interactive")
+    assert controller.close(timeout=0.05) is False
+    with pytest.raises(Rejected) as info:
+        with controller.slot("interactive"):
+            pass
+    assert info.value.status == 503
+    release.set()
+    holder.join(5)
+    assert controller.close(timeout=1) is True
+
+
+def test_agent_pool_leases_each_agent_exclusively():
+    pool = AgentPool(object, 2)
+    with pool.lease() as first, pool.lease() as second:
+        assert first is not second
+        assert pool._idle.empty()
+    assert pool._idle.qsize() == 2
+
+
+def test_admission_from_env_reserves_a_slot_for_interactive(monkeypatch):
+    monkeypatch.setenv("AGENT_ADMIT_BATCH_MAX_QUEUE", "3")
+    controller = admission_from_env(slots=3)
+    assert controller.reserved == 1
+    assert controller.classes["interactive"].max_in_flight == 3
+    assert controller.classes["batch"].max_in_flight == 2
+    assert controller.classes["batch"].max_queue == 3
+    assert admission_from_env(slots=1).reserved == 0
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+import analytics
+
+PRICES = [
+    {"id": 1, "fruit": "苹果", "price": "3.5", "record_date": "2026-09-01"},
+    {"id": 2, "fruit": "苹果", "price": "4.5", "record_date": "2026-09-02"},
+    {"id": 3, "fruit": "香蕉", "price": "2.0", "record_date": "2026-09-03"},
+    {"id": 4, "fruit": "香蕉", "price": "3.0", "record_date": "2026-09-04"},
+]
+
+
+def test_extract_tables_from_json_and_markdown():
+    text = ("结果：" + json.dumps(PRICES, ensure_ascii=False)
+            + "\n| 品类 | 重量 |\n| --- | --- |\n| 苹果 | 3 |\n| 梨 | 4 |\n"
+            + json.dumps({"results": [{"a": 1}, {"a": 2}], "单行": [{"b": 1}]}))
+    tables = analytics.extract_tables(text)
+    assert [len(t) for t in tables] == [4, 2, 2]
+    assert tables[2] == [{"品类": "苹果", "重量": "3"}, {"品类": "梨", "重量": "4"}]
+
+
+def test_table_classifies_columns():
+    table = analytics.Table(PRICES)
+    assert list(table.numeric) == ["price"]  # id 列不参与分析
+    assert list(table.times) == ["record_date"]
+    assert list(table.categorical) == ["fruit"]
+
+
+def test_analyze_describes_groups_and_trends():
+    summaries = analytics.analyze([json.dumps(PRICES, ensure_ascii=False)] * 2)
+    assert len(summaries) == 1  # 相同的表只分析一次
+    summary = summaries[0]
+    assert summary["describe"]["price"]["mean"] == 3.25
+    assert summary["group_by"]["fruit"]["苹果"]["price"]["mean"] == 4.0
+    assert summary["trend"]["price"]["axis"] == "record_date"
+    assert summary["trend"]["price"]["first"] == 3.5
+
+
+def test_categorical_only_tables_are_not_summarized_or_stripped():
+    text = "设备状态：" + json.dumps([{"name": "a", "status": "ok"}, {"name": "b", "status": "bad"}])
+    assert analytics.analyze([text]) == []
+    assert analytics.strip_tables(text) == text
+
+
+def test_strip_tables_keeps_surrounding_text():
+    text = "重量如下\n| 品类 | 重量 |\n| --- | --- |\n| 苹果 | 3 |\n| 梨 | 4 |\n说明：单位为千克"
+    assert analytics.strip_tables(text) == "重量如下\n说明：单位为千克"
+    mixed = "查询结果：" + json.dumps(PRICES, ensure_ascii=False) + "，共 4 行"
+    assert analytics.strip_tables(mixed) == "查询结果：，共 4 行"
+
+
+@pytest.mark.parametrize("value, expected", [
+    (3, 3.0), ("4.5", 4.5), (" 12% ", 12.0), ("1e3", 1000.0), (True, None), ("苹果", None), (None, None),
+])
+def test_as_number(value, expected):
+    assert analytics.as_number(value) == expected
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from cancellation import CancelRegistry, CancelToken, Cancelled
+
+
+def test_cancel_sets_reason_and_check_raises():
+    token = CancelToken()
+    token.check()
+    token.cancel("用户取消")
+    token.cancel("第二次取消不覆盖原因")
+    assert token.cancelled
+    assert token.reason == "用户取消"
+    with pytest.raises(Cancelled) as info:
+        token.check()
+    assert info.value.reason == "用户取消"
+
+
+def test_deadline_expires():
+    token = CancelToken(deadline_s=0.05)
+    assert not token.cancelled
+    assert 0 < token.remaining() <= 0.05
+    time.sleep(0.08)
+    assert token.cancelled
+    assert token.reason == "已超时"
+    assert token.remaining() == 0.0
+
+
+def test_on_cancel_runs_callbacks_once_and_immediately_after_cancel():
+    token = CancelToken()
+    calls = []
+    token.on_cancel(lambda: calls.append("before"))
+    token.on_cancel(lambda: 1 / 0)  # 回调异常不影响其他回调
+    token.cancel()
+    token.cancel()
+    token.on_cancel(lambda: calls.append("after"))
+    assert calls == ["before", "after"]
+
+
+def test_run_returns_value_and_propagates_errors():
+    token = CancelToken()
+    assert token.run(lambda a, b: a + b, 1, b=2) == 3
+    with pytest.raises(KeyError):
+        token.run(lambda: {}["missing"])
+
+
+def test_run_abandons_blocking_call_on_cancel():
+    token = CancelToken()
+    release = threading.Event()
+    threading.Timer(0.05, token.cancel, args=("中止",)).start()
+    started = time.monotonic()
+    with pytest.raises(Cancelled):
+        token.run(release.wait, 5)
+    assert time.monotonic() - started < 1
+    release.set()
+
+
+def test_registry_cancels_registered_turns():
+    registry = CancelRegistry()
+    token = CancelToken()
+    registry.register("t1", token)
+    assert registry.active() == ["t1"]
+    assert registry.cancel("t1", reason="客户端取消")
+    assert token.reason == "客户端取消"
+    registry.unregister("t1")
+    assert not registry.cancel("t1")
+    assert registry.active() == []
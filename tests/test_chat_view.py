@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+pytest.importorskip("markdown")
+pytest.importorskip("PyQt5.QtWidgets")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+from chat_view import (  # noqa: E402
+    COLLAPSE_LINES, ChatDelegate, ChatMessage, ChatModel, ChatView, MessageRole, PREVIEW_LINES,
+)
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def test_short_message_is_not_collapsible():
+    message = ChatMessage("agent", "**你好**", stamp="10:00")
+    assert not message.collapsible and not message.collapsed
+    html = message.html()
+    assert "10:00" in html and "<strong>你好</strong>" in html
+    assert message.html() is html  # 同一状态只转换一次
+
+
+def test_long_message_collapses_to_preview_and_expands():
+    text = "\n".join(f"第{i}行" for i in range(COLLAPSE_LINES + 10))
+    message = ChatMessage("agent", text)
+    assert message.collapsible and message.collapsed
+    collapsed = message.html()
+    assert f"第{PREVIEW_LINES - 1}行" in collapsed and f"第{PREVIEW_LINES}行" not in collapsed
+    assert "双击展开" in collapsed
+    message.collapsed = False
+    assert f"第{COLLAPSE_LINES + 9}行" in message.html()
+
+
+def test_welcome_html_is_passed_through():
+    assert ChatMessage("welcome", "<b>hi</b>").html() == "<b>hi</b>"
+
+
+def test_model_batch_append_toggle_and_clear(app):
+    model = ChatModel()
+    inserted = []
+    model.rowsInserted.connect(lambda parent, first, last: inserted.append((first, last)))
+    long_text = "x\n" * (COLLAPSE_LINES + 1)
+    model.append([ChatMessage("user", "a"), ChatMessage("agent", long_text)])
+    model.append([])
+    assert model.rowCount() == 2 and inserted == [(0, 1)]
+    assert model.data(model.index(0), MessageRole).text == "a"
+    changed = []
+    model.dataChanged.connect(lambda first, *rest: changed.append(first.row()))
+    model.toggle(0)
+    model.toggle(1)
+    assert changed == [1] and not model.data(model.index(1), MessageRole).collapsed
+    model.clear()
+    assert model.rowCount() == 0
+
+
+def test_delegate_caches_layout_per_width_and_state(app):
+    view = ChatView()
+    delegate = ChatDelegate(view, cache_size=2)
+    message = ChatMessage("agent", "hello")
+    doc = delegate._document(message, 400)
+    assert delegate._document(message, 400) is doc
+    assert delegate._document(message, 300) is not doc
+    delegate._document(ChatMessage("agent", "other"), 400)
+    assert len(delegate._docs) == 2 and (message, 400, False) not in delegate._docs
+    delegate.set_text_color("#FFFFFF")
+    assert delegate._docs == {}
+
+
+def test_view_clear_resets_delegate_cache(app):
+    view = ChatView()
+    view.append([ChatMessage("agent", "hello")])
+    view.delegate._document(view.chat_model.data(view.chat_model.index(0), MessageRole), 400)
+    view.clear()
+    assert view.delegate._docs == {} and view.chat_model.rowCount() == 0
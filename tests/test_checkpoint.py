@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from checkpoint import CheckpointStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(str(tmp_path / "checkpoints.db"))
+
+
+def _state(chain, finish):
+    return {"chain": chain, "finish": finish, "query": chain[0] if chain else None, "memory": [], "history": [],
+            "reports": [], "user_target": "统计苹果数量", "first_call": False}
+
+
+def test_save_and_load_round_trip(store):
+    store.save("t1", "s1", _state(["查询", "报告"], []), step=0)
+    store.save("t1", "s1", _state(["报告"], ["查询"]), step=1)
+    record = store.load("t1")
+    assert record["session_id"] == "s1"
+    assert record["status"] == "running" and record["step"] == 1
+    assert record["state"]["chain"] == ["报告"] and record["state"]["finish"] == ["查询"]
+    assert record["result"] is None
+    assert store.load("missing") is None
+
+
+def test_mark_done_stores_result_and_leaves_resumable_list(store):
+    store.save("t1", "s1", _state(["查询"], []), step=0)
+    store.save("t2", "s1", _state(["查询"], []), step=0)
+    store.mark("t1", "done", {"finished": ["查询"], "reports": ["完成"]})
+    assert store.load("t1")["result"] == {"finished": ["查询"], "reports": ["完成"]}
+    assert [r["turn_id"] for r in store.resumable()] == ["t2"]
+    store.mark("t2", "cancelled")
+    assert [r["turn_id"] for r in store.resumable()] == ["t2"]
+    assert "state" not in store.resumable()[0]
+
+
+def test_prune_removes_only_old_finished_turns(store):
+    store.save("old", "s", _state(["a"], []), step=0)
+    store.mark("old", "done")
+    store.save("running", "s", _state(["a"], []), step=0)
+    time.sleep(0.02)
+    assert store.prune(0.01) == 1
+    assert store.load("old") is None
+    assert store.load("running") is not None
+
+
+def test_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    CheckpointStore(path).save("t1", "s1", _state(["查询"], []), step=0)
+    assert CheckpointStore(path).load("t1")["state"]["user_target"] == "统计苹果数量"
@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from cancellation import CancelToken, Cancelled
+from cpu_pool import CPUPool
+
+
+def test_inline_mode_runs_in_the_calling_thread():
+    pool = CPUPool(0)
+    assert pool.run(pow, 2, 10) == 1024
+    assert pool.summary() == {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "inline": 1,
+                              "workers": 0, "in_flight": 0}
+
+
+def test_worker_process_returns_result_and_propagates_errors():
+    pool = CPUPool(1)
+    try:
+        assert pool.run(pow, 3, 4) == 81
+        with pytest.raises(ZeroDivisionError):
+            pool.run(divmod, 1, 0)
+    finally:
+        pool.shutdown()
+    stats = pool.summary()
+    assert stats["submitted"] == 2 and stats["completed"] == 1 and stats["failed"] == 1 and stats["in_flight"] == 0
+
+
+def test_cancelled_token_abandons_the_task():
+    pool = CPUPool(1)
+    token = CancelToken()
+    token.cancel("测试取消")
+    try:
+        started = time.monotonic()
+        with pytest.raises(Cancelled):
+            pool.run(time.sleep, 0.5, cancel=token)
+        assert time.monotonic() - started < 0.5
+    finally:
+        pool.shutdown()
+    assert pool.summary()["cancelled"] == 1
+
+
+def test_closed_pool_rejects_new_tasks():
+    pool = CPUPool(1)
+    pool.shutdown()
+    with pytest.raises(RuntimeError):
+        pool.run(pow, 2, 2)
@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+import pytest
+
+from devices import (FRAME_POINTS, DeviceRegistry, FrameError, RingBuffer, SerialSource, SimulatedSource,
+                     build_frame, parse_frame, registry_from_env, source_from_spec)
+
+
+def test_frame_round_trip_and_checksum():
+    points = np.arange(FRAME_POINTS) * 100
+    frame = build_frame(points)
+    np.testing.assert_array_equal(parse_frame(frame), points.astype(np.float32))
+    with pytest.raises(FrameError):
+        parse_frame(frame[:-1] + bytes([(frame[-1] + 1) & 0xFF]))
+    with pytest.raises(FrameError):
+        parse_frame(frame[1:])
+
+
+def test_ring_buffer_overwrites_oldest_and_returns_in_order():
+    buffer = RingBuffer(3, 2)
+    for i in range(5):
+        buffer.push(np.array([i, i]), stamp=100.0 + i)
+    assert len(buffer) == 3 and buffer.total == 5
+    stamps, frames = buffer.window()
+    np.testing.assert_array_equal(stamps, [102.0, 103.0, 104.0])
+    np.testing.assert_array_equal(frames[:, 0], [2, 3, 4])
+    stamps, frames = buffer.window(last=2)
+    np.testing.assert_array_equal(frames[:, 0], [3, 4])
+
+
+def test_ring_buffer_window_is_relative_to_now():
+    buffer = RingBuffer(10, 1)
+    now = time.time()
+    for age in (30, 8, 3, 1):
+        buffer.push(np.array([age]), stamp=now - age)
+    _, frames = buffer.window(seconds=5)
+    np.testing.assert_array_equal(frames[:, 0], [3, 1])
+    # 设备断开后，旧数据不会被当作最近几秒
+    stale = RingBuffer(4, 1)
+    stale.push(np.array([1]), stamp=now - 60)
+    assert len(stale.window(seconds=5)[1]) == 0
+
+
+def test_ring_buffer_window_returns_copies():
+    buffer = RingBuffer(2, 1)
+    buffer.push(np.array([1]), stamp=1.0)
+    _, frames = buffer.window()
+    frames[0, 0] = 99
+    assert buffer.window()[1][0, 0] == 1
+
+
+def test_registry_window_reads_simulated_device():
+    registry = DeviceRegistry()
+    reader = registry.add("demo", SimulatedSource(rate_hz=200, seed=1), capacity=100)
+    registry.start()
+    try:
+        deadline = time.monotonic() + 5
+        while len(reader.buffer) < 10:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        result = registry.window("demo", seconds=None, last=10, pipeline="raw")
+    finally:
+        registry.stop()
+    assert result["frames"] == 10 and result["points"] == FRAME_POINTS
+    assert result["connected"]
+    assert result["errors"] == 0
+    with pytest.raises(KeyError):
+        registry.window("missing")
+
+
+def test_source_from_spec_and_serial_names():
+    assert isinstance(source_from_spec("sim:20"), SimulatedSource)
+    serial = source_from_spec("serial:/dev/rfcomm0:115200")
+    assert isinstance(serial, SerialSource) and serial.port == "/dev/rfcomm0" and serial.baudrate == 115200
+    with pytest.raises(ValueError):
+        source_from_spec("usb:1")
+    registry = DeviceRegistry()
+    registry.add("nir", serial)
+    registry.add("demo", SimulatedSource())
+    assert registry.serial_names() == ["nir"]
+
+
+def test_no_devices_configured_by_default(monkeypatch):
+    monkeypatch.delenv("AGENT_DEVICES", raising=False)
+    assert registry_from_env().names() == []
+    monkeypatch.setenv("AGENT_DEVICES", "nir=serial:COM3:9600, demo=sim:20")
+    assert registry_from_env().names() == ["nir", "demo"]
@@ -0,0 +1,242 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from cancellation import Cancelled
+from failover import CircuitBreaker, FailoverRouter, LatencyTracker, is_retryable
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def fake_client(behaviour):
+    """behaviour(kwargs) 返回响应或抛出异常；调用记录在 client.calls 中"""
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        return behaviour(kwargs)
+
+    return SimpleNamespace(calls=calls, chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def warm(router, client, model, seconds=0.01, n=20):
+    backend = router.backends(client, model)[0]
+    for _ in range(n):
+        backend.latency.add(seconds)
+    return backend
+
+
+def test_is_retryable():
+    assert is_retryable(StatusError(500))
+    assert is_retryable(StatusError(429))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(StatusError(400))
+    assert not is_retryable(SimpleNamespace(response=SimpleNamespace(status_code=401)))
+
+
+def test_breaker_trips_and_recovers_through_single_probe():
+    breaker = CircuitBreaker(failures=2, cooldown_s=0.05)
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # 半开时只放行一个探测请求
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_breaker_release_returns_probe_slot():
+    breaker = CircuitBreaker(failures=1, cooldown_s=0.0)
+    breaker.failure()
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker(failures=3, cooldown_s=0.0)
+    for _ in range(3):
+        breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and breaker.trips == 2
+
+
+def test_latency_tracker_needs_min_samples():
+    tracker = LatencyTracker(min_samples=3)
+    tracker.add(1.0)
+    tracker.add(2.0)
+    assert tracker.percentile(0.5) is None
+    tracker.add(3.0)
+    assert tracker.percentile(0.5) == 2.0
+    assert tracker.percentile(1.0) == 3.0
+
+
+def test_fails_over_to_next_provider_on_retryable_error():
+    router = FailoverRouter(hedge=False)
+    primary = fake_client(lambda kw: (_ for _ in ()).throw(StatusError(503)))
+    backup = fake_client(lambda kw: "备用响应")
+    router.add_provider("a", primary)
+    router.add_provider("b", backup)
+    router.add_route("qwen-max", ["a:qwen-max", "b:deepseek-chat"])
+    response, backend, hedged = router.create(primary, model="qwen-max", messages=[])
+    assert response == "备用响应" and backend.key == "b:deepseek-chat" and not hedged
+    assert backup.calls[0]["model"] == "deepseek-chat"
+
+
+def test_non_retryable_error_is_raised_without_failover_and_keeps_breaker_closed():
+    router = FailoverRouter(hedge=False, failures=1)
+    primary = fake_client(lambda kw: (_ for _ in ()).throw(StatusError(400)))
+    backup = fake_client(lambda kw: "不应调用")
+    router.add_provider("a", primary)
+    router.add_provider("b", backup)
+    router.add_route("m", ["a", "b"])
+    with pytest.raises(StatusError):
+        router.create(primary, model="m", messages=[])
+    assert backup.calls == []
+    assert router.breaker("a").state == "closed"
+
+
+def test_open_breaker_skips_provider():
+    router = FailoverRouter(hedge=False, failures=1, cooldown_s=60)
+    primary = fake_client(lambda kw: (_ for _ in ()).throw(StatusError(500)))
+    backup = fake_client(lambda kw: "ok")
+    router.add_provider("a", primary)
+    router.add_provider("b", backup)
+    router.add_route("m", ["a", "b"])
+    router.create(primary, model="m")
+    router.create(primary, model="m")
+    assert len(primary.calls) == 1
+    assert router.summary()["breakers"]["a"]["state"] == "open"
+
+
+def test_hedge_wins_when_primary_is_slow():
+    router = FailoverRouter(percentile=0.5, min_delay_s=0.05, hedge_budget=1.0)
+    slow = fake_client(lambda kw: time.sleep(1.0) or "慢")
+    fast = fake_client(lambda kw: "快")
+    router.add_provider("slow", slow)
+    router.add_provider("fast", fast)
+    router.add_route("m", ["slow", "fast"])
+    warm(router, slow, "m")
+    started = time.monotonic()
+    response, backend, hedged = router.create(slow, model="m")
+    assert (response, backend.provider, hedged) == ("快", "fast", True)
+    assert time.monotonic() - started < 0.5
+    assert router.summary()["hedges"]["won"] == 1
+
+
+def test_hedge_budget_limits_hedges():
+    router = FailoverRouter(percentile=0.5, min_delay_s=0.02, hedge_budget=0.0)
+    slow = fake_client(lambda kw: time.sleep(0.1) or "慢")
+    router.add_provider("slow", slow)
+    warm(router, slow, "m")
+    response, _, hedged = router.create(slow, model="m")
+    assert response == "慢" and not hedged
+    assert len(slow.calls) == 1
+    assert router.summary()["hedges"] == {"fired": 0, "won": 0, "skipped_budget": 1}
+
+
+def test_stream_requests_fail_over_without_hedging():
+    router = FailoverRouter()
+    primary = fake_client(lambda kw: (_ for _ in ()).throw(ConnectionError("断开")))
+    backup = fake_client(lambda kw: iter(["chunk"]))
+    router.add_provider("a", primary)
+    router.add_provider("b", backup)
+    router.add_route("m", ["a", "b"])
+    response, backend, hedged = router.create(primary, model="m", stream=True)
+    assert list(response) == ["chunk"] and backend.provider == "b" and not hedged
+
+
+def test_no_same_backend_hedge_by_default():
+    router = FailoverRouter(percentile=0.5, min_delay_s=0.02, hedge_budget=1.0)
+    slow = fake_client(lambda kw: time.sleep(0.1) or "慢")
+    router.add_provider("slow", slow)
+    warm(router, slow, "m")
+    router._credit = 1.0
+    response, _, hedged = router.create(slow, model="m")
+    assert response == "慢" and not hedged
+    assert len(slow.calls) == 1
+
+
+def test_same_backend_hedge_is_opt_in():
+    router = FailoverRouter(percentile=0.5, min_delay_s=0.02, hedge_budget=1.0, hedge_same_backend=True)
+    delays = iter([0.5, 0.0])
+    slow = fake_client(lambda kw: time.sleep(next(delays)) or "ok")
+    router.add_provider("slow", slow)
+    warm(router, slow, "m")
+    _, _, hedged = router.create(slow, model="m")
+    assert hedged and len(slow.calls) == 2
+
+
+def test_losing_hedge_is_closed_and_abandoned_primary_is_reported():
+    router = FailoverRouter(percentile=0.5, min_delay_s=0.05, hedge_budget=1.0)
+    slow = fake_client(lambda kw: time.sleep(0.3) or SimpleNamespace(usage="慢"))
+    fast = fake_client(lambda kw: SimpleNamespace(usage="快"))
+    router.add_provider("slow", slow)
+    router.add_provider("fast", fast)
+    router.add_route("m", ["slow", "fast"])
+    warm(router, slow, "m")
+    closed = []
+    router._dedicated = lambda client: (client, lambda: closed.append(client))
+    abandoned = []
+    response, backend, hedged = router.create(slow, model="m", on_abandoned=lambda r, b: abandoned.append((r.usage, b.key)))
+    assert response.usage == "快" and hedged
+    assert closed and closed[0] is fast  # 对冲请求的独立连接在用完后关闭
+    time.sleep(0.4)
+    assert abandoned == [("慢", "slow:m")]
+    assert router.summary()["backends"]["slow:m"]["abandoned"] == 1
+
+
+def test_losing_hedge_connection_is_closed_when_primary_wins():
+    router = FailoverRouter(percentile=0.5, min_delay_s=0.05, hedge_budget=1.0)
+    primary = fake_client(lambda kw: time.sleep(0.15) or "主")
+    gate = threading.Event()
+    hedge = fake_client(lambda kw: gate.wait(2) and (_ for _ in ()).throw(ConnectionError("连接已关闭")))
+    router.add_provider("a", primary)
+    router.add_provider("b", hedge)
+    router.add_route("m", ["a", "b"])
+    warm(router, primary, "m")
+    router._dedicated = lambda client: (client, gate.set)
+    response, backend, hedged = router.create(primary, model="m")
+    assert (response, backend.provider, hedged) == ("主", "a", False)
+    assert gate.wait(0.5)
+    time.sleep(0.05)
+    # 被中止的对冲请求不计入熔断
+    assert router.breaker("b").consecutive == 0
+    assert router.summary()["backends"]["b:m"]["failures"] == 0
+
+
+def test_cancel_abandons_in_flight_request_and_reports_its_usage():
+    router = FailoverRouter(hedge=False)
+    slow = fake_client(lambda kw: time.sleep(0.2) or "迟到的响应")
+    router.add_provider("a", slow)
+    token = SimpleNamespace(cancelled=False, reason="用户取消")
+    threading.Timer(0.05, lambda: setattr(token, "cancelled", True)).start()
+    abandoned = []
+    with pytest.raises(Cancelled):
+        router.create(slow, cancel=token, model="m", on_abandoned=lambda r, b: abandoned.append(r))
+    time.sleep(0.3)
+    assert abandoned == ["迟到的响应"]
+
+
+def test_provider_specific_kwargs_are_stripped_on_failover():
+    router = FailoverRouter(hedge=False)
+    primary = fake_client(lambda kw: (_ for _ in ()).throw(StatusError(503)))
+    backup = fake_client(lambda kw: "ok")
+    router.add_provider("a", primary)
+    router.add_provider("b", backup, unsupported=["response_format"])
+    router.add_route("m", ["a", "b:other"])
+    router.create(primary, model="m", messages=[], extra_body={"enable_search": True},
+                  extra_headers={"X": "1"}, response_format={"type": "json_object"}, tools=[{}])
+    assert "extra_body" in primary.calls[0] and "response_format" in primary.calls[0]
+    assert backup.calls[0] == {"model": "other", "messages": [], "tools": [{}]}
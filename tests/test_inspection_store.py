@@ -0,0 +1,67 @@
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+
+from inspection_store import InspectionStore, extract_metrics
+
+DAY = 86400
+
+
+@pytest.fixture
+def store(tmp_path):
+    return InspectionStore(str(tmp_path / "inspections"))
+
+
+def test_extract_metrics_from_tables_json_and_labels():
+    report = ("| 图像 | 缺陷率 |\n| --- | --- |\n| a.jpg | 10 |\n| b.jpg | 30 |\n"
+              + json.dumps({"合格率": 0.9, "等级": "A"}, ensure_ascii=False) + "\n平均糖度：12.5，腐烂率：5%")
+    metrics = extract_metrics(report)
+    assert metrics["items"] == 2.0
+    assert metrics["缺陷率"] == 20.0
+    assert metrics["合格率"] == 0.9
+    assert metrics["平均糖度"] == 12.5
+    assert metrics["腐烂率"] == pytest.approx(0.05)
+    assert "等级" not in metrics
+
+
+def test_append_backfills_new_columns_and_scans_by_range(store):
+    now = time.time()
+    store.append("苹果", {"缺陷率": 0.1}, ts=now - 2 * DAY)
+    store.append("苹果", {"缺陷率": 0.2, "糖度": 12.0}, ts=now - DAY)
+    store.append("梨", {"缺陷率": 0.5}, ts=now)
+    assert store.categories() == ["梨", "苹果"]
+    assert store.metrics("苹果") == ["糖度", "缺陷率"]
+
+    _, values = store.scan("缺陷率", "苹果")
+    assert sorted(values) == [0.1, 0.2]
+    _, sugar = store.scan("糖度", "苹果")
+    assert list(sugar) == [12.0]  # 回填的 NaN 不返回
+    _, recent = store.scan("缺陷率", start=now - DAY - 1)
+    assert sorted(recent) == [0.2, 0.5]
+
+
+def test_aggregate_buckets_and_trend(store):
+    now = time.time()
+    for day, value in enumerate([0.1, 0.2, 0.3, 0.4]):
+        store.append("苹果", {"缺陷率": value}, ts=now - (3 - day) * DAY)
+    result = store.aggregate("缺陷率", "苹果", days=7, now=now + 1)
+    assert result["count"] == 4
+    assert len(result["buckets"]) == 4
+    assert result["mean"] == pytest.approx(0.25)
+    assert result["slope_per_day"] == pytest.approx(0.1)
+    assert store.aggregate("缺陷率", "香蕉", now=now)["count"] == 0
+
+
+def test_append_realigns_columns_after_interrupted_write(store):
+    ts = time.time()
+    store.append("苹果", {"a": 1.0, "b": 2.0}, ts=ts)
+    segment = store._segment("苹果", time.strftime("%Y-%m-%d", time.localtime(ts)))
+    # 模拟上次写入在时间列之前中断：a 列多出一行
+    with open(os.path.join(segment, store._file_name("a")), "ab") as f:
+        f.write(np.float64(99.0).tobytes())
+    store.append("苹果", {"a": 3.0, "b": 4.0}, ts=ts + 1)
+    assert list(store.scan("a", "苹果")[1]) == [1.0, 3.0]
+    assert list(store.scan("b", "苹果")[1]) == [2.0, 4.0]
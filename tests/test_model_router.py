@@ -0,0 +1,81 @@
+import json
+
+from model_router import ModelRouter, estimate_difficulty
+
+
+def test_difficulty_grows_with_clauses_and_keywords():
+    easy = estimate_difficulty("query_process", "查询苹果价格")
+    hard = estimate_difficulty("query_process", "分析近一周苹果价格趋势，对比去年同期，总结原因并给出建议，然后发送邮件")
+    assert 0.0 <= easy < hard <= 1.0
+
+
+def test_analyze_role_signals():
+    base = estimate_difficulty("analyze", "3-联网搜索：查询天气")
+    assert estimate_difficulty("analyze", "2-数据库操作：查询天气") > base
+    assert estimate_difficulty("analyze", "4-直接生成：查询天气") < base
+
+
+def test_schedule_role_counts_failures_and_task_lines():
+    plain = estimate_difficulty("schedule", "1-检测\n2-查询")
+    failed = estimate_difficulty("schedule", "1-检测\n2-查询\n执行失败：未找到表")
+    assert failed > plain
+
+
+def test_route_picks_tier_by_difficulty():
+    router = ModelRouter(slos={"r": {}})
+    assert router.route("r", "查询苹果价格").model == "qwen-turbo"
+    decision = router.route("r", "分析近一周苹果价格趋势，对比去年同期，总结原因并给出建议，然后发送邮件并保存到数据库")
+    assert decision.model == "qwen-max"
+    assert decision.reason.startswith("difficulty=")
+
+
+def test_slo_latency_caps_tier_but_not_below_floor():
+    hard = "分析近一周苹果价格趋势，对比去年同期，总结原因并给出建议，然后发送邮件并保存到数据库"
+    router = ModelRouter(slos={"r": {"latency_ms": 3000.0, "min_tier": 0}})
+    decision = router.route("r", hard)
+    assert decision.model == "qwen-plus" and "slo->tier1" in decision.reason
+    floored = ModelRouter(slos={"r": {"latency_ms": 1.0, "min_tier": 1}})
+    assert floored.route("r", hard).model == "qwen-plus"
+
+
+def test_slo_cost_cap():
+    router = ModelRouter(slos={"r": {"max_cost": 1.0}})
+    assert router.route("r", "分析趋势，对比同期，总结原因，给出建议，评估是否调价，然后发送邮件").model == "qwen-turbo"
+
+
+def test_large_input_uses_input_chars_for_latency():
+    router = ModelRouter(slos={"r": {"latency_ms": 5000.0}})
+    text = "分析趋势并对比同期，总结原因，给出建议"
+    assert router.route("r", text).model != "qwen-turbo"
+    assert router.route("r", text, input_chars=200_000).model == "qwen-turbo"
+
+
+def test_disabled_router_returns_default():
+    router = ModelRouter(enabled=False)
+    decision = router.route("analyze", "任意", default="glm-4-plus")
+    assert (decision.model, decision.reason) == ("glm-4-plus", "disabled")
+
+
+def test_escalate_walks_the_ladder():
+    router = ModelRouter()
+    decision = router.route("analyze", "查询价格")
+    up = router.escalate(decision, "解析失败")
+    assert up.model == "qwen-plus" and up.escalated_from == decision.model
+    assert router.escalate(router.escalate(up, "x"), "x") is None
+    assert router.escalate(router.fixed("alarm", "glm-4-plus"), "x") is None
+
+
+def test_record_updates_latency_counts_and_log(tmp_path):
+    log = tmp_path / "routing.jsonl"
+    router = ModelRouter(log_path=str(log), ewma=0.5)
+    decision = router.route("analyze", "查询价格")
+    before = router.profiles["qwen-turbo"]["latency_ms"]
+    router.record(decision, "ok", 100.0)
+    assert router.profiles["qwen-turbo"]["latency_ms"] < before
+    router.record(router.escalate(decision, "坏 JSON"), "parse_error", 3000.0)
+    summary = router.summary()
+    assert summary["decisions"]["analyze:qwen-turbo"] == {"calls": 1, "failures": 0}
+    assert summary["decisions"]["analyze:qwen-plus"] == {"calls": 1, "failures": 1}
+    assert summary["escalations"] == 1
+    entries = [json.loads(line) for line in log.read_text(encoding="utf-8").splitlines()]
+    assert [e["outcome"] for e in entries] == ["ok", "parse_error"]
@@ -0,0 +1,153 @@
+import smtplib
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from outbox import EmailOutbox, check_recipients
+
+FROM = ("智农助手", "bot@example.com")
+
+
+class FakeSender:
+    def __init__(self, errors=()):
+        self.sent = []
+        self.errors = list(errors)
+        self.closed = 0
+        self.event = threading.Event()
+
+    def send_email(self, from_addr, to_addrs, subject, body, is_html=False):
+        try:
+            if self.errors:
+                raise self.errors.pop(0)
+            self.sent.append((from_addr, list(to_addrs), subject, body, is_html))
+        finally:
+            self.event.set()
+
+    def close(self):
+        self.closed += 1
+
+
+def outbox(tmp_path, sender, **kwargs):
+    kwargs.setdefault("base_backoff_s", 0.01)
+    kwargs.setdefault("poll_s", 0.05)
+    return EmailOutbox(str(tmp_path / "outbox.db"), sender, **kwargs)
+
+
+def test_check_recipients():
+    assert check_recipients("a@example.com") == ["a@example.com"]
+    assert check_recipients(["张三 <zs@example.com>", "b@x.cn"]) == ["zs@example.com", "b@x.cn"]
+    for bad in ([], "", ["13800000000"], ["a@"], ["@example.com"], None):
+        with pytest.raises(ValueError):
+            check_recipients(bad)
+
+
+def test_invalid_recipients_fail_at_enqueue(tmp_path):
+    box = outbox(tmp_path, FakeSender())
+    with pytest.raises(ValueError):
+        box.enqueue(FROM, [], "s", "b")
+    with pytest.raises(ValueError):
+        box.enqueue(FROM, ["not an address"], "s", "b")
+    assert box.summary() == {}
+
+
+def test_identical_messages_are_merged_into_one_send(tmp_path):
+    sender = FakeSender()
+    box = outbox(tmp_path, sender)
+    box._ensure_worker = lambda: None  # 先全部入队再启动后台线程，保证在同一次认领中合并
+    handles = [box.enqueue(FROM, [addr], "检测完成", "<b>ok</b>", is_html=True)
+               for addr in ("a@example.com", "b@example.com", "a@example.com")]
+    del box._ensure_worker
+    box._ensure_worker()
+    assert box.flush(5)
+    assert sender.sent == [(FROM, ["a@example.com", "b@example.com"], "检测完成", "<b>ok</b>", True)]
+    assert all(box.status(h)["status"] == "sent" for h in handles)
+    box.close()
+
+
+def test_transient_failure_is_retried_then_sent(tmp_path):
+    sender = FakeSender(errors=[smtplib.SMTPServerDisconnected("断开")])
+    box = outbox(tmp_path, sender)
+    handle = box.enqueue(FROM, ["a@example.com"], "s", "b")
+    deadline = time.monotonic() + 5
+    while box.status(handle)["status"] != "sent" and time.monotonic() < deadline:
+        time.sleep(0.02)
+    status = box.status(handle)
+    assert status["status"] == "sent" and status["attempts"] == 2 and status["last_error"] is None
+    assert sender.closed >= 1  # 失败后关闭连接，下次重建
+    box.close()
+
+
+def test_gives_up_after_max_attempts(tmp_path):
+    sender = FakeSender(errors=[OSError("网络不可达")] * 2)
+    box = outbox(tmp_path, sender, max_attempts=2)
+    handle = box.enqueue(FROM, ["a@example.com"], "s", "b")
+    deadline = time.monotonic() + 5
+    while box.status(handle)["status"] != "failed" and time.monotonic() < deadline:
+        time.sleep(0.02)
+    status = box.status(handle)
+    assert status["status"] == "failed" and status["attempts"] == 2
+    assert status["last_error"] == "OSError: 网络不可达"
+    box.close()
+
+
+def test_refused_recipients_keep_only_rejected_addresses(tmp_path):
+    refused = smtplib.SMTPRecipientsRefused({"bad@example.com": (550, b"no such user"),
+                                             "busy@example.com": (451, b"try later")})
+    box = outbox(tmp_path, FakeSender(errors=[refused]))
+    box._ensure_worker = lambda: None
+    ok = box.enqueue(FROM, ["ok@example.com"], "s", "b")
+    permanent = box.enqueue(FROM, ["bad@example.com", "ok2@example.com"], "s", "b")
+    temporary = box.enqueue(FROM, ["busy@example.com"], "s", "b")
+    rows = box._claim()
+    for ids, recipients, row in box._batches(rows):
+        box._send(ids, recipients, row)
+    assert box.status(ok)["status"] == "sent"
+    failed = box.status(permanent)
+    assert failed["status"] == "failed" and failed["to_addrs"] == ["bad@example.com"]
+    assert "550" in failed["last_error"] and "其余 1 人已送达" in failed["last_error"]
+    retry = box.status(temporary)
+    assert retry["status"] == "queued" and retry["attempts"] == 1
+
+
+def test_expired_claims_are_reclaimed(tmp_path):
+    box = outbox(tmp_path, FakeSender(), lease_s=0.0)
+    box._ensure_worker = lambda: None
+    handle = box.enqueue(FROM, ["a@example.com"], "s", "b")
+    assert [r["id"] for r in box._claim()] == [handle]
+    time.sleep(0.01)
+    assert [r["id"] for r in box._claim()] == [handle]
+
+
+def test_worker_survives_database_errors(tmp_path):
+    sender = FakeSender()
+    box = outbox(tmp_path, sender)
+    real_claim, failures = box._claim, []
+
+    def flaky_claim():
+        if not failures:
+            failures.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        return real_claim()
+
+    box._claim = flaky_claim
+    handle = box.enqueue(FROM, ["a@example.com"], "s", "b")
+    assert sender.event.wait(5)
+    assert failures and box._worker.is_alive()
+    deadline = time.monotonic() + 5
+    while box.status(handle)["status"] != "sent" and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert box.status(handle)["status"] == "sent"
+    box.close()
+
+
+def test_pending_messages_resume_on_restart(tmp_path):
+    box = outbox(tmp_path, FakeSender())
+    box._ensure_worker = lambda: None
+    handle = box.enqueue(FROM, ["a@example.com"], "s", "b")
+    sender = FakeSender()
+    restarted = outbox(tmp_path, sender)
+    assert restarted.flush(5)
+    assert restarted.status(handle)["status"] == "sent" and len(sender.sent) == 1
+    restarted.close()
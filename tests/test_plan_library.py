@@ -0,0 +1,77 @@
+import pytest
+
+from plan_library import PlanLibrary, extract_slots, instantiate
+
+
+@pytest.fixture
+def library(tmp_path):
+    return PlanLibrary(str(tmp_path / "plans.db"), min_successes=2)
+
+
+def test_extract_slots_replaces_values_with_placeholders():
+    skeleton, slots = extract_slots("把苹果和香蕉的检测报告每3天发送到 ops@example.com，苹果优先", directories=["apple_0918"])
+    assert slots == {"email0": "ops@example.com", "interval0": "3天", "fruit0": "苹果", "fruit1": "香蕉"}
+    assert skeleton == "把{fruit0}和{fruit1}的检测报告每{interval0}发送到{email0}{fruit0}优先"
+
+
+def test_email_slot_stops_at_chinese_text():
+    _, slots = extract_slots("发送到ops@example.com并抄送")
+    assert slots["email0"] == "ops@example.com"
+
+
+def test_directory_and_path_slots():
+    _, slots = extract_slots("检测 data/apple_0918 与 apple_0920 目录", directories=["apple_0920"])
+    assert slots["path0"] == "data/apple_0918"
+    assert slots["dir0"] == "apple_0920"
+
+
+def test_instantiate_requires_every_placeholder():
+    assert instantiate(["查询{fruit0}价格"], {"fruit0": "梨"}) == ["查询梨价格"]
+    assert instantiate(["查询{fruit0}价格"], {}) is None
+
+
+def test_template_is_used_after_enough_successes(library):
+    skeleton, slots = extract_slots("查询苹果今天的平均价格")
+    chain = ["查询苹果今天的平均价格", "生成苹果价格报告"]
+    assert library.learn(skeleton, slots, chain)
+    assert library.match(skeleton, slots) is None
+    assert library.learn(skeleton, slots, chain)
+
+    other_skeleton, other_slots = extract_slots("查询香蕉今天的平均价格")
+    assert other_skeleton == skeleton
+    hit = library.match(other_skeleton, other_slots)
+    assert hit == {"skeleton": skeleton, "chain": ["查询香蕉今天的平均价格", "生成香蕉价格报告"]}
+    assert library.summary() == {"templates": 1, "active": 1, "hits": 1, "failures": 0}
+
+
+def test_different_wording_does_not_match(library):
+    skeleton, slots = extract_slots("查询价格大于10元的苹果")
+    for _ in range(2):
+        library.learn(skeleton, slots, ["查询价格大于10元的苹果"])
+    opposite, opposite_slots = extract_slots("查询价格小于10元的苹果")
+    assert library.match(opposite, opposite_slots) is None
+
+
+def test_chain_with_unslotted_values_is_not_learned(library):
+    skeleton, slots = extract_slots("查询苹果库存")
+    assert not library.learn(skeleton, slots, ["查询苹果与梨的库存"])
+    assert library.summary()["templates"] == 0
+
+
+def test_changed_chain_restarts_count_and_failure_demotes(library):
+    skeleton, slots = extract_slots("统计苹果数量")
+    library.learn(skeleton, slots, ["统计苹果数量"])
+    library.learn(skeleton, slots, ["查询苹果", "统计数量"])
+    assert library.match(skeleton, slots) is None
+    library.learn(skeleton, slots, ["查询苹果", "统计数量"])
+    assert library.match(skeleton, slots) is not None
+    library.settle(skeleton, ok=False)
+    assert library.match(skeleton, slots) is None
+    assert library.summary()["failures"] == 1
+
+
+def test_disabled_library_never_matches(tmp_path):
+    library = PlanLibrary(str(tmp_path / "plans.db"), enabled=False)
+    skeleton, slots = extract_slots("统计苹果数量")
+    assert not library.learn(skeleton, slots, ["统计苹果数量"])
+    assert library.match(skeleton, slots) is None
@@ -0,0 +1,51 @@
+import time
+
+from query_cache import QueryCache, normalize
+
+
+def test_normalize_ignores_comments_whitespace_and_keyword_case():
+    a, tables = normalize("select * /* 注释 */ from Fruit\n where a = 1;")
+    b, _ = normalize("SELECT * FROM Fruit WHERE a = 1")
+    assert a == b and tables == ["Fruit"]
+    assert normalize("SELECT NOW() FROM t") == ("", [])
+
+
+def test_hit_miss_and_invalidation():
+    cache = QueryCache()
+    key, tables = cache.key("SELECT * FROM fruit WHERE a = %s", params=[1])
+    assert cache.get(key) is None
+    cache.put(key, [{"a": 1}], tables)
+    assert cache.get(key) == [{"a": 1}]
+    assert cache.invalidate(["FRUIT"]) == 1
+    assert cache.get(key) is None
+    assert cache.summary()["hits"] == 1 and cache.summary()["misses"] == 2
+
+
+def test_result_read_before_a_write_is_not_stored():
+    cache = QueryCache()
+    key, tables = cache.key("SELECT * FROM fruit")
+    generation = cache.generation(tables)
+    cache.invalidate(["fruit"])  # 查询执行期间有写入
+    cache.put(key, [{"a": "旧值"}], tables, generation=generation)
+    assert cache.get(key) is None
+    cache.put(key, [{"a": "新值"}], tables, generation=cache.generation(tables))
+    assert cache.get(key) == [{"a": "新值"}]
+
+
+def test_ttl_and_lru_eviction():
+    cache = QueryCache(max_entries=2, ttl_s=0.05)
+    keys = [cache.key(f"SELECT * FROM t{i}") for i in range(3)]
+    for key, tables in keys:
+        cache.put(key, [], tables)
+    assert cache.get(keys[0][0]) is None
+    assert cache.summary()["evictions"] == 1
+    time.sleep(0.06)
+    assert cache.get(keys[2][0]) is None
+    assert cache.summary()["expirations"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = QueryCache(max_entries=0)
+    key, tables = cache.key("SELECT * FROM t")
+    cache.put(key, [{"a": 1}], tables)
+    assert cache.get(key) is None
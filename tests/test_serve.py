@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+import serve
+from devices import DeviceRegistry, SerialSource, SimulatedSource
+
+
+def _registry(monkeypatch, **sources):
+    registry = DeviceRegistry()
+    for name, source in sources.items():
+        registry.add(name, source)
+    monkeypatch.setattr("devices.devices", registry)
+
+
+def test_multiple_workers_refused_with_serial_devices(monkeypatch):
+    _registry(monkeypatch, nir=SerialSource("COM3"), demo=SimulatedSource())
+    serve.check_workers(1)
+    with pytest.raises(SystemExit, match="nir"):
+        serve.check_workers(2)
+
+
+def test_multiple_workers_allowed_without_serial_devices(monkeypatch):
+    _registry(monkeypatch, demo=SimulatedSource())
+    serve.check_workers(4)
+
+
+def _drive(app, scope, messages):
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+def test_lifespan_runs_startup_and_shutdown_hooks():
+    calls = []
+    app = serve.Lifespan(None, lambda: calls.append("startup"), lambda: calls.append("shutdown"))
+    sent = _drive(app, {"type": "lifespan"}, [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+    assert calls == ["startup", "shutdown"]
+    assert [m["type"] for m in sent] == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+
+
+def test_lifespan_reports_startup_failure():
+    def fail():
+        raise OSError("端口被占用")
+
+    app = serve.Lifespan(None, fail, lambda: None)
+    sent = _drive(app, {"type": "lifespan"}, [{"type": "lifespan.startup"}])
+    assert sent[0]["type"] == "lifespan.startup.failed" and "端口被占用" in sent[0]["message"]
+
+
+def test_http_requests_are_passed_to_the_wrapped_app():
+    seen = []
+
+    async def inner(scope, receive, send):
+        seen.append(scope["path"])
+
+    app = serve.Lifespan(inner, lambda: None, lambda: None)
+    _drive(app, {"type": "http", "path": "/api/metrics"}, [])
+    assert seen == ["/api/metrics"]
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from cancellation import CancelToken, Cancelled
+from singleflight import SingleFlight, fingerprint, normalize_text
+
+
+def _concurrently(n, fn):
+    results, threads = [None] * n, []
+    for i in range(n):
+        def target(i=i):
+            try:
+                results[i] = fn()
+            except BaseException as e:
+                results[i] = e
+        threads.append(threading.Thread(target=target))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "结果"
+
+    results = _concurrently(5, lambda: flights.do("llm", "k", slow))
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert {value for value, _ in results} == {"结果"}
+    stats = flights.summary()["llm"]
+    assert stats["calls"] == 5 and stats["executed"] == 1 and stats["shared"] == 4 and stats["in_flight"] == 0
+
+
+def test_different_keys_run_separately():
+    flights = SingleFlight()
+    assert flights.do("db", 1, lambda: "a") == ("a", False)
+    assert flights.do("db", 2, lambda: "b") == ("b", False)
+    assert flights.do("db", 1, lambda: "c") == ("c", False)
+
+
+def test_errors_are_shared_with_waiters():
+    flights = SingleFlight()
+
+    def fail():
+        time.sleep(0.1)
+        raise ValueError("失败")
+
+    results = _concurrently(3, lambda: flights.do("db", "k", fail))
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flights.summary()["db"]["errors"] == 1
+
+
+def test_leader_cancellation_is_private_and_waiter_retries():
+    flights = SingleFlight()
+    leader_entered = threading.Event()
+    calls = []
+
+    def leader_fn():
+        calls.append("leader")
+        leader_entered.set()
+        time.sleep(0.1)
+        raise Cancelled("执行者的轮次被取消")
+
+    def waiter_fn():
+        calls.append("waiter")
+        return "自行执行"
+
+    outcome = {}
+
+    def leader():
+        try:
+            flights.do("image", "k", leader_fn)
+        except Cancelled as e:
+            outcome["leader"] = e
+
+    t = threading.Thread(target=leader)
+    t.start()
+    leader_entered.wait(1)
+    assert flights.do("image", "k", waiter_fn) == ("自行执行", False)
+    t.join(1)
+    assert isinstance(outcome["leader"], Cancelled)
+    assert calls == ["leader", "waiter"]
+
+
+def test_waiter_cancellation_does_not_stop_leader():
+    flights = SingleFlight()
+    release = threading.Event()
+    started = threading.Event()
+    results = {}
+
+    def work():
+        started.set()
+        release.wait(2)
+        return "完成"
+
+    t = threading.Thread(target=lambda: results.setdefault("leader", flights.do("llm", "k", work)))
+    t.start()
+    started.wait(1)
+    token = CancelToken(deadline_s=0.05)
+    with pytest.raises(Cancelled):
+        flights.do("llm", "k", work, cancel=token)
+    release.set()
+    t.join(2)
+    assert results["leader"] == ("完成", False)
+
+
+def test_normalize_and_fingerprint_are_stable():
+    assert normalize_text("  统计 苹果\n数量 ") == normalize_text("统计 苹果 数量")
+    assert normalize_text(None) == ""
+    assert fingerprint({"b": 1, "a": [1, 2]}) == fingerprint({"a": [1, 2], "b": 1})
+    assert fingerprint({"a": 1}) != fingerprint({"a": 2})
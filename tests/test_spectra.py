@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import spectra
+
+X = np.arange(40, dtype=np.float64)
+INNER = slice(6, -6)
+
+
+def test_savgol_preserves_polynomials_up_to_its_order():
+    quadratic = 0.5 * X ** 2 - 3 * X + 7
+    smoothed = spectra.savgol(quadratic, window=11, polyorder=2)
+    assert smoothed.shape == (1, 40)
+    np.testing.assert_allclose(smoothed[0, INNER], quadratic[INNER])
+
+
+def test_savgol_derivatives_match_analytic_values():
+    quadratic = 0.5 * X ** 2 - 3 * X + 7
+    np.testing.assert_allclose(spectra.savgol(quadratic, deriv=1)[0, INNER], (X - 3)[INNER])
+    cubic = X ** 3
+    np.testing.assert_allclose(spectra.savgol(cubic, polyorder=3, deriv=2)[0, INNER], (6 * X)[INNER])
+
+
+def test_savgol_smooths_alternating_noise():
+    noisy = np.where(X % 2 == 0, 1.0, -1.0)
+    assert np.abs(spectra.savgol(noisy)[0, INNER]).max() < 0.2
+
+
+def test_savgol_coeffs_reject_even_window():
+    with pytest.raises(ValueError):
+        spectra.savgol_coeffs(10, 2)
+
+
+def test_snv_gives_zero_mean_unit_std_and_handles_flat_rows():
+    frames = np.array([[1.0, 2.0, 3.0, 4.0], [10.0, 30.0, 20.0, 40.0], [5.0, 5.0, 5.0, 5.0]])
+    result = spectra.snv(frames)
+    np.testing.assert_allclose(result[:2].mean(axis=1), 0, atol=1e-12)
+    np.testing.assert_allclose(result[:2].std(axis=1), 1)
+    np.testing.assert_allclose(result[0], [-1.3416407865, -0.4472135955, 0.4472135955, 1.3416407865])
+    np.testing.assert_array_equal(result[2], 0)
+
+
+def test_msc_removes_scale_and_offset_against_reference():
+    reference = np.sin(X / 5) + 2
+    frames = np.stack([1.2 * reference + 0.5, 0.8 * reference - 0.3, reference])
+    np.testing.assert_allclose(spectra.msc(frames, reference), np.tile(reference, (3, 1)))
+    # 默认以均值光谱为参考：校正后每条光谱都等于均值光谱
+    corrected = spectra.msc(frames)
+    np.testing.assert_allclose(corrected, np.tile(frames.mean(axis=0), (3, 1)))
+
+
+def test_preprocess_pipelines():
+    frames = np.tile(0.5 * X ** 2, (2, 1))
+    np.testing.assert_allclose(spectra.preprocess(frames, "raw"), frames)
+    np.testing.assert_allclose(spectra.preprocess(frames, "d1")[:, INNER], np.tile(X[INNER], (2, 1)))
+    with pytest.raises(ValueError):
+        spectra.preprocess(frames, "fft")
+
+
+def test_summarize_reports_peaks_and_snr():
+    mean = np.exp(-((X - 10) / 2) ** 2) + 2 * np.exp(-((X - 30) / 2) ** 2)
+    frames = np.stack([mean + 0.01, mean - 0.01])
+    result = spectra.summarize(frames, peaks=2)
+    assert result["frames"] == 2 and result["points"] == 40
+    assert [p["index"] for p in result["peaks"]] == [10, 30]
+    assert result["noise"] == pytest.approx(0.01)
+    assert result["snr"] > 10
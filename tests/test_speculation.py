@@ -0,0 +1,50 @@
+import threading
+import time
+
+from speculation import MISS, Speculator
+
+
+def test_take_returns_result_started_under_same_key():
+    spec = Speculator()
+    calls = []
+    spec.start(("table_names",), lambda: calls.append(1) or ["fruit", "orders"])
+    assert not spec.start(("table_names",), lambda: calls.append(2))  # 同一键进行中不重复提交
+    assert spec.take(("table_names",)) == ["fruit", "orders"]
+    assert calls == [1]
+    assert spec.take(("table_names",)) is MISS  # 结果只取用一次
+    summary = spec.summary()
+    assert summary["started"] == 1 and summary["hits"] == 1 and summary["misses"] == 1
+
+
+def test_take_waits_for_running_task_and_counts_saved_time():
+    spec = Speculator()
+    spec.start("k", lambda: time.sleep(0.1) or "v")
+    time.sleep(0.08)
+    assert spec.take("k") == "v"
+    assert spec.summary()["saved_ms"] > 50
+
+
+def test_errors_fall_back_to_miss():
+    spec = Speculator()
+    spec.start("k", lambda: 1 / 0)
+    assert spec.take("k") is MISS
+    assert spec.summary()["errors"] == 1
+
+
+def test_discard_does_not_wait_and_drain_does():
+    spec = Speculator()
+    started, release = threading.Event(), threading.Event()
+    ran = []
+    spec.start("running", lambda: started.set() or release.wait(2))
+    spec.start("queued", lambda: ran.append("queued"))
+    started.wait(1)
+    begin = time.monotonic()
+    spec.discard()
+    assert time.monotonic() - begin < 0.05
+    assert spec.take("running") is MISS
+    summary = spec.summary()
+    assert summary["discarded"] == 2 and summary["in_flight"] == 0 and summary["draining"] == 1
+    threading.Timer(0.05, release.set).start()
+    spec.drain(timeout=2)
+    assert spec.summary()["draining"] == 0
+    assert ran == []  # 排队中的任务被撤回
@@ -0,0 +1,93 @@
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+from cancellation import CancelToken, Cancelled
+from sql_batch import parametrize_insert, plan_batch, run_batch
+
+
+class _Cursor:
+    # sqlite3 使用 ? 占位符，与 MySQL 驱动的 %s 互换
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        return self._cursor.execute(sql.replace("%s", "?"), params)
+
+    def executemany(self, sql, params):
+        return self._cursor.executemany(sql.replace("%s", "?"), params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _Connection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return _Cursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (a INTEGER PRIMARY KEY, b TEXT)")
+    conn.commit()
+
+    @contextmanager
+    def transaction():
+        yield _Connection(conn)
+
+    transaction.conn = conn
+    return transaction
+
+
+def test_parametrize_insert_handles_literals():
+    template, rows = parametrize_insert("insert into t (a, b) values (1, 'x\\'y'), (-2, NULL)")
+    assert template == "INSERT INTO t ( a , b ) VALUES (%s, %s)"
+    assert rows == [(1, "x'y"), (-2, None)]
+    assert parametrize_insert("INSERT INTO t VALUES (NOW())") is None
+    assert parametrize_insert("INSERT INTO t VALUES (1) ON DUPLICATE KEY UPDATE a = 1") is None
+    assert parametrize_insert("SELECT 1") is None
+
+
+def test_plan_batch_merges_consecutive_identical_inserts():
+    steps = plan_batch(["INSERT INTO t VALUES (1)", "insert into t values (2), (3)",
+                        "UPDATE t SET a = 1 WHERE a = 2", "INSERT INTO t VALUES (4)"])
+    assert [(s.sources, s.params, s.counts) for s in steps] == [
+        ([0, 1], [(1,), (2,), (3,)], [1, 2]),
+        ([2], None, []),
+        ([3], [(4,)], [1]),
+    ]
+
+
+def test_run_batch_returns_results_in_statement_order(db):
+    statements = ["INSERT INTO t VALUES (1, 'a')", "INSERT INTO t VALUES (2, 'b'), (3, 'c')",
+                  "UPDATE t SET b = 'z' WHERE a > 1", "SELECT a, b FROM t ORDER BY a"]
+    results, error = run_batch(db, plan_batch(statements), len(statements))
+    assert error is None
+    assert results[:3] == [1, 2, 2]
+    assert results[3] == [{"a": 1, "b": "a"}, {"a": 2, "b": "z"}, {"a": 3, "b": "z"}]
+
+
+def test_run_batch_rolls_back_on_failure(db):
+    statements = ["INSERT INTO t VALUES (1, 'a')", "INSERT INTO missing VALUES (1)"]
+    results, error = run_batch(db, plan_batch(statements), len(statements))
+    assert error is not None and error[0] == [1]
+    assert db.conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_run_batch_rolls_back_and_reraises_when_cancelled(db):
+    token = CancelToken()
+    token.cancel("用户取消")
+    with pytest.raises(Cancelled):
+        run_batch(db, plan_batch(["INSERT INTO t VALUES (1, 'a')"]), 1, cancel=token)
+    assert db.conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
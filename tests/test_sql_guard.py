@@ -0,0 +1,95 @@
+import pytest
+
+from sql_guard import SQLGuard
+
+
+@pytest.fixture
+def guard():
+    return SQLGuard(max_rows=100, timeout_ms=0)
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM t", "SELECT * FROM t LIMIT 100"),
+    ("SELECT * FROM t LIMIT 5000", "SELECT * FROM t LIMIT 100"),
+    ("SELECT * FROM t LIMIT 10, 5000", "SELECT * FROM t LIMIT 10, 100"),
+    ("SELECT * FROM t LIMIT 10", "SELECT * FROM t LIMIT 10"),
+    ("SELECT * FROM t -- 注释", "SELECT * FROM t LIMIT 100 -- 注释"),
+    ("SELECT * FROM t WHERE id = 1 FOR UPDATE", "SELECT * FROM t WHERE id = 1 LIMIT 100 FOR UPDATE"),
+    ("SELECT * FROM t LOCK IN SHARE MODE", "SELECT * FROM t LIMIT 100 LOCK IN SHARE MODE"),
+    ("SELECT a FROM (SELECT * FROM t LIMIT 5000) x", "SELECT a FROM (SELECT * FROM t LIMIT 5000) x LIMIT 100"),
+])
+def test_limit_is_injected_or_tightened(guard, sql, expected):
+    verdict = guard.check(sql)
+    assert verdict.allowed and verdict.statement_type == "SELECT"
+    assert verdict.sql == expected
+
+
+@pytest.mark.parametrize("sql, reason", [
+    ("DROP TABLE t", "禁止执行 DROP"),
+    ("DELETE FROM t", "必须带 WHERE"),
+    ("UPDATE t SET a = 1", "必须带 WHERE"),
+    ("SELECT SLEEP(5)", "禁止使用 SLEEP"),
+    ("SELECT * FROM t INTO OUTFILE '/tmp/x'", "禁止使用 OUTFILE"),
+    ("SELECT 1; SELECT 2", "多条语句"),
+    ("", "无法识别"),
+])
+def test_dangerous_statements_are_rejected(guard, sql, reason):
+    verdict = guard.check(sql)
+    assert not verdict.allowed
+    assert reason in verdict.reason
+
+
+def test_keywords_inside_strings_are_ignored(guard):
+    verdict = guard.check('SELECT "DROP TABLE t" FROM t WHERE note = \'SLEEP(1)\'')
+    assert verdict.allowed
+
+
+def test_writes_with_where_are_allowed(guard):
+    verdict = guard.check("UPDATE t SET a = 1 WHERE id = 1")
+    assert verdict.allowed and not verdict.read_only
+    assert verdict.sql == "UPDATE t SET a = 1 WHERE id = 1"
+
+
+def test_timeout_hint_only_for_select():
+    guard = SQLGuard(max_rows=0, timeout_ms=250)
+    assert guard.check("SELECT a FROM t").sql == "SELECT /*+ MAX_EXECUTION_TIME(250) */ a FROM t"
+    assert guard.check("UPDATE t SET a = 1 WHERE id = 1").sql == "UPDATE t SET a = 1 WHERE id = 1"
+
+
+def test_estimate_rows_multiplies_joins_and_adds_selects():
+    plan = [{"id": 1, "rows": 100, "filtered": 10}, {"id": 1, "rows": 50, "filtered": 100}, {"id": 2, "rows": 7}]
+    assert SQLGuard.estimate_rows(plan) == 100 * 50 + 7
+    assert SQLGuard.estimate_rows([]) is None
+    assert SQLGuard.estimate_rows("not a plan") is None
+
+
+def test_scan_threshold_rejects_or_asks_for_confirmation():
+    explain = lambda sql: [{"id": 1, "rows": 1000}]
+    rejected = SQLGuard(max_scan_rows=10).check("SELECT * FROM t", explain_fn=explain)
+    assert not rejected.allowed and rejected.estimated_rows == 1000
+    confirm = SQLGuard(max_scan_rows=10, on_exceed="confirm").check("SELECT * FROM t", explain_fn=explain)
+    assert confirm.allowed and confirm.needs_confirm
+
+
+def test_with_prefixed_writes_are_classified_by_main_statement(guard):
+    rejected = guard.check("WITH x AS (SELECT 1) DELETE FROM fruit_price")
+    assert not rejected.allowed and rejected.statement_type == "DELETE"
+    assert "必须带 WHERE" in rejected.reason
+
+    verdict = guard.check("WITH x AS (SELECT id FROM t WHERE a = 1) DELETE FROM fruit_price WHERE id IN (SELECT id FROM x)")
+    assert verdict.allowed and not verdict.read_only
+    assert "LIMIT" not in verdict.sql
+
+    read = guard.check("WITH x AS (SELECT * FROM t) SELECT * FROM x")
+    assert read.read_only and read.sql.endswith("LIMIT 100")
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM t WHERE id = 1 FOR UPDATE",
+    "SELECT * FROM t FOR SHARE",
+    "SELECT * FROM t LOCK IN SHARE MODE",
+])
+def test_locking_reads_are_not_read_only(guard, sql):
+    verdict = guard.check(sql)
+    assert verdict.allowed and verdict.locking
+    assert not verdict.read_only
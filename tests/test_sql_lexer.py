@@ -0,0 +1,32 @@
+from sql_lexer import (created_tables, rename_tables, split_statements, statement_type, strip_comments, table_refs,
+                       tokenize)
+
+
+def test_split_ignores_semicolons_in_strings_and_comments():
+    sql = "SELECT ';' FROM a; /* ; */ INSERT INTO b VALUES (1);;  -- 末尾注释"
+    assert split_statements(sql) == ["SELECT ';' FROM a", "/* ; */ INSERT INTO b VALUES (1)"]
+
+
+def test_table_refs_skip_ctes_and_include_subqueries():
+    tokens = tokenize("WITH c AS (SELECT * FROM x) SELECT * FROM c JOIN `Fruit` f ON 1=1 "
+                      "WHERE a IN (SELECT id FROM y)")
+    assert [tokens[i].name for i in table_refs(tokens)] == ["x", "Fruit", "y"]
+
+
+def test_created_and_renamed_tables():
+    assert created_tables("CREATE TEMPORARY TABLE IF NOT EXISTS tmp_a (id int)") == ["tmp_a"]
+    assert rename_tables('SELECT tmp FROM tmp JOIN `tmp` WHERE x = "tmp"', {"tmp": "t2"}) == \
+        'SELECT tmp FROM t2 JOIN `t2` WHERE x = "tmp"'
+
+
+def test_statement_type_and_comments():
+    assert statement_type("  (SELECT 1)") == "SELECT"
+    assert statement_type("/* 注释 */ desc t") == "DESC"
+    assert statement_type("123") is None
+    assert "注释" not in strip_comments("SELECT 1 -- 注释\n/* 注释 */ FROM t")
+
+
+def test_statement_type_resolves_with_to_main_statement():
+    assert statement_type("WITH x AS (SELECT 1) SELECT * FROM x") == "WITH"
+    assert statement_type("WITH RECURSIVE x (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM x) DELETE FROM t") == "DELETE"
+    assert statement_type("WITH x AS (SELECT 1), y AS (SELECT 2) UPDATE t SET a = 1 WHERE 1") == "UPDATE"
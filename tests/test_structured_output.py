@@ -0,0 +1,114 @@
+import pytest
+
+from structured_output import (
+    ANALYZE_SCHEMA, EMAIL_SCHEMA, PLAN_SCHEMA, StructuredOutputError, code_blocks, complete_structured, parse_json,
+    reask_prompt, validate,
+)
+
+
+def analyze(**overrides):
+    result = {"response": "好的", "call": {"name": "query_db", "arguments": {"sql": "SELECT 1"}}, "end": False}
+    result.update(overrides)
+    return result
+
+
+def test_valid_analyze_and_plan():
+    assert validate(analyze(), ANALYZE_SCHEMA) == []
+    assert validate(analyze(call={"name": None}), ANALYZE_SCHEMA) == []
+    assert validate({"chain": ["2-数据库操作：查询", "4-直接生成：总结"], "first": analyze()}, PLAN_SCHEMA) == []
+
+
+def test_errors_report_paths():
+    assert validate(analyze(end="no"), ANALYZE_SCHEMA) == ["$.end: 期望类型 boolean，实际为 str"]
+    assert validate({"response": "x", "call": {}}, ANALYZE_SCHEMA) == ["$: 缺少字段 end", "$.call: 缺少字段 name"]
+    errors = validate({"chain": [], "first": analyze(call={"name": 1})}, PLAN_SCHEMA)
+    assert errors == ["$.chain: 至少需要 1 项", "$.first.call.name: 期望类型 ['string', 'null']，实际为 int"]
+    assert validate({"chain": ["数据库操作"], "first": analyze()}, PLAN_SCHEMA) == [
+        "$.chain[0]: '数据库操作' 不匹配 ^\\d-"]
+
+
+def test_booleans_are_not_numbers_and_enum():
+    assert validate(True, {"type": "number"})
+    assert validate(3, {"type": "integer"}) == []
+    assert validate("c", {"enum": ["a", "b"]}) == ["$: 'c' 不在可选值 ['a', 'b'] 中"]
+
+
+def test_email_schema_requires_all_fields():
+    assert validate({"to_addr": "a@b.com", "subject": "s"}, EMAIL_SCHEMA) == ["$: 缺少字段 content"]
+
+
+@pytest.mark.parametrize("text", [
+    '{"a": 1}',
+    '```json\n{"a": 1}\n```',
+    '思考过程……\n```\n{"a": 1,}\n```',
+    '{"a": 1, // 注释\n}',
+    '{"a": 1 /* 块注释 */}',
+    '前言 {"b": 2} 然后 {"a": 1}',
+])
+def test_parse_json_repairs(text):
+    assert parse_json(text) == {"a": 1}
+
+
+def test_parse_json_python_literals_and_strings_untouched():
+    assert parse_json('{"end": True, "x": None, "s": "True, // 不是注释"}') == {
+        "end": True, "x": None, "s": "True, // 不是注释"}
+
+
+def test_parse_json_prefers_last_json_block():
+    assert parse_json('```json\n{"a": 1}\n```\n修正：\n```json\n{"a": 2}\n```') == {"a": 2}
+
+
+def test_parse_json_failure():
+    with pytest.raises(StructuredOutputError):
+        parse_json("完全不是 JSON")
+
+
+def test_code_blocks_filters_language():
+    text = "```sql\nSELECT 1\n```\n```python\nprint()\n```\n```\nSELECT 2\n```"
+    assert code_blocks(text, "SQL") == ["SELECT 1", "SELECT 2"]
+    assert len(code_blocks(text)) == 3
+    assert code_blocks(None) == []
+
+
+def test_reask_prompt_lists_at_most_five_errors():
+    prompt = reask_prompt([f"错误{i}" for i in range(7)])
+    assert "- 错误4" in prompt and "错误5" not in prompt
+    assert "JSON" in prompt
+
+
+def test_complete_structured_reasks_with_errors_and_previous_output():
+    outputs = iter(['{"response": "x"}', '```json\n{"response": "好的", "call": {"name": null}, "end": true}\n```'])
+    seen, checked = [], []
+
+    def ask(messages, attempt):
+        seen.append((attempt, list(messages)))
+        return next(outputs)
+
+    original = [{"role": "user", "content": "需求"}]
+    result = complete_structured(ask, original, ANALYZE_SCHEMA, on_checked=lambda a, e: checked.append((a, e)))
+    assert result["end"] is True
+    assert [attempt for attempt, _ in seen] == [0, 1]
+    reask = seen[1][1]
+    assert reask[:2] == [original[0], {"role": "assistant", "content": '{"response": "x"}'}]
+    assert "缺少字段 call" in reask[2]["content"]
+    assert original == [{"role": "user", "content": "需求"}]  # 不修改调用方的消息列表
+    assert checked[0][1] and checked[1] == (1, [])
+
+
+def test_complete_structured_gives_up_after_max_reasks():
+    calls = []
+
+    def ask(messages, attempt):
+        calls.append(attempt)
+        return "不是 JSON"
+
+    with pytest.raises(StructuredOutputError, match="不符合要求"):
+        complete_structured(ask, [], ANALYZE_SCHEMA, max_reasks=2)
+    assert calls == [0, 1, 2]
+
+
+def test_complete_structured_plan_path_without_reask():
+    plan = '{"chain": ["1-果蔬分析：检测苹果", "4-直接生成：总结"], "first": ' \
+           '{"response": "", "call": {"name": "analyze", "arguments": {"prompt": "检测苹果"}}, "end": false}}'
+    result = complete_structured(lambda messages, attempt: plan, [], PLAN_SCHEMA, max_reasks=0)
+    assert result["first"]["call"]["arguments"] == {"prompt": "检测苹果"}
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from table_resolver import TableResolver, levenshtein, similarity, tokens
+
+TABLES = ["fruit_price", "inspection_record", "orders", "order_items"]
+
+
+def test_levenshtein():
+    assert levenshtein("kitten", "sitting") == 3
+    assert levenshtein("", "abc") == 3
+    assert levenshtein("same", "same") == 0
+
+
+def test_tokens_split_camel_snake_and_plural():
+    assert tokens("FruitPrices") == ["fruit", "price"]
+    assert tokens("inspection_records_2024") == ["inspection", "record", "2024"]
+    assert tokens("categories") == ["category"]
+    assert tokens("boxes") == ["box"]
+    assert tokens("class") == ["class"]
+
+
+def test_similarity_prefers_token_overlap():
+    assert similarity("FruitPrices", "fruit_price") == 1.0
+    assert similarity("fruit_pirce", "fruit_price") > similarity("fruit_pirce", "orders")
+
+
+@pytest.mark.parametrize("name, expected, reason", [
+    ("orders", "orders", "exact"),
+    ("ORDERS", "orders", "case"),
+    ("FruitPrices", "fruit_price", "similarity"),
+    ("inspection_records", "inspection_record", "similarity"),
+])
+def test_resolve_locally(name, expected, reason):
+    table, score, why = TableResolver().resolve(name, TABLES)
+    assert (table, why) == (expected, reason) and score >= 0.75
+
+
+def test_ambiguous_or_unrelated_names_are_left_to_the_llm():
+    resolver = TableResolver()
+    assert resolver.resolve("order", TABLES)[0] == "orders"
+    table, _, why = resolver.resolve("order_item_s", ["order_items", "order_item"])
+    assert (table, why) == (None, "low_confidence")
+    assert resolver.resolve("weather", TABLES)[2] == "low_confidence"
+    assert resolver.resolve("x", []) == (None, 0.0, "none")
+
+
+def test_learned_alias_persists(tmp_path):
+    path = tmp_path / "aliases.json"
+    resolver = TableResolver(alias_path=str(path))
+    resolver.learn("价格表", "fruit_price")
+    resolver.learn("价格表", "fruit_price")
+    assert json.loads(path.read_text(encoding="utf-8")) == {"价格表": "fruit_price"}
+    reloaded = TableResolver(alias_path=str(path))
+    assert reloaded.resolve("价格表", TABLES) == ("fruit_price", 1.0, "alias")
+    # 别名指向的表已不存在时不采用
+    assert reloaded.resolve("价格表", ["orders"])[0] is None
+
+
+def test_corrupt_alias_file_is_ignored(tmp_path):
+    path = tmp_path / "aliases.json"
+    path.write_text("{坏", encoding="utf-8")
+    assert TableResolver(alias_path=str(path)).aliases() == {}
+
+
+def test_pinyin_initials_match_when_available():
+    pytest.importorskip("pypinyin")
+    assert TableResolver().resolve("水果价格", ["sgjg", "orders"])[0] == "sgjg"
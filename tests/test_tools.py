@@ -0,0 +1,85 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tools import FINISH, FINISH_SPEC, ToolRegistry
+
+
+def registry(calls=None):
+    calls = [] if calls is None else calls
+    tools = ToolRegistry()
+    tools.register("query_db", "数据库", {"sql": {"type": "string", "description": "SQL"}},
+                   lambda args: calls.append(("query_db", args)) or f"rows for {args.get('sql')}",
+                   coalesce=lambda args: args.get("sql") or None)
+    tools.register("analyze", "分析", {"prompt": {"type": "string"}}, lambda args: f"analyzed {args['prompt']}")
+    tools.register("device", "设备", {"device": {"type": "string"}}, lambda args: "spectrum", required=[],
+                   concurrent=True)
+    return tools
+
+
+def test_specs_follow_openai_function_format():
+    specs = registry().specs()
+    assert [s["function"]["name"] for s in specs] == ["query_db", "analyze", "device"]
+    assert specs[0]["type"] == "function"
+    assert specs[0]["function"]["parameters"]["required"] == ["sql"]
+    assert specs[2]["function"]["parameters"]["required"] == []
+    assert FINISH_SPEC["function"]["name"] == FINISH and FINISH not in registry()
+
+
+def test_dispatch_native_tool_call_arguments():
+    calls = []
+    tools = registry(calls)
+    assert tools.dispatch("query_db", '{"sql": "SELECT 1"}') == "rows for SELECT 1"
+    assert tools.dispatch("query_db", {"sql": "SELECT 2"}) == "rows for SELECT 2"
+    assert tools.dispatch("query_db", "not json") == "rows for None"
+    assert calls[-1] == ("query_db", {})
+    assert tools.dispatch("unknown", {}) == "Tool calling 错误"
+    assert tools.dispatch(None, {}) == "Tool calling 错误"
+
+
+def test_resolve_accepts_text_protocol_variants():
+    tools = registry()
+    assert tools.resolve("analyze_image").name == "analyze"
+    assert "query_db_v2" in tools and "search" not in tools
+
+
+def test_coalesce_key_only_for_tools_that_declare_it():
+    tools = registry()
+    assert tools.coalesce_key("query_db", {"sql": "SELECT 1"}) == ("query_db", "SELECT 1")
+    assert tools.coalesce_key("query_db", {"sql": ""}) is None
+    assert tools.coalesce_key("analyze", {"prompt": "x"}) is None
+
+
+def test_prompt_table_lists_arguments():
+    table = registry().prompt_table()
+    assert '| query_db | 数据库 | {"sql": "<SQL>"} |' in table
+    assert "| analyze | 分析 |" in table
+
+
+def test_run_all_runs_concurrent_tools_in_parallel_and_keeps_order():
+    tools = ToolRegistry()
+    barrier = threading.Barrier(2, timeout=1)
+    threads = {}
+
+    def slow(args):
+        barrier.wait()  # 两个调用必须同时在执行才能通过
+        threads[args["i"]] = threading.current_thread().name
+        return f"r{args['i']}"
+
+    tools.register("read", "只读", {"i": {"type": "integer"}}, slow, concurrent=True)
+    tools.register("write", "写入", {"i": {"type": "integer"}}, lambda args: f"w{args['i']}")
+    calls = [{"name": "read", "arguments": {"i": 0}}, {"name": "write", "arguments": {"i": 1}},
+             {"name": "read", "arguments": {"i": 2}}]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        reports = tools.run_all(calls, lambda c: tools.dispatch(c["name"], c["arguments"]), executor)
+    assert reports == ["r0", "w1", "r2"]
+    assert all(name.startswith("ThreadPoolExecutor") for name in threads.values())
+
+
+def test_run_all_without_executor_or_single_call_is_sequential():
+    tools = registry()
+    order = []
+    run = lambda c: order.append(threading.current_thread()) or c["name"]
+    assert tools.run_all([{"name": "device"}], run, ThreadPoolExecutor(max_workers=1)) == ["device"]
+    assert tools.run_all([{"name": "device"}, {"name": "analyze"}], run) == ["device", "analyze"]
+    assert set(order) == {threading.current_thread()}
+    assert tools.run_all([], run) == []
@@ -0,0 +1,120 @@
+import json
+import threading
+
+import pytest
+
+from tracing import Tracer
+
+
+def test_nested_spans_share_trace_and_export_once_at_root(tmp_path):
+    path = tmp_path / "traces" / "otlp.jsonl"
+    tracer = Tracer(export_path=str(path))
+    with tracer.span("turn") as root:
+        with tracer.span("tool.query_db") as tool:
+            with tracer.span("db.execute") as db:
+                assert tracer.current() is db
+            assert not path.exists()
+        assert tracer.current() is root
+    assert tracer.current() is None
+    assert tool.parent_id == root.span_id and db.parent_id == tool.span_id
+    assert root.parent_id is None and {tool.trace_id, db.trace_id} == {root.trace_id}
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1
+    spans = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["db.execute", "tool.query_db", "turn"]
+
+
+def test_separate_roots_get_separate_traces():
+    tracer = Tracer()
+    with tracer.span("a") as a:
+        pass
+    with tracer.span("b") as b:
+        pass
+    assert a.trace_id != b.trace_id
+
+
+def test_otlp_attributes_and_error_status():
+    tracer = Tracer(service_name="svc")
+    with pytest.raises(ValueError):
+        with tracer.span("chat", {"flag": True, "count": 3, "ratio": 0.5, "model": "qwen"}) as span:
+            span.set("ignored", None)
+            raise ValueError("坏了")
+    payload = tracer.to_otlp([span])
+    resource = payload["resourceSpans"][0]["resource"]["attributes"]
+    assert resource == [{"key": "service.name", "value": {"stringValue": "svc"}}]
+    otlp = payload["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert {a["key"]: a["value"] for a in otlp["attributes"]} == {
+        "flag": {"boolValue": True},
+        "count": {"intValue": "3"},
+        "ratio": {"doubleValue": 0.5},
+        "model": {"stringValue": "qwen"},
+    }
+    assert otlp["status"] == {"code": 2, "message": "ValueError: 坏了"}
+    assert "parentSpanId" not in otlp
+    assert int(otlp["endTimeUnixNano"]) >= int(otlp["startTimeUnixNano"])
+
+
+def test_summary_counts_errors_tokens_and_cache_hits():
+    tracer = Tracer()
+    for cached in (True, False, False):
+        with tracer.span("chat", {"gen_ai.usage.input_tokens": 10, "gen_ai.usage.output_tokens": 2, "cache.hit": cached}):
+            pass
+    with pytest.raises(RuntimeError):
+        with tracer.span("chat"):
+            raise RuntimeError
+    item = tracer.summary()["chat"]
+    assert item["count"] == 4 and item["errors"] == 1
+    assert item["gen_ai.usage.input_tokens"] == 30 and item["gen_ai.usage.output_tokens"] == 6
+    assert item["cache_hits"] == 1 and item["cache_misses"] == 2
+    assert item["p50_ms"] <= item["p99_ms"] <= item["max_ms"]
+    tracer.reset()
+    assert tracer.summary() == {}
+
+
+def test_wrap_propagates_parent_into_worker_thread(tmp_path):
+    path = tmp_path / "otlp.jsonl"
+    tracer = Tracer(export_path=str(path))
+    seen = {}
+
+    def work():
+        with tracer.span("speculate") as span:
+            seen["span"] = span
+        seen["after"] = tracer.current()
+
+    with tracer.span("turn") as root:
+        worker = threading.Thread(target=tracer.wrap(work))
+        worker.start()
+        worker.join()
+    assert seen["span"].parent_id == root.span_id and seen["span"].trace_id == root.trace_id
+    assert seen["after"] is root  # 仅在被包装的函数内有效，不影响提交者的栈
+    spans = json.loads(path.read_text(encoding="utf-8"))["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["speculate", "turn"]
+
+
+def test_wrap_without_current_span_returns_function_unchanged():
+    tracer = Tracer()
+    work = lambda: None
+    assert tracer.wrap(work) is work
+
+
+def test_child_finishing_after_root_is_exported_separately(tmp_path):
+    path = tmp_path / "otlp.jsonl"
+    tracer = Tracer(export_path=str(path))
+    started, release = threading.Event(), threading.Event()
+
+    def late():
+        with tracer.span("llm.attempt"):
+            started.set()
+            release.wait(2)
+
+    with tracer.span("turn"):
+        worker = threading.Thread(target=tracer.wrap(late))
+        worker.start()
+        started.wait(2)
+    release.set()
+    worker.join()
+    batches = [json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+               for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [[s["name"] for s in spans] for spans in batches] == [["turn"], ["llm.attempt"]]
+    assert batches[1][0]["traceId"] == batches[0][0]["traceId"]
+    assert tracer._pending == {}
@@ -0,0 +1,63 @@
+import pytest
+
+from usage import BudgetExceeded, UsageLedger, _budgets_from_env
+
+
+def test_record_aggregates_by_every_scope_and_prices_tokens():
+    ledger = UsageLedger(prices={"m": [1.0, 2.0]})
+    ledger.record("m", 1000, 500, cached_tokens=200, turn="t1", session="s1", tool="query_db")
+    ledger.record("m", 1000, 0, turn="t2", session="s1")
+    assert ledger.totals("turn")["t1"]["total_tokens"] == 1500
+    session = ledger.totals("session")["s1"]
+    assert session["calls"] == 2 and session["prompt_tokens"] == 2000 and session["cached_tokens"] == 200
+    assert session["cost"] == pytest.approx(3.0)
+    assert set(ledger.totals("tool")) == {"query_db", "agent"}
+    summary = ledger.summary()
+    assert summary["total"]["calls"] == 2 and summary["by_model"]["m"]["completion_tokens"] == 500
+
+
+def test_unknown_scope_and_unpriced_model():
+    ledger = UsageLedger()
+    assert ledger.cost("unknown-model", 1000, 1000) == 0.0
+    with pytest.raises(ValueError):
+        ledger.totals("user")
+
+
+def test_soft_budget_downgrades_and_hard_budget_refuses():
+    ledger = UsageLedger(budgets={"turn": {"soft": 100, "hard": 200}})
+    assert ledger.admit("qwen-max", turn="t") == "qwen-max"
+    ledger.record("qwen-max", 100, 0, turn="t")
+    assert ledger.admit("qwen-max", turn="t") == "qwen-plus"
+    assert ledger.admit("unmapped", turn="t") == "unmapped"
+    assert ledger.admit("qwen-max", turn="other") == "qwen-max"
+    ledger.record("qwen-plus", 100, 0, turn="t")
+    with pytest.raises(BudgetExceeded) as info:
+        ledger.admit("qwen-max", turn="t")
+    assert (info.value.scope, info.value.key, info.value.used, info.value.limit) == ("turn", "t", 200, 200)
+    assert ledger.summary()["downgrades"] == 1 and ledger.summary()["refusals"] == 1
+
+
+def test_session_budget_spans_turns():
+    ledger = UsageLedger(budgets={"session": {"hard": 100}})
+    ledger.record("m", 60, 0, turn="t1", session="s")
+    ledger.record("m", 60, 0, turn="t2", session="s")
+    with pytest.raises(BudgetExceeded) as info:
+        ledger.admit("m", turn="t3", session="s")
+    assert info.value.scope == "session"
+    assert ledger.admit("m", turn="t3", session="other") == "m"
+
+
+def test_old_keys_are_evicted():
+    ledger = UsageLedger(max_keys=2)
+    for turn in ("a", "b", "c"):
+        ledger.record("m", 1, 0, turn=turn)
+    assert list(ledger.totals("turn")) == ["b", "c"]
+    assert ledger.used("turn", "a") == 0 and ledger.used("turn", None) == 0
+
+
+def test_budgets_from_env(monkeypatch):
+    monkeypatch.setenv("AGENT_TURN_SOFT_TOKENS", "10")
+    monkeypatch.setenv("AGENT_TURN_MAX_TOKENS", "20")
+    monkeypatch.delenv("AGENT_SESSION_SOFT_TOKENS", raising=False)
+    monkeypatch.delenv("AGENT_SESSION_MAX_TOKENS", raising=False)
+    assert _budgets_from_env() == {"turn": {"soft": 10, "hard": 20}}
@@ -0,0 +1,132 @@
+"""
+工具注册表：每个工具声明名称、说明、JSON Schema 参数与处理函数，
+既可导出为 OpenAI 兼容的 tools 列表供模型原生调用，也可按名称 O(1) 分发
+"""
+import json
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List, Optional
+
+# 原生函数调用下的结束信号：模型调用它表示用户目的已全部实现，只用于结束工作流，不作为工具分发
+FINISH = "finish"
+FINISH_SPEC = {
+    "type": "function",
+    "function": {
+        "name": FINISH,
+        "description": "结束工作流：用户目的已经全部实现、无需再执行任何任务时调用",
+        "parameters": {"type": "object", "properties": {}, "required": []},
+    },
+}
+
+
+class Tool:
+    """
+    coalesce: 由参数计算合并键的函数；返回 None 或未设置时不合并。
+      只应为结果仅取决于参数、且无外部副作用的工具设置
+    concurrent: 可与同一轮的其他调用并发执行，即不修改对话记忆、不占用数据库连接等独占资源
+    """
+
+    def __init__(self, name: str, description: str, parameters: Dict, handler: Callable[[Dict], str],
+                 coalesce: Optional[Callable[[Dict], Optional[Hashable]]] = None, concurrent=False):
+        self.name = name
+        self.description = description
+        self.parameters = parameters
+        self.handler = handler
+        self.coalesce = coalesce
+        self.concurrent = concurrent
+
+    def spec(self) -> Dict:
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.parameters,
+            },
+        }
+
+
+class ToolRegistry:
+    def __init__(self):
+        self._tools: Dict[str, Tool] = {}
+
+    def register(self, name: str, description: str, properties: Dict, handler: Callable[[Dict], str],
+                 required: Optional[List[str]] = None,
+                 coalesce: Optional[Callable[[Dict], Optional[Hashable]]] = None, concurrent=False) -> Tool:
+        parameters = {
+            "type": "object",
+            "properties": properties,
+            "required": list(properties) if required is None else required,
+        }
+        tool = Tool(name, description, parameters, handler, coalesce, concurrent)
+        self._tools[name] = tool
+        return tool
+
+    def __contains__(self, name) -> bool:
+        return self.resolve(name) is not None
+
+    def names(self) -> List[str]:
+        return list(self._tools)
+
+    def specs(self) -> List[Dict]:
+        return [t.spec() for t in self._tools.values()]
+
+    def resolve(self, name: Optional[str]) -> Optional[Tool]:
+        if not name:
+            return None
+        tool = self._tools.get(name)
+        if tool is None:
+            # 兼容文本协议下模型输出的变体名（如 analyze_image），取最长的前缀匹配
+            prefixes = [n for n in self._tools if name.startswith(n)]
+            if prefixes:
+                tool = self._tools[max(prefixes, key=len)]
+        return tool
+
+    @staticmethod
+    def parse_arguments(arguments) -> Dict:
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments) if arguments.strip() else {}
+            except json.JSONDecodeError:
+                arguments = {}
+        return arguments or {}
+
+    def coalesce_key(self, name: Optional[str], arguments) -> Optional[Hashable]:
+        tool = self.resolve(name)
+        if tool is None or tool.coalesce is None:
+            return None
+        key = tool.coalesce(self.parse_arguments(arguments))
+        return None if key is None else (tool.name, key)
+
+    def dispatch(self, name: Optional[str], arguments) -> str:
+        tool = self.resolve(name)
+        if tool is None:
+            return "Tool calling 错误"
+        return tool.handler(self.parse_arguments(arguments))
+
+    def run_all(self, calls: List[Dict], run: Callable[[Dict], str], executor: Optional[Executor] = None) -> List[str]:
+        """
+        执行同一轮给出的多个调用，结果按调用顺序返回：可并发的工具提交到 executor 同时执行，
+        其余在当前线程依次执行；只有一个调用或未提供 executor 时全部依次执行
+        """
+        futures = {}
+        if executor is not None and len(calls) > 1:
+            for i, call in enumerate(calls):
+                tool = self.resolve(call.get("name"))
+                if tool is not None and tool.concurrent:
+                    futures[i] = executor.submit(run, call)
+        return [futures[i].result() if i in futures else run(call) for i, call in enumerate(calls)]
+
+    def prompt_table(self) -> str:
+        # 文本协议回退时使用的 Markdown 工具表
+        rows = ["| 工具名 | 应用场景 | 参数规则 |", "| --- | --- | --- |"]
+        for tool in self._tools.values():
+            props = tool.parameters.get("properties", {})
+            args = json.dumps(
+                {k: f"<{v.get('description', '')}>" for k, v in props.items()}, ensure_ascii=False
+            ) if props else "<无参数>"
+            rows.append(f"| {tool.name} | {tool.description} | {args} |")
+        return "\n".join(rows)
+
+
+tool_executor = ThreadPoolExecutor(max_workers=int(os.getenv("AGENT_TOOL_WORKERS", "4")), thread_name_prefix="tool")
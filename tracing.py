@@ -0,0 +1,249 @@
+"""
+链路追踪：记录 Agent 各阶段（任务拆解、工具调用、数据库、图像流水线、大模型调用）的耗时，
+并导出为 OpenTelemetry (OTLP/JSON) 兼容格式
+"""
+import functools
+import json
+import os
+import threading
+import time
+import urllib.request
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Optional[Dict] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, key: str, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key, value) -> Dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+class Tracer:
+    """
+    线程安全的轻量追踪器：每个线程维护独立的 span 栈，根 span 结束时整条 trace 一次性导出；
+    交给其他线程执行的函数用 wrap 绑定提交者的当前 span，其中开始的 span 归入同一条 trace
+    export_path: 以 JSON Lines 形式追加写入 OTLP 数据的本地文件
+    endpoint:    OTLP/HTTP 收集器地址，例如 http://localhost:4318/v1/traces
+    """
+
+    def __init__(self, service_name="agrimind", export_path=None, endpoint=None, window=1000):
+        self.service_name = service_name
+        self.export_path = export_path
+        self.endpoint = endpoint
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[Span]] = {}
+        self._durations: Dict[str, deque] = {}
+        self._counters: Dict[str, Dict[str, float]] = {}
+        self._window = window
+        # 最近已导出的 trace，其后才结束的子 span 单独补发，不在 _pending 中滞留
+        self._exported: "OrderedDict[str, None]" = OrderedDict()
+
+    def _stack(self) -> List[Span]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self) -> Optional[Span]:
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def set_attribute(self, key: str, value):
+        span = self.current()
+        if span is not None:
+            span.set(key, value)
+
+    @contextmanager
+    def span(self, name: str, attributes: Optional[Dict] = None):
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        span = Span(name, trace_id, parent.span_id if parent else None, attributes)
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            stack.pop()
+            self._finish(span, is_root=parent is None)
+
+    @contextmanager
+    def attach(self, parent: Optional[Span]):
+        """在当前线程中以另一线程的 parent 作为当前 span，其间开始的 span 成为它的子 span"""
+        if parent is None:
+            yield
+            return
+        stack = self._stack()
+        stack.append(parent)
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    def wrap(self, fn):
+        """绑定调用时的当前 span：提交到线程池或后台线程的函数执行时沿用提交者的 trace"""
+        parent = self.current()
+        if parent is None:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.attach(parent):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def traced(self, name: str):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _finish(self, span: Span, is_root: bool):
+        with self._lock:
+            self._pending.setdefault(span.trace_id, []).append(span)
+            durations = self._durations.setdefault(span.name, deque(maxlen=self._window))
+            durations.append(span.duration_ms)
+            counter = self._counters.setdefault(span.name, {"count": 0, "errors": 0, "total_ms": 0.0})
+            counter["count"] += 1
+            counter["total_ms"] += span.duration_ms
+            if span.error:
+                counter["errors"] += 1
+            for key in ("gen_ai.usage.input_tokens", "gen_ai.usage.output_tokens"):
+                if key in span.attributes:
+                    counter[key] = counter.get(key, 0) + span.attributes[key]
+            if "cache.hit" in span.attributes:
+                hit_key = "cache_hits" if span.attributes["cache.hit"] else "cache_misses"
+                counter[hit_key] = counter.get(hit_key, 0) + 1
+            if is_root:
+                spans = self._pending.pop(span.trace_id)
+                self._exported[span.trace_id] = None
+                if len(self._exported) > self._window:
+                    self._exported.popitem(last=False)
+            elif span.trace_id in self._exported:
+                # 根 span 结束后才完成的子 span（如落败的对冲请求、被丢弃的推测任务）
+                spans = self._pending.pop(span.trace_id)
+            else:
+                spans = None
+        if spans:
+            self._export(spans)
+
+    def to_otlp(self, spans: List[Span]) -> Dict:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "agrimind.tracing"},
+                    "spans": [s.to_otlp() for s in spans],
+                }],
+            }]
+        }
+
+    def _export(self, spans: List[Span]):
+        if not self.export_path and not self.endpoint:
+            return
+        payload = json.dumps(self.to_otlp(spans), ensure_ascii=False)
+        if self.export_path:
+            with self._lock:
+                directory = os.path.dirname(self.export_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(payload + "\n")
+        if self.endpoint:
+            # 上报放到后台线程，避免收集器延迟拖慢 turn
+            threading.Thread(target=self._post, args=(payload,), daemon=True).start()
+
+    def _post(self, payload: str):
+        req = urllib.request.Request(
+            self.endpoint,
+            data=payload.encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            urllib.request.urlopen(req, timeout=5).close()
+        except Exception as e:
+            print(f"[tracing] 上报失败：{e}")
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            result = {}
+            for name, counter in self._counters.items():
+                durations = list(self._durations.get(name, []))
+                item = dict(counter)
+                item["total_ms"] = round(counter["total_ms"], 2)
+                item["avg_ms"] = round(counter["total_ms"] / counter["count"], 2) if counter["count"] else 0.0
+                item["p50_ms"] = round(_percentile(durations, 0.5), 2)
+                item["p99_ms"] = round(_percentile(durations, 0.99), 2)
+                item["max_ms"] = round(max(durations), 2) if durations else 0.0
+                result[name] = item
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._pending.clear()
+            self._exported.clear()
+            self._durations.clear()
+            self._counters.clear()
+
+
+tracer = Tracer(
+    export_path=os.getenv("AGENT_TRACE_FILE") or None,
+    endpoint=os.getenv("AGENT_OTLP_ENDPOINT") or None,
+)
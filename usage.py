@@ -0,0 +1,145 @@
+"""
+Token 与费用台账：记录每次大模型调用的输入/输出/缓存 token，按 turn、会话、工具、模型聚合，
+并在预算触线时降级模型或拒绝请求
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# 每千 token 单价（元），[输入, 输出]；未列出的模型按 0 计费，可通过 AGENT_MODEL_PRICES 覆盖
+DEFAULT_PRICES = {
+    "qwen-max": [0.0024, 0.0096],
+    "qwen-plus": [0.0008, 0.002],
+    "qwen-turbo": [0.0003, 0.0006],
+    "qwen-coder-plus": [0.0035, 0.007],
+    "qwen-vl-plus": [0.0015, 0.0045],
+    "glm-4-plus": [0.05, 0.05],
+}
+
+# 软预算触线后的降级路径
+DOWNGRADE = {
+    "qwen-max": "qwen-plus",
+    "qwen-plus": "qwen-turbo",
+    "qwen-coder-plus": "qwen-turbo",
+    "glm-4-plus": "glm-4-air",
+}
+
+SCOPES = ("turn", "session", "tool", "model")
+
+
+class BudgetExceeded(RuntimeError):
+    def __init__(self, scope: str, key: str, used: int, limit: int):
+        super().__init__(f"{scope} <{key}> 的 token 用量 {used} 已达到上限 {limit}")
+        self.scope = scope
+        self.key = key
+        self.used = used
+        self.limit = limit
+
+
+def _empty() -> Dict:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "total_tokens": 0, "cost": 0.0}
+
+
+class UsageLedger:
+    """
+    budgets: {"turn": {"soft": 20000, "hard": 60000}, "session": {...}}
+      soft: 超出后按 DOWNGRADE 降级模型；hard: 超出后拒绝新的调用。0 或缺省表示不限制
+    """
+
+    def __init__(self, prices: Optional[Dict] = None, budgets: Optional[Dict] = None, max_keys=1000):
+        self.prices = dict(DEFAULT_PRICES, **(prices or {}))
+        self.budgets = budgets or {}
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._totals: Dict[str, OrderedDict] = {scope: OrderedDict() for scope in SCOPES}
+        self._grand = _empty()
+        self.downgrades = 0
+        self.refusals = 0
+
+    def _bucket(self, scope: str, key: str) -> Dict:
+        buckets = self._totals[scope]
+        if key not in buckets:
+            buckets[key] = _empty()
+            # turn/会话维度只保留最近的 max_keys 个，避免长期运行时无限增长
+            while len(buckets) > self.max_keys:
+                buckets.popitem(last=False)
+        buckets.move_to_end(key)
+        return buckets[key]
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        price_in, price_out = self.prices.get(model, [0.0, 0.0])
+        return prompt_tokens / 1000 * price_in + completion_tokens / 1000 * price_out
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens=0,
+               turn: Optional[str] = None, session: Optional[str] = None, tool: Optional[str] = None):
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+        keys = {"turn": turn, "session": session, "tool": tool or "agent", "model": model}
+        with self._lock:
+            for bucket in [self._grand] + [self._bucket(s, k) for s, k in keys.items() if k]:
+                bucket["calls"] += 1
+                bucket["prompt_tokens"] += prompt_tokens
+                bucket["completion_tokens"] += completion_tokens
+                bucket["cached_tokens"] += cached_tokens
+                bucket["total_tokens"] += prompt_tokens + completion_tokens
+                bucket["cost"] = round(bucket["cost"] + cost, 6)
+
+    def used(self, scope: str, key: Optional[str]) -> int:
+        if not key:
+            return 0
+        with self._lock:
+            bucket = self._totals[scope].get(key)
+            return bucket["total_tokens"] if bucket else 0
+
+    def admit(self, model: str, turn: Optional[str] = None, session: Optional[str] = None) -> str:
+        """
+        调用前的预算检查：返回实际应使用的模型名，硬预算触线时抛出 BudgetExceeded
+        """
+        downgrade = False
+        for scope, key in (("turn", turn), ("session", session)):
+            limits = self.budgets.get(scope) or {}
+            used = self.used(scope, key)
+            if limits.get("hard") and used >= limits["hard"]:
+                with self._lock:
+                    self.refusals += 1
+                raise BudgetExceeded(scope, key, used, limits["hard"])
+            if limits.get("soft") and used >= limits["soft"]:
+                downgrade = True
+        if downgrade and model in DOWNGRADE:
+            with self._lock:
+                self.downgrades += 1
+            return DOWNGRADE[model]
+        return model
+
+    def totals(self, by: str) -> Dict[str, Dict]:
+        if by not in SCOPES:
+            raise ValueError(f"不支持的聚合维度：{by}，可选 {SCOPES}")
+        with self._lock:
+            return {k: dict(v) for k, v in self._totals[by].items()}
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                "total": dict(self._grand),
+                "by_model": {k: dict(v) for k, v in self._totals["model"].items()},
+                "by_tool": {k: dict(v) for k, v in self._totals["tool"].items()},
+                "downgrades": self.downgrades,
+                "refusals": self.refusals,
+            }
+
+
+def _budgets_from_env() -> Dict:
+    budgets = {}
+    for scope in ("turn", "session"):
+        soft = int(os.getenv(f"AGENT_{scope.upper()}_SOFT_TOKENS", "0"))
+        hard = int(os.getenv(f"AGENT_{scope.upper()}_MAX_TOKENS", "0"))
+        if soft or hard:
+            budgets[scope] = {"soft": soft, "hard": hard}
+    return budgets
+
+
+ledger = UsageLedger(
+    prices=json.loads(os.getenv("AGENT_MODEL_PRICES", "{}")),
+    budgets=_budgets_from_env(),
+)